@@ -24,7 +24,7 @@ cdef extern from * nogil:
     ctypedef _SECURITY_ATTRIBUTES SECURITY_ATTRIBUTES
     ctypedef _SECURITY_ATTRIBUTES *LPSECURITY_ATTRIBUTES
     struct _OVERLAPPED:
-        pass
+        HANDLE hEvent
     ctypedef _OVERLAPPED OVERLAPPED
     ctypedef _OVERLAPPED *LPOVERLAPPED
     union _LARGE_INTEGER:
@@ -41,6 +41,14 @@ cdef extern from * nogil:
     DWORD FORMAT_MESSAGE_FROM_SYSTEM
     DWORD FORMAT_MESSAGE_IGNORE_INSERTS
     HANDLE INVALID_HANDLE_VALUE
+    DWORD FILE_FLAG_OVERLAPPED
+    DWORD ERROR_IO_PENDING
+    DWORD ERROR_OPERATION_ABORTED
+    DWORD WAIT_OBJECT_0
+    DWORD WAIT_FAILED
+    DWORD INFINITE
+    DWORD MAXIMUM_WAIT_OBJECTS
+    int THREAD_PRIORITY_TIME_CRITICAL
 
     HANDLE __stdcall CreateFileA(LPCSTR lpFileName, DWORD dwDesiredAccess,
          DWORD dwShareMode, LPSECURITY_ATTRIBUTES lpSecurityAttributes,
@@ -62,6 +70,25 @@ cdef extern from * nogil:
         DWORD dwMessageId, DWORD dwLanguageId, LPSTR lpBuffer, DWORD nSize,
         va_list *Arguments)
     HLOCAL __stdcall LocalFree(HLOCAL hMem)
+    HANDLE __stdcall CreateEventA(LPSECURITY_ATTRIBUTES lpEventAttributes,
+        BOOL bManualReset, BOOL bInitialState, LPCSTR lpName)
+    BOOL __stdcall SetEvent(HANDLE hEvent)
+    BOOL __stdcall ResetEvent(HANDLE hEvent)
+    DWORD __stdcall WaitForSingleObject(HANDLE hHandle, DWORD dwMilliseconds)
+    DWORD __stdcall WaitForMultipleObjects(DWORD nCount,
+        const HANDLE *lpHandles, BOOL bWaitAll, DWORD dwMilliseconds)
+    BOOL __stdcall GetOverlappedResult(HANDLE hFile,
+        LPOVERLAPPED lpOverlapped, LPDWORD lpNumberOfBytesTransferred,
+        BOOL bWait)
+    BOOL __stdcall CancelIo(HANDLE hFile)
+    void __stdcall Sleep(DWORD dwMilliseconds)
+    HANDLE __stdcall GetCurrentThread()
+    BOOL __stdcall SetThreadPriority(HANDLE hThread, int nPriority)
+    BOOL __stdcall QueryPerformanceCounter(LARGE_INTEGER *lpPerformanceCount)
+    BOOL __stdcall QueryPerformanceFrequency(LARGE_INTEGER *lpFrequency)
+    BOOL __stdcall PeekNamedPipe(HANDLE hNamedPipe, LPVOID lpBuffer,
+        DWORD nBufferSize, LPDWORD lpBytesRead, LPDWORD lpTotalBytesAvail,
+        LPDWORD lpBytesLeftThisMessage)
 
 DEF SERIAL_MAX_LENGTH_CONST = 24
 
@@ -0,0 +1,185 @@
+'''
+Bring-up
+=========
+
+Opens and activates many channels, possibly on many servers, at once.
+
+Creating server and channel instances doesn't communicate with the server,
+so a rig is described by simply creating the instances of all its channels.
+:func:`bring_up` then does all the server communication required to make
+them ready, concurrently where possible.
+
+A server's main pipe is single threaded, so every step that uses it,
+opening the server, creating the managers, and finding or creating the
+channels, is done one at a time for each server, while different servers are
+handled in parallel. Once a channel exists it has its own pipe, so the
+remaining steps, e.g. discovering and opening the FTDI peripheral devices and
+activating the channels, are all done in parallel.
+
+For example::
+
+    >>> from pybarst.core.server import BarstServer
+    >>> from pybarst.core.bringup import bring_up
+    >>> from pybarst.ftdi import FTDIChannel
+    >>> from pybarst.ftdi.switch import PinSettings
+    >>> from pybarst.serial import SerialChannel
+    >>> server = BarstServer(pipe_name=r'\\\\.\\pipe\\TestPipe')
+    >>> ftdi = FTDIChannel(channels=[PinSettings(bitmask=0xFF)], \
+server=server, desc='Birch Board rev1 A')
+    >>> serial = SerialChannel(server=server, port_name='COM3', \
+max_write=32, max_read=32)
+    >>> (pins, ), serial_chan = bring_up([ftdi, serial])[0]
+    >>> print pins, serial_chan
+    <pybarst.ftdi.switch.FTDIPinIn object at 0x05328EB0> \
+<pybarst.serial._serial.SerialChannel object at 0x05328F30>
+'''
+
+__all__ = ('bring_up', )
+
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+
+clock = time.clock if hasattr(time, 'clock') else time.perf_counter
+
+
+class _Report(object):
+    '''
+    Collects the timing of the steps of :func:`bring_up` from many threads.
+    '''
+
+    def __init__(self):
+        self.steps = []
+        self.lock = threading.Lock()
+        self.start = clock()
+
+    def run(self, step, name, f, *args, **kwargs):
+        ts = clock()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            te = clock()
+            with self.lock:
+                self.steps.append({'step': step, 'name': name,
+                                   'start': ts - self.start,
+                                   'duration': te - ts})
+
+
+def _manager_name(chan):
+    from pybarst.ftdi import FTDIChannel
+    from pybarst.rtv import RTVChannel
+    from pybarst.serial import SerialChannel
+    from pybarst.mcdaq import MCDAQChannel
+    for cls, name in ((FTDIChannel, 'ftdi'), (RTVChannel, 'rtv'),
+                      (SerialChannel, 'serial'), (MCDAQChannel, 'mcdaq')):
+        if isinstance(chan, cls):
+            return name
+    raise TypeError('Unrecognized channel type, {}'.format(chan))
+
+
+def bring_up(channels, alloc=True, activate=True, threads=None):
+    '''
+    Opens, and optionally activates, all the channels.
+
+    The servers of the channels are opened if needed, and the managers
+    required by the channels are created. Then, the channels are opened with
+    `open_channel`, and for FTDI channels, their peripheral devices are also
+    opened. Finally, the channels are activated with `set_state(True)`.
+
+    :Parameters:
+
+        `channels`: list
+            A list of channel instances, e.g.
+            :class:`~pybarst.ftdi.FTDIChannel` or
+            :class:`~pybarst.rtv.RTVChannel`, that have been created but
+            not opened yet.
+        `alloc`: bool
+            Whether the FTDI channels are created on the server if they don't
+            exist yet. See :meth:`~pybarst.ftdi.FTDIChannel.open_channel`.
+            Defaults to True.
+        `activate`: bool
+            Whether to activate the channels, or for FTDI channels, their
+            devices, once they are open. Defaults to True.
+        `threads`: int
+            The maximum number of threads used for the steps done in parallel.
+            If None, as many threads as there are parallel tasks are used.
+            Defaults to None.
+
+    :returns:
+        A 2-tuple of (`ready`, `report`). `ready` is a list with an element
+        for each channel in `channels`. For FTDI channels, it's the list of
+        the channel's opened devices, see
+        :attr:`~pybarst.ftdi.FTDIChannel.devices`. For the other channels
+        it's the channel itself.
+
+        `report` is a list of dicts, one for each step executed. Each dict has
+        the keys `step`, the name of the step, e.g. `'open_server'` or
+        `'set_state'`, `name`, a description of the server or channel of the
+        step, `start`, the time in seconds since :func:`bring_up` was called
+        when the step started, and `duration`, the duration of the step in
+        seconds. The last element is the `'total'` step.
+
+    Any exception raised by a step is re-raised once all the steps that
+    were running in parallel finished.
+    '''
+    from pybarst.ftdi import FTDIChannel, open_channels
+
+    channels = list(channels)
+    report = _Report()
+    servers = []
+    for chan in channels:
+        if not any(chan.server is s for s in servers):
+            servers.append(chan.server)
+    ready = [None] * len(channels)
+
+    def run_parallel(f, items):
+        if not items:
+            return []
+        pool = ThreadPool(min(threads or len(items), len(items)))
+        try:
+            return pool.map(f, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def server_steps(server):
+        # all the main pipe steps of this server, one at a time
+        name = str(server.pipe_name)
+        if not server.connected:
+            report.run('open_server', name, server.open_server)
+        idxs = [i for i, chan in enumerate(channels)
+                if chan.server is server]
+        for manager in sorted(set(_manager_name(channels[i]) for i in idxs)):
+            report.run('get_manager', '{} {}'.format(name, manager),
+                       server.get_manager, manager)
+
+        ftdi = [i for i in idxs if isinstance(channels[i], FTDIChannel)]
+        for i in idxs:
+            if i not in ftdi:
+                chan = channels[i]
+                report.run('open_channel', repr(chan), chan.open_channel)
+                ready[i] = chan
+        if ftdi:
+            devs = report.run(
+                'open_channel', '{} ftdi'.format(name), open_channels,
+                [channels[i] for i in ftdi], alloc=alloc, threads=threads)
+            for i, dev_list in zip(ftdi, devs):
+                ready[i] = dev_list
+
+    run_parallel(server_steps, servers)
+
+    # everything else uses the channel pipes
+    devices = [dev for chan, item in zip(channels, ready)
+               if isinstance(chan, FTDIChannel) for dev in item]
+    run_parallel(lambda dev: report.run('open_channel', repr(dev),
+                                        dev.open_channel), devices)
+
+    if activate:
+        targets = devices + [item for chan, item in zip(channels, ready)
+                             if not isinstance(chan, FTDIChannel)]
+        run_parallel(lambda item: report.run('set_state', repr(item),
+                                             item.set_state, True), targets)
+
+    report.steps.append({'step': 'total', 'name': '', 'start': 0.,
+                         'duration': clock() - report.start})
+    return ready, report.steps
@@ -0,0 +1,41 @@
+
+include '../barst_defines.pxi'
+
+
+cdef class EdgeDetector(object):
+    cdef unsigned char *level
+    '''
+    The accepted state of each line.
+    '''
+    cdef unsigned char *candidate
+    '''
+    The state each line changed to, which is accepted once it lasted
+    :attr:`debounce` seconds.
+    '''
+    cdef double *candidate_time
+    cdef double *debounce_times
+    cdef int has_state
+
+    cdef public DWORD num_lines
+    '''
+    The number of lines tracked. Read only.
+    '''
+    cdef public unsigned long long samples
+    '''
+    The number of samples processed.
+    '''
+    cdef public unsigned long long suppressed
+    '''
+    The number of samples processed that resulted in no events.
+    '''
+    cdef public unsigned long long events
+    '''
+    The number of events emitted.
+    '''
+
+    cdef int feed_states(EdgeDetector self, double t,
+                         const unsigned char *states, list out) except -1
+    cdef int feed_bits(EdgeDetector self, double t, unsigned long long bits,
+                       list out) except -1
+    cdef inline int _update(EdgeDetector self, DWORD line, double t,
+                            unsigned char state, list out) except -1
@@ -0,0 +1,234 @@
+'''
+Edge detection
+===============
+
+Extracts the transitions of digital input lines, e.g. of a
+:class:`~pybarst.mcdaq.MCDAQChannel`, :class:`~pybarst.ftdi.switch.FTDIPinIn`,
+or :class:`~pybarst.ftdi.switch.FTDISerializerIn`, from their samples.
+
+Most samples of a digital input are identical to the previous sample. An
+:class:`EdgeDetector` keeps the state of each line and only emits an event
+when a line changes, so the samples that did not change any line never
+create any python objects. The `read_events` method of the input channels
+reads samples until at least one event occurred.
+
+For example::
+
+    >>> from pybarst.core.edges import EdgeDetector
+    >>> detector = EdgeDetector(16, debounce=0.005)
+    >>> print daq.read_events(detector)
+    [(4.2535237, 3, 1)]
+    >>> print daq.read_events(detector)
+    [(5.6121876, 3, 0), (5.6121876, 4, 1)]
+    >>> print detector.samples, detector.suppressed, detector.events
+    1489 1486 3
+'''
+
+__all__ = ('EdgeDetector', )
+
+cdef extern from "stdlib.h" nogil:
+    void *malloc(size_t)
+    void free(void *)
+
+from pybarst.core.exception import BarstException
+
+
+cdef class EdgeDetector(object):
+    '''
+    Keeps the states of digital lines, and emits an event for each line that
+    changed state.
+
+    Events are 3-tuples of (`time`, `line`, `state`), where `time` is the
+    server time of the first sample in which `line` had its new `state`, 1
+    for high and 0 for low. The first sample processed after creation or
+    :meth:`reset` only sets the initial states and doesn't emit any events.
+
+    :Parameters:
+
+        `num_lines`: int
+            The number of lines tracked. At most 64 lines can be tracked when
+            the states are given as an int.
+        `debounce`: float, or list of floats
+            The time, in seconds, that a line must stay in its new state before
+            the change is accepted and its event is emitted, either for all
+            the lines, or a list with a value for each line. Changes that
+            revert sooner are ignored. If zero, every change is emitted
+            immediately. Defaults to 0.
+
+    For example::
+
+        >>> detector = EdgeDetector(4, debounce=0.01)
+        >>> detector.process(1., 0b0011)
+        []
+        >>> detector.process(1.001, 0b0111)
+        []
+        >>> detector.process(1.002, 0b0011)
+        []
+        >>> detector.process(1.005, 0b0010)
+        []
+        >>> detector.process(1.02, 0b0010)
+        [(1.005, 0, 0)]
+        >>> print detector.suppressed
+        4
+    '''
+
+    def __cinit__(EdgeDetector self, DWORD num_lines, debounce=0., **kwargs):
+        self.level = self.candidate = NULL
+        self.candidate_time = self.debounce_times = NULL
+        if not num_lines:
+            raise BarstException(msg='The number of lines cannot be zero')
+        self.num_lines = num_lines
+        self.level = <unsigned char *>malloc(num_lines * sizeof(char))
+        self.candidate = <unsigned char *>malloc(num_lines * sizeof(char))
+        self.candidate_time = <double *>malloc(num_lines * sizeof(double))
+        self.debounce_times = <double *>malloc(num_lines * sizeof(double))
+        if (self.level == NULL or self.candidate == NULL or
+                self.candidate_time == NULL or self.debounce_times == NULL):
+            raise BarstException(NO_SYS_RESOURCE)
+        self.debounce = debounce
+        self.reset()
+
+    def __init__(EdgeDetector self, DWORD num_lines, debounce=0., **kwargs):
+        pass
+
+    def __dealloc__(EdgeDetector self):
+        free(self.level)
+        free(self.candidate)
+        free(self.candidate_time)
+        free(self.debounce_times)
+
+    property debounce:
+        '''
+        The list of the debounce time, in seconds, of each line. It can be
+        set to a single value for all the lines, or a list of values.
+        '''
+        def __get__(EdgeDetector self):
+            cdef DWORD i
+            return [self.debounce_times[i] for i in range(self.num_lines)]
+
+        def __set__(EdgeDetector self, value):
+            cdef DWORD i
+            if isinstance(value, (int, float)):
+                value = [value] * self.num_lines
+            if len(value) != self.num_lines:
+                raise BarstException(msg='Expected {} debounce times, got {}'.
+                                     format(self.num_lines, len(value)))
+            for i in range(self.num_lines):
+                if value[i] < 0:
+                    raise BarstException(msg='Invalid debounce time {}'.
+                                         format(value[i]))
+                self.debounce_times[i] = value[i]
+
+    property state:
+        '''
+        The list of the current state of each line, or None if no sample was
+        processed yet.
+        '''
+        def __get__(EdgeDetector self):
+            cdef DWORD i
+            if not self.has_state:
+                return None
+            return [self.level[i] for i in range(self.num_lines)]
+
+    def reset(EdgeDetector self):
+        '''
+        Forgets the states of the lines, so the next sample sets them. The
+        counters are not reset.
+        '''
+        self.has_state = 0
+
+    def process(EdgeDetector self, double t, states):
+        '''
+        Processes a sample and returns the list of its events.
+
+        :Parameters:
+
+            `t`: float
+                The server time of the sample.
+            `states`: int, or sequence
+                The states of the lines, either as an int, where bit `i` is
+                the state of line `i`, or as a sequence of :attr:`num_lines`
+                elements, e.g. the list returned by
+                :meth:`~pybarst.ftdi.switch.FTDISerializerIn.read`.
+
+        :returns:
+            A list of the events, possibly empty.
+        '''
+        cdef list out = []
+        cdef bytes packed
+        cdef DWORD i
+        if isinstance(states, (int, long)):
+            if self.num_lines > 64:
+                raise BarstException(msg='Cannot use an int for more than '
+                                     '64 lines')
+            self.feed_bits(t, states, out)
+            return out
+
+        if len(states) != self.num_lines:
+            raise BarstException(msg='Expected {} states, got {}'.format(
+                self.num_lines, len(states)))
+        packed = bytes(bytearray([1 if states[i] else 0
+                                  for i in range(self.num_lines)]))
+        self.feed_states(t, <const unsigned char *><char *>packed, out)
+        return out
+
+    cdef int feed_states(EdgeDetector self, double t,
+                         const unsigned char *states, list out) except -1:
+        '''
+        Processes a sample whose states are given one byte per line, and
+        appends its events to `out`.
+        '''
+        cdef DWORD i
+        cdef unsigned long long n = self.events
+        self.samples += 1
+        if not self.has_state:
+            for i in range(self.num_lines):
+                self.level[i] = self.candidate[i] = states[i] != 0
+            self.has_state = 1
+            self.suppressed += 1
+            return 0
+
+        for i in range(self.num_lines):
+            self._update(i, t, states[i] != 0, out)
+        if n == self.events:
+            self.suppressed += 1
+        return 0
+
+    cdef int feed_bits(EdgeDetector self, double t, unsigned long long bits,
+                       list out) except -1:
+        '''
+        Processes a sample whose state of line `i` is bit `i` of `bits`, and
+        appends its events to `out`.
+        '''
+        cdef DWORD i
+        cdef unsigned long long n = self.events
+        self.samples += 1
+        if not self.has_state:
+            for i in range(self.num_lines):
+                self.level[i] = self.candidate[i] = (bits >> i) & 1
+            self.has_state = 1
+            self.suppressed += 1
+            return 0
+
+        for i in range(self.num_lines):
+            self._update(i, t, (bits >> i) & 1, out)
+        if n == self.events:
+            self.suppressed += 1
+        return 0
+
+    cdef inline int _update(EdgeDetector self, DWORD line, double t,
+                            unsigned char state, list out) except -1:
+        if state == self.level[line]:
+            self.candidate[line] = state
+            return 0
+
+        if state != self.candidate[line]:
+            self.candidate[line] = state
+            self.candidate_time[line] = t
+        if t - self.candidate_time[line] < self.debounce_times[line]:
+            return 0
+
+        self.level[line] = state
+        self.events += 1
+        out.append((self.candidate_time[line], line, state))
+        return 0
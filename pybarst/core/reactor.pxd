@@ -0,0 +1,69 @@
+
+include "../barst_defines.pxi"
+include "../inline_funcs.pxi"
+
+from pybarst.core.server cimport BarstChannel
+
+
+cdef class ReactorKey(object):
+    cdef public BarstChannel channel
+    '''
+    The channel read by the reactor. Read only.
+    '''
+    cdef public object callback
+    '''
+    The callback called with each read, or None. Read only.
+    '''
+    cdef public object queue
+    '''
+    If :attr:`callback` is None, a `Queue` into which the result of each
+    read is put, otherwise None. Read only.
+    '''
+    cdef public unsigned long long reads
+    '''
+    The number of reads dispatched. Read only.
+    '''
+    cdef public object error
+    '''
+    The exception that stopped the reads of this channel, or None. Read only.
+    '''
+
+
+cdef class Reactor(object):
+    cdef HANDLE *pipes
+    cdef unsigned char *ready
+    cdef DWORD size
+    '''
+    The number of elements allocated in :attr:`pipes` and :attr:`ready`.
+    '''
+    cdef list active
+    cdef list new_keys
+    cdef list removed_keys
+    cdef object lock
+    cdef object thread
+    cdef int running
+    cdef int changed
+    '''
+    Whether keys were registered or unregistered since the last poll.
+    '''
+    cdef int wake
+
+    cdef public list keys
+    '''
+    The list of :class:`ReactorKey` instances of the reactor. Read only.
+    '''
+    cdef public DWORD poll_interval
+    '''
+    The time, in ms, slept between checks of the pipes when none has data.
+    '''
+    cdef public DWORD max_reads
+    '''
+    The maximum number of reads of a channel in a single :meth:`poll`.
+    '''
+    cdef public object error
+    '''
+    The exception that ended the reactor's thread, or None. Read only.
+    '''
+
+    cdef int _apply(Reactor self) except -1
+    cdef int _dispatch(Reactor self, list active) except -1
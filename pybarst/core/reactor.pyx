@@ -0,0 +1,364 @@
+'''
+Reactor
+========
+
+Reads many streaming channels from a single thread.
+
+The `read` method of a channel blocks the calling thread until the server
+sends data, so reading many continuous channels with it requires a thread per
+channel. A :class:`Reactor` instead checks the pipes of all its channels,
+without the GIL, for data the server already sent, similar to `selectors`.
+The channels with data are then read with their own `read` method, which
+returns immediately, and each result is dispatched to the channel's callback
+or queue.
+
+The channels that can be read by a reactor are those whose server keeps
+sending data once started; an activated :class:`~pybarst.rtv.RTVChannel`
+or :class:`~pybarst.ftdi.adc.FTDIADC`, or a continuous
+:class:`~pybarst.mcdaq.MCDAQChannel`,
+:class:`~pybarst.ftdi.switch.FTDIPinIn` or
+:class:`~pybarst.ftdi.switch.FTDISerializerIn`. The reactor starts the stream
+of each channel when it's registered.
+
+Named pipes cannot be waited on, so when no channel has data the reactor
+sleeps :attr:`Reactor.poll_interval` ms between checks. The actual sleep is
+rounded up to the system's timer resolution.
+
+For example::
+
+    >>> from pybarst.core.reactor import Reactor
+    >>> reactor = Reactor()
+    >>> def on_data(key, data):
+    ...     print key.channel, data
+    >>> adc.set_state(True)
+    >>> reactor.register(adc, on_data)
+    >>> reactor.register(daq, on_data)
+    >>> reactor.start()
+    <pybarst.mcdaq._mcdaq.MCDAQChannel object at 0x05328EB0> \
+(0.5413725, 15)
+    <pybarst.ftdi.adc.FTDIADC object at 0x05328F30> \
+<pybarst.ftdi.adc.ADCData object at 0x0532AD30>
+    >>> reactor.stop()
+'''
+
+__all__ = ('Reactor', 'ReactorKey')
+
+cdef extern from "stdlib.h" nogil:
+    void *malloc(size_t)
+    void free(void *)
+
+import threading
+from pybarst.core.exception import BarstException
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+cdef inline int _find_ready(HANDLE *pipes, DWORD count,
+                            unsigned char *ready) nogil:
+    '''
+    Sets the element of `ready` of each pipe that has data, or whose check
+    failed, so that its read raises the error, and returns their number.
+    '''
+    cdef DWORD i, avail
+    cdef int n = 0
+    for i in range(count):
+        avail = 0
+        ready[i] = (not PeekNamedPipe(pipes[i], NULL, 0, NULL, &avail,
+                                      NULL)) or avail != 0
+        n += ready[i]
+    return n
+
+
+cdef class ReactorKey(object):
+    '''
+    A channel read by a :class:`Reactor`.
+
+    This class is not instantiated by the user, it's returned by
+    :meth:`Reactor.register`.
+    '''
+
+    def __cinit__(ReactorKey self, **kwargs):
+        self.channel = None
+        self.callback = None
+        self.queue = None
+        self.reads = 0
+        self.error = None
+
+
+cdef class Reactor(object):
+    '''
+    Reads many streaming channels from the thread calling :meth:`poll`, or
+    from its own thread, see :meth:`start`.
+
+    Channels are added with :meth:`register`, before or after :meth:`start`
+    is called. If reading a channel fails, or its callback raises an
+    exception, the channel stops being read and the exception is stored in its
+    :attr:`ReactorKey.error`, while the other channels keep being read.
+
+    For large rigs, the channels can be split between a few reactors, each
+    with its own thread.
+
+    :Parameters:
+
+        `poll_interval`: unsigned int
+            The time, in ms, slept between checks of the pipes when none
+            has data. If zero, the thread only yields, which lowers the
+            latency at the cost of a CPU core. Defaults to 1.
+        `max_reads`: unsigned int
+            The maximum number of reads of a channel in a single
+            :meth:`poll`, so that a busy channel doesn't starve the others.
+            Defaults to 16.
+    '''
+
+    def __cinit__(Reactor self, DWORD poll_interval=1, DWORD max_reads=16,
+                  **kwargs):
+        self.pipes = NULL
+        self.ready = NULL
+        self.size = 0
+        self.active = []
+        self.new_keys = []
+        self.removed_keys = []
+        self.keys = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = 0
+        self.changed = 0
+        self.wake = 0
+        self.poll_interval = poll_interval
+        self.max_reads = max_reads if max_reads else 1
+        self.error = None
+
+    def __init__(Reactor self, DWORD poll_interval=1, DWORD max_reads=16,
+                 **kwargs):
+        pass
+
+    def __dealloc__(Reactor self):
+        free(self.pipes)
+        free(self.ready)
+
+    def register(Reactor self, BarstChannel channel, callback=None):
+        '''
+        Adds a channel to be read by the reactor. Its stream is started by
+        the next :meth:`poll`.
+
+        :Parameters:
+
+            `channel`: channel instance
+                The opened, and if required activated, channel to read.
+            `callback`: callable
+                If not None, it's called from the polling thread with each
+                read as `callback(key, data)`, where `key` is the
+                :class:`ReactorKey`, and `data` is the result of the channel's
+                `read` method. It should return quickly because the other
+                channels are not read while it runs. If None, the reads are
+                put into the key's :attr:`ReactorKey.queue` instead. Defaults
+                to None.
+
+        :returns:
+            The :class:`ReactorKey` of the channel.
+        '''
+        cdef ReactorKey key
+        if not channel.connected:
+            raise BarstException(msg='The channel must be opened before it '
+                                 'can be registered')
+
+        key = ReactorKey()
+        key.channel = channel
+        key.callback = callback
+        if callback is None:
+            key.queue = Queue()
+        with self.lock:
+            for other in self.keys:
+                if (<ReactorKey>other).channel is channel:
+                    raise BarstException(msg='The channel is already '
+                                         'registered')
+            self.keys.append(key)
+            self.new_keys.append(key)
+            self.changed = 1
+        return key
+
+    def unregister(Reactor self, ReactorKey key):
+        '''
+        Stops reading a channel previously registered with :meth:`register`.
+        The channel's stream is not stopped, see e.g.
+        :meth:`~pybarst.core.server.BarstChannel.set_state` or
+        :meth:`~pybarst.core.server.BarstChannel.cancel_read`.
+        '''
+        with self.lock:
+            self.keys.remove(key)
+            if key in self.new_keys:
+                self.new_keys.remove(key)
+            else:
+                self.removed_keys.append(key)
+                self.changed = 1
+
+    def wakeup(Reactor self):
+        '''
+        Makes the current, or next, :meth:`poll` return without waiting.
+        '''
+        self.wake = 1
+
+    def poll(Reactor self, timeout=None):
+        '''
+        Waits until at least one channel has data, then reads and dispatches
+        the data of all the channels that have data.
+
+        :Parameters:
+
+            `timeout`: float
+                The maximum time, in seconds, to wait for data. If None, it
+                waits until there's data or :meth:`wakeup` is called.
+                Defaults to None.
+
+        :returns:
+            The number of reads dispatched.
+        '''
+        cdef int64_t freq = 0, start = 0, now = 0, limit = -1
+        cdef DWORD count, i
+        cdef int found = 0
+        cdef list active
+
+        if timeout is not None:
+            QueryPerformanceFrequency(<LARGE_INTEGER *>&freq)
+            QueryPerformanceCounter(<LARGE_INTEGER *>&start)
+            limit = <int64_t>(timeout * freq)
+
+        while True:
+            if self.changed:
+                self._apply()
+            active = list(self.active)
+            count = len(active)
+            # a channel's pipe changes when it's e.g. flushed
+            for i in range(count):
+                self.pipes[i] = (<ReactorKey>active[i]).channel._stream_pipe()
+
+            with nogil:
+                while True:
+                    found = _find_ready(self.pipes, count, self.ready)
+                    if found or self.changed or self.wake:
+                        break
+                    if limit >= 0:
+                        QueryPerformanceCounter(<LARGE_INTEGER *>&now)
+                        if now - start >= limit:
+                            break
+                    Sleep(self.poll_interval)
+
+            if found:
+                return self._dispatch(active)
+            if self.wake:
+                self.wake = 0
+                return 0
+            if limit >= 0 and now - start >= limit:
+                return 0
+
+    cdef int _apply(Reactor self) except -1:
+        '''
+        Starts the streams of the newly registered channels, and drops the
+        unregistered channels.
+        '''
+        cdef list added, removed
+        cdef ReactorKey key
+        cdef DWORD size
+
+        with self.lock:
+            added = self.new_keys
+            removed = self.removed_keys
+            self.new_keys = []
+            self.removed_keys = []
+            self.changed = 0
+
+        for key in removed:
+            if key in self.active:
+                self.active.remove(key)
+        for key in added:
+            try:
+                key.channel._start_stream()
+            except Exception as e:
+                key.error = e
+            else:
+                self.active.append(key)
+
+        size = len(self.active)
+        if size > self.size:
+            free(self.pipes)
+            free(self.ready)
+            self.size = 0
+            self.pipes = <HANDLE *>malloc(size * sizeof(HANDLE))
+            self.ready = <unsigned char *>malloc(size * sizeof(char))
+            if self.pipes == NULL or self.ready == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.size = size
+        return 0
+
+    cdef int _dispatch(Reactor self, list active) except -1:
+        cdef ReactorKey key
+        cdef DWORD i, n, avail
+        cdef HANDLE pipe
+        cdef int total = 0
+
+        for i in range(len(active)):
+            if not self.ready[i]:
+                continue
+            key = active[i]
+            if key not in self.keys:
+                continue
+
+            n = 0
+            try:
+                while True:
+                    data = key.channel.read()
+                    key.reads += 1
+                    total += 1
+                    n += 1
+                    if key.callback is not None:
+                        key.callback(key, data)
+                    else:
+                        key.queue.put(data)
+                    if n >= self.max_reads:
+                        break
+                    avail = 0
+                    pipe = key.channel._stream_pipe()
+                    if (PeekNamedPipe(pipe, NULL, 0, NULL, &avail, NULL) and
+                            not avail):
+                        break
+            except Exception as e:
+                key.error = e
+                self.active.remove(key)
+        return total
+
+    def start(Reactor self):
+        '''
+        Starts a thread that calls :meth:`poll` until :meth:`stop` is called.
+        '''
+        if self.thread is not None:
+            raise BarstException(msg='The reactor is already running')
+        self.error = None
+        self.running = 1
+        self.thread = threading.Thread(target=self._run, name='Reactor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(Reactor self):
+        '''
+        Stops the thread started with :meth:`start` and waits for it to exit.
+        The reactor can be started again afterwards.
+        '''
+        if self.thread is None:
+            return
+        self.running = 0
+        self.wake = 1
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _run(Reactor self):
+        try:
+            while self.running:
+                self.poll()
+        except Exception as e:
+            self.error = e
+        self.wake = 0
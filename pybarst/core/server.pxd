@@ -20,9 +20,12 @@ cdef class BarstPipe(object):
         Unicode pipe names are not currently supported.
     '''
 
-    cdef inline HANDLE open_pipe(BarstPipe self, str access) except NULL
+    cdef inline HANDLE open_pipe(BarstPipe self, str access,
+                              DWORD flags=*) except NULL
     cdef inline int write_read(BarstPipe self, HANDLE pipe, DWORD write_size,
                                    void *msg, DWORD *read_size, void *read_msg)
+    cdef inline int read_message(BarstPipe self, HANDLE pipe,
+                                 DWORD *read_size, void *read_msg)
     cdef inline void close_handle(BarstPipe self, HANDLE pipe)
 
 
@@ -116,17 +119,66 @@ cdef class BarstServer(BarstPipe):
     Read only.
     '''
 
+    cdef public double ftdi_inventory_ttl
+    '''
+    The duration, in seconds, for which the FTDI device inventory returned by
+    :meth:`get_ftdi_inventory` is cached before the devices are enumerated
+    again. Defaults to 5 seconds.
+    '''
+    cdef dict ftdi_inventory
+    cdef double ftdi_inventory_time
+
     cpdef object open_server(BarstServer self)
     cpdef object close_server(BarstServer self)
     cpdef DWORD get_version(BarstServer self) except *
     cpdef object get_manager(BarstServer self, str manager)
     cpdef object close_manager(BarstServer self, str manager)
     cpdef object clock(BarstServer self)
+    cpdef object get_ftdi_inventory(BarstServer self, refresh=*)
+    cpdef object find_ftdi_device(BarstServer self, object serial=*,
+                                  object desc=*, object loc=*, refresh=*)
+    cpdef object invalidate_ftdi_inventory(BarstServer self)
 
     cdef DWORD _get_man_version(BarstServer self, int chan) except *
     cdef object _get_man_ID(BarstServer self, int chan)
 
 
+cdef class PreparedWrite(object):
+    cdef SBaseIn *msg
+    '''
+    The fully encoded message that is written to the channel's pipe.
+    '''
+    cdef DWORD size
+    cdef public object channel
+    '''
+    The :class:`BarstChannel` instance for which the message was prepared.
+    The message can only be sent with this channel. Read only.
+    '''
+    cdef public int chan
+    '''
+    The channel number of :attr:`channel` on the server when the message was
+    prepared. Read only.
+    '''
+
+    cdef void *alloc(PreparedWrite self, DWORD size) except NULL
+
+
+cdef class PendingWrite(object):
+    cdef public object channel
+    '''
+    The :class:`BarstChannel` instance to which the message was sent.
+    Read only.
+    '''
+    cdef public int done
+    '''
+    Whether the response to the write has been read. Read only.
+    '''
+    cdef object value
+    cdef object error
+
+    cpdef object result(PendingWrite self)
+
+
 cdef class BarstChannel(BarstPipe):
     cdef public int chan
     '''
@@ -161,14 +213,44 @@ cdef class BarstChannel(BarstPipe):
     This pipe holds the currently open pipe used by this channel for comm with
     the server.
     '''
+    cdef public int max_pending
+    '''
+    The maximum number of writes sent with :meth:`send_async` whose response
+    has not been read yet. When exceeded, :meth:`send_async` first reads the
+    response of the oldest pending write. Defaults to 16.
+    '''
+    cdef object pending
+    '''
+    A deque of the :class:`PendingWrite` instances, in the order they were
+    sent, whose response was not read yet.
+    '''
+    cdef void *response_buff
+    cdef DWORD response_size
+    '''
+    The size of `response_buff`, which must be large enough for the
+    response to the prepared messages of this channel.
+    '''
 
     cpdef object open_channel(BarstChannel self)
     cpdef object close_channel_server(BarstChannel self)
     cpdef object close_channel_client(BarstChannel self)
     cpdef object set_state(BarstChannel self, int state, object flush=*)
     cpdef object cancel_read(BarstChannel self, flush=*)
+    cpdef object send(BarstChannel self, PreparedWrite prepared)
+    cpdef object send_async(BarstChannel self, PreparedWrite prepared)
+    cpdef object flush_pending(BarstChannel self)
+
+    cdef int _check_prepared(BarstChannel self,
+                             PreparedWrite prepared) except -1
+    cdef int _complete_pending(BarstChannel self) except -1
+    cdef int _drain_pending(BarstChannel self) except -1
+    cdef object _discard_pending(BarstChannel self, object error)
+    cdef object _parse_write_response(BarstChannel self, int res,
+                                      DWORD read_size)
 
     cdef object _cancel_read(BarstChannel self, HANDLE *pipe, flush=*,
                              int parent_pipe=*)
     cdef object _set_state(BarstChannel self, int state, HANDLE pipe=*,
                            int chan=*, object flush=*)
+    cdef HANDLE _stream_pipe(BarstChannel self)
+    cdef int _start_stream(BarstChannel self) except -1
@@ -14,13 +14,15 @@ Typical usage
 you open and close with open_channel, close client/server.
 '''
 
-__all__ = ('BarstPipe', 'BarstServer', 'BarstChannel')
+__all__ = ('BarstPipe', 'BarstServer', 'BarstChannel', 'PreparedWrite',
+           'PendingWrite')
 
 import os
 import subprocess
 import time
 import sys
 import itertools
+from collections import deque
 
 from pybarst.core.exception import BarstException
 from pybarst.core import default_server_timeout
@@ -30,6 +32,9 @@ cdef extern from "stdlib.h":
     void* malloc(size_t)
     void free(void *)
 
+cdef extern from "string.h":
+    void *memset(void *, int, size_t)
+
 PY3 = sys.version_info > (3, )
 cdef DWORD default_timeout = default_server_timeout
 cdef DWORD min_barst_version = __min_barst_version__
@@ -69,7 +74,8 @@ cdef class BarstPipe(object):
         else:
             self.timeout = timeout
 
-    cdef inline HANDLE open_pipe(BarstPipe self, str access) except NULL:
+    cdef inline HANDLE open_pipe(BarstPipe self, str access,
+                                 DWORD flags=0) except NULL:
         '''
         Create and initializes a handle to the pipe.
 
@@ -77,6 +83,9 @@ cdef class BarstPipe(object):
 
             `access`: str
                 The access level. Can be `r`, `w`, `rw`, or `wr`.
+            `flags`: DWORD
+                Additional file flags, e.g. `FILE_FLAG_OVERLAPPED` to open
+                the pipe for overlapped I/O. Defaults to 0.
         '''
         cdef int res = 0
         cdef DWORD mode = PIPE_READMODE_MESSAGE | PIPE_WAIT
@@ -96,7 +105,7 @@ cdef class BarstPipe(object):
             raise BarstException(BAD_INPUT_PARAMS, 'Got unknown permission')
 
         with nogil:
-            pipe = CreateFileA(name, dw_access, 0, NULL, OPEN_EXISTING, 0,
+            pipe = CreateFileA(name, dw_access, 0, NULL, OPEN_EXISTING, flags,
                                NULL)
             if (pipe == INVALID_HANDLE_VALUE and
                 GetLastError() == ERROR_PIPE_BUSY and self.timeout):
@@ -104,7 +113,7 @@ cdef class BarstPipe(object):
                     res = WIN_ERROR(GetLastError())
                 else:    # try again
                     pipe = CreateFileA(name, dw_access, 0, NULL, OPEN_EXISTING,
-                                       0, NULL)
+                                       flags, NULL)
                     if pipe == INVALID_HANDLE_VALUE:
                         res = WIN_ERROR(GetLastError())
             elif pipe == INVALID_HANDLE_VALUE:
@@ -135,6 +144,19 @@ cdef class BarstPipe(object):
                 return WIN_ERROR(GetLastError())
         return 0
 
+    cdef inline int read_message(BarstPipe self, HANDLE pipe,
+                                 DWORD *read_size, void *read_msg):
+        '''
+        Reads a single message from a pipe handle previously opened with
+        :meth:`open_pipe`, without first writing to it. Used to read the
+        responses of messages written previously with :meth:`write_read`
+        when it skipped reading.
+        '''
+        with nogil:
+            if not ReadFile(pipe, read_msg, read_size[0], read_size, NULL):
+                return WIN_ERROR(GetLastError())
+        return 0
+
     cdef inline void close_handle(BarstPipe self, HANDLE pipe):
         '''
         Closes a pipe handle previously opened with :meth:`open_pipe`.
@@ -224,6 +246,9 @@ cdef class BarstServer(BarstPipe):
         self.managers = {}
         self.connected = 0
         self.max_server_size = max_server_size
+        self.ftdi_inventory_ttl = 5.
+        self.ftdi_inventory = None
+        self.ftdi_inventory_time = 0.
 
     cpdef object open_server(BarstServer self):
         '''
@@ -480,6 +505,8 @@ cdef class BarstServer(BarstPipe):
         free(pbase)
         self.close_handle(pipe)
         del self.managers[manager]
+        if manager == 'ftdi':
+            self.invalidate_ftdi_inventory()
         if res:
             raise BarstException(res)
 
@@ -662,6 +689,275 @@ pipe_name=r'\\\\.\\pipe\\TestPipe')
             raise BarstException(res)
         return ret
 
+    cpdef object get_ftdi_inventory(BarstServer self, refresh=False):
+        '''
+        Returns the inventory of the FTDI devices connected to the server's
+        computer. The FTDI manager is created if it doesn't exist yet.
+
+        Enumerating the devices is slow, so the inventory is cached for
+        :attr:`ftdi_inventory_ttl` seconds, or until
+        :meth:`invalidate_ftdi_inventory` is called. The inventory is used by
+        :meth:`~pybarst.ftdi.FTDIChannel.open_channel` to find its device, so
+        opening many channels only enumerates the devices once.
+
+        :Parameters:
+
+            `refresh`: bool
+                If True, the devices are enumerated again even if the cached
+                inventory has not expired. Defaults to False.
+
+        :returns:
+            A dict with the following keys:
+
+                `devices`: list
+                    A list with a dict for each device, in the order they were
+                    enumerated. The dict contains the device info, e.g.
+                    `dev_serial`, `dev_description`, `dev_loc` etc.
+                    (see :class:`~pybarst.ftdi.FTDIChannel`), as well as
+                    `index`, the position of the device in the list, `chan`,
+                    the channel number of the device in the FTDI manager, or
+                    -1 if no channel is open for the device, and `active`,
+                    whether a channel is open for the device.
+                `serial`: dict
+                    Maps the serial numbers (bytes) to the device dicts.
+                `description`: dict
+                    Maps the descriptions (bytes) to the device dicts. If
+                    many devices share a description, it maps to the first
+                    of them.
+                `location`: dict
+                    Maps the location IDs to the device dicts.
+
+        For example::
+
+            >>> inventory = server.get_ftdi_inventory()
+            >>> print inventory['description']['Birch Board rev1 A']
+            {'dev_loc': 8482, 'dev_id': 67330064, 'is_full_speed': False, \
+'is_open': 0, 'dev_type': 6, 'dev_serial': 'FTWUIYQWA', 'index': 0, \
+'dev_description': 'Birch Board rev1 A', 'is_high_speed': 2, 'chan': -1, \
+'active': False}
+
+        .. note::
+            The `index` of devices whose channel is not open is only valid
+            until another client enumerates the devices. If opening a channel
+            with a stale index fails, the inventory is invalidated and the
+            channel tries again once.
+        '''
+        cdef int man_chan, res, chan
+        cdef HANDLE pipe
+        cdef DWORD read_size
+        cdef SBaseIn base[2]
+        cdef void *phead_in
+        cdef SBaseOut *pbase_out
+        cdef FT_DEVICE_LIST_INFO_NODE_OS *ft_dev_info = NULL
+        cdef list devices = []
+        cdef dict dev, by_serial = {}, by_desc = {}, by_loc = {}
+
+        if (not refresh and self.ftdi_inventory is not None and
+            time.time() - self.ftdi_inventory_time < self.ftdi_inventory_ttl):
+            return self.ftdi_inventory
+
+        man_chan = self.get_manager('ftdi')['chan']
+        # max 25 ftdi devices
+        read_size = 25 * (sizeof(SBaseOut) + 2 * sizeof(SBase) +
+                       sizeof(FT_DEVICE_LIST_INFO_NODE_OS) +
+                       sizeof(SChanInitFTDI))
+        phead_in = malloc(max(read_size, MIN_BUFF_OUT))
+        if phead_in == NULL:
+            raise BarstException(NO_SYS_RESOURCE)
+        pipe = self.open_pipe('rw')
+
+        base[0].dwSize = 2 * sizeof(SBaseIn)
+        base[0].eType = ePassOn    # pass on to ftdi manager
+        base[0].nChan = man_chan
+        base[0].nError = 0
+        base[1].dwSize = sizeof(SBaseIn)
+        base[1].eType = eQuery
+        base[1].nChan = -1    # request info on all the USB connected devices
+        base[1].nError = 0
+        res = self.write_read(pipe, 2 * sizeof(SBaseIn), base, &read_size,
+                              phead_in)
+        self.close_handle(pipe)
+        if not res:
+            if (read_size == sizeof(SBaseIn) and
+                (<SBaseIn *>phead_in).dwSize == sizeof(SBaseIn) and
+                (<SBaseIn *>phead_in).nError):
+                res = (<SBaseIn *>phead_in).nError
+            elif (read_size < sizeof(SBaseIn) + sizeof(SBaseOut) +
+                  sizeof(SBase) + sizeof(FT_DEVICE_LIST_INFO_NODE_OS)):
+                read_size = 0    # no devices connected
+
+        '''we get a list of devices, each having a SBaseOut struct followed
+        by SBase followed by FT_DEVICE_LIST_INFO_NODE (and followed by SBase
+        and SChanInitFTDI if the channel is open in the manager). Opened
+        channels have nChan != -1.'''
+        pbase_out = <SBaseOut *>(<char *>phead_in + sizeof(SBaseIn))
+        while not res and <char *>pbase_out < <char *>phead_in + read_size:
+            if (pbase_out.sBaseIn.dwSize >= sizeof(SBaseOut) + sizeof(SBase) +
+                sizeof(FT_DEVICE_LIST_INFO_NODE_OS) and
+                pbase_out.sBaseIn.eType == eResponseEx and
+                (<SBase *>(<char *>pbase_out + sizeof(SBaseOut))).eType ==
+                eFTDIChan):
+                ft_dev_info = <FT_DEVICE_LIST_INFO_NODE_OS *>(<char *>pbase_out
+                    + sizeof(SBaseOut) + sizeof(SBase))
+            elif (pbase_out.sBaseIn.dwSize >= 2 * sizeof(SBaseOut) + 2 *
+                  sizeof(SBase) + sizeof(FT_DEVICE_LIST_INFO_NODE_OS) +
+                  sizeof(SChanInitFTDI) and
+                  pbase_out.sBaseIn.eType == eResponseEx and
+                  (<SBase *>(<char *>pbase_out + 2 *
+                             sizeof(SBaseOut))).eType == eFTDIChan):
+                ft_dev_info = <FT_DEVICE_LIST_INFO_NODE_OS *>(<char *>pbase_out
+                    + 2 * sizeof(SBaseOut) + sizeof(SBase))
+            else:
+                res = UNEXPECTED_READ
+                break
+
+            chan = pbase_out.sBaseIn.nChan
+            dev = dictify_ft_info(ft_dev_info)
+            dev['index'] = len(devices)
+            dev['chan'] = chan
+            dev['active'] = chan >= 0
+            devices.append(dev)
+            by_serial.setdefault(bytes(ft_dev_info.SerialNumber), dev)
+            by_desc.setdefault(bytes(ft_dev_info.Description), dev)
+            by_loc.setdefault(ft_dev_info.LocId, dev)
+            pbase_out = <SBaseOut *>(<char *>pbase_out +
+                                     pbase_out.sBaseIn.dwSize)
+
+        free(phead_in)
+        if res:
+            raise BarstException(res)
+
+        self.ftdi_inventory = {'devices': devices, 'serial': by_serial,
+                               'description': by_desc, 'location': by_loc}
+        self.ftdi_inventory_time = time.time()
+        return self.ftdi_inventory
+
+    cpdef object find_ftdi_device(BarstServer self, object serial=None,
+                                  object desc=None, object loc=None,
+                                  refresh=False):
+        '''
+        Looks up a device in the inventory returned by
+        :meth:`get_ftdi_inventory`, by its serial number, description or
+        location ID. When more than one is provided, the first device
+        enumerated which matches any of them is returned.
+
+        :Parameters:
+
+            `serial`: bytes
+                The serial number of the device. Defaults to None.
+            `desc`: bytes
+                The description of the device. Defaults to None.
+            `loc`: int
+                The location ID of the device. Defaults to None.
+            `refresh`: bool
+                See :meth:`get_ftdi_inventory`. Defaults to False.
+
+        :returns:
+            The device dict from the inventory, or None if no device matches.
+        '''
+        cdef dict inventory = self.get_ftdi_inventory(refresh=refresh)
+        cdef dict dev, found = None
+        cdef list matches = []
+        if serial is not None:
+            matches.append(inventory['serial'].get(tencode(serial)))
+        if desc is not None:
+            matches.append(inventory['description'].get(tencode(desc)))
+        if loc is not None:
+            matches.append(inventory['location'].get(loc))
+
+        for dev in matches:
+            if dev is not None and (found is None or
+                                    dev['index'] < found['index']):
+                found = dev
+        return found
+
+    cpdef object invalidate_ftdi_inventory(BarstServer self):
+        '''
+        Discards the cached inventory, so that the next call to
+        :meth:`get_ftdi_inventory` enumerates the devices again.
+        '''
+        self.ftdi_inventory = None
+
+
+cdef class PreparedWrite(object):
+    '''
+    A message that has been fully encoded ahead of time, so that it can be
+    written repeatedly to a channel with :meth:`BarstChannel.send` without
+    any of the argument validation or encoding of the normal write methods.
+
+    This class is not instantiated by the user, instead it's returned by the
+    `prepare` method of channels that support it, e.g.
+    :meth:`pybarst.ftdi.switch.FTDIPinOut.prepare`. The message cannot be
+    changed once prepared.
+
+    For example::
+
+        >>> msg = dev.prepare(buff_mask=0xFF, buffer=[0b00110000])
+        >>> print msg
+        <pybarst.core.server.PreparedWrite object at 0x0277C530>
+        >>> print dev.send(msg)
+        0.0107669098094
+        >>> print dev.send(msg)
+        0.0109231588215
+    '''
+
+    def __cinit__(PreparedWrite self, **kwargs):
+        self.msg = NULL
+        self.size = 0
+        self.channel = None
+        self.chan = -1
+
+    def __dealloc__(PreparedWrite self):
+        free(self.msg)
+        self.msg = NULL
+
+    cdef void *alloc(PreparedWrite self, DWORD size) except NULL:
+        '''
+        Allocates a zeroed buffer of `size` bytes for the message.
+        '''
+        free(self.msg)
+        self.msg = <SBaseIn *>malloc(size)
+        if self.msg == NULL:
+            self.size = 0
+            raise BarstException(NO_SYS_RESOURCE)
+        memset(self.msg, 0, size)
+        self.size = size
+        return self.msg
+
+
+cdef class PendingWrite(object):
+    '''
+    A handle to a message written with :meth:`BarstChannel.send_async`,
+    whose response from the server may not have been read yet.
+
+    This class is not instantiated by the user. The responses of the pending
+    writes of a channel are read in the order the messages were sent, either
+    when :meth:`result` is called, or when the channel needs to use the pipe
+    for another operation, e.g. :meth:`BarstChannel.send`.
+    '''
+
+    def __cinit__(PendingWrite self, **kwargs):
+        self.channel = None
+        self.done = 0
+        self.value = None
+        self.error = None
+
+    cpdef object result(PendingWrite self):
+        '''
+        Waits until the response to the write has been read, and returns its
+        result or raises its error.
+
+        :returns:
+            The same value that the channel's :meth:`BarstChannel.send`
+            would have returned for this message, e.g. the server time when
+            the data was written.
+        '''
+        while not self.done:
+            (<BarstChannel>self.channel)._complete_pending()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
 
 cdef class BarstChannel(BarstPipe):
     '''
@@ -680,9 +976,15 @@ cdef class BarstChannel(BarstPipe):
         self.server = None
         self.barst_chan_type = ''
         self.connected = 0
+        self.max_pending = 16
+        self.pending = deque()
+        self.response_buff = NULL
+        self.response_size = sizeof(SBaseOut)
 
     def __dealloc__(BarstChannel self):
         self.close_channel_client()
+        free(self.response_buff)
+        self.response_buff = NULL
 
     cpdef object open_channel(BarstChannel self):
         '''
@@ -771,6 +1073,8 @@ cdef class BarstChannel(BarstPipe):
         communicating with the server, calling this method from another thread
         will force the waiting method to return, possibly with an error.
         '''
+        if self.pending:
+            self._discard_pending(BarstException(DEVICE_CLOSING))
         self.close_handle(self.pipe)
         self.pipe = NULL
         self.connected = 0
@@ -814,6 +1118,7 @@ cdef class BarstChannel(BarstPipe):
             raise BarstException(res)
 
         if not state and flush:
+            self._drain_pending()
             self.close_handle(self.pipe)
             self.pipe = self.open_pipe('rw')
 
@@ -912,6 +1217,8 @@ cdef class BarstChannel(BarstPipe):
             raise BarstException(res)
 
         if flush:
+            if pipe[0] == self.pipe:
+                self._drain_pending()
             self.close_handle(pipe[0])
             pipe[0] = self.open_pipe('rw')
 
@@ -959,3 +1266,183 @@ cdef class BarstChannel(BarstPipe):
             result in an exception.
         '''
         pass
+
+    cdef HANDLE _stream_pipe(BarstChannel self):
+        '''
+        Returns the pipe on which the server sends the data read by
+        `read`, e.g. for :class:`~pybarst.core.reactor.Reactor`.
+        '''
+        return self.pipe
+
+    cdef int _start_stream(BarstChannel self) except -1:
+        '''
+        Makes the server start sending data to :meth:`_stream_pipe`, without
+        waiting for it, so that the next `read` doesn't block once data is
+        available on the pipe. Channels whose reads cannot be streamed raise
+        an exception.
+        '''
+        raise BarstException(msg='{} cannot be streamed'.format(
+            self.__class__.__name__))
+
+    cpdef object send(BarstChannel self, PreparedWrite prepared):
+        '''
+        Writes a message previously prepared for this channel, e.g. with
+        :meth:`pybarst.ftdi.switch.FTDIPinOut.prepare`, and waits for the
+        server's response.
+
+        The message is written as is, in a single write / read with the
+        server, so this is the fastest way to repeatedly write the same data.
+        If there are writes pending from :meth:`send_async`, their responses
+        are read first.
+
+        :Parameters:
+
+            `prepared`: :class:`PreparedWrite`
+                The message to send. It must have been prepared by this
+                channel instance, while it was opened with the same channel
+                number on the server.
+
+        :returns:
+            The response of the server to the write. For most channels, it's
+            a float, the server time, :meth:`BarstServer.clock`, when the data
+            was written. See the channel's `write` method.
+        '''
+        cdef DWORD read_size = self.response_size
+        cdef int res
+
+        self._check_prepared(prepared)
+        self._drain_pending()
+        res = self.write_read(self.pipe, prepared.size, prepared.msg,
+                              &read_size, self.response_buff)
+        return self._parse_write_response(res, read_size)
+
+    cpdef object send_async(BarstChannel self, PreparedWrite prepared):
+        '''
+        Writes a message previously prepared for this channel, like
+        :meth:`send`, but returns without waiting for the server's response.
+
+        This allows many writes to be in flight at once, rather than waiting
+        a full round trip with the server for each write, which is especially
+        slow with remote pipes. The server responds to the writes in the
+        order they were sent, and the responses are read in that order, when
+        :meth:`PendingWrite.result` is called, when :meth:`flush_pending` is
+        called, or before any other operation that uses the channel's pipe,
+        e.g. :meth:`send`.
+
+        If there are already :attr:`max_pending` writes pending, the response
+        to the oldest write is read first.
+
+        :Parameters:
+
+            `prepared`: :class:`PreparedWrite`
+                The message to send. See :meth:`send`.
+
+        :returns:
+            A :class:`PendingWrite` instance, whose
+            :meth:`PendingWrite.result` returns what :meth:`send` would have
+            returned.
+
+        For example::
+
+            >>> high = dev.prepare(buff_mask=0xFF, buffer=[0xFF])
+            >>> low = dev.prepare(buff_mask=0xFF, buffer=[0x00])
+            >>> pending = [dev.send_async(msg) for msg in [high, low] * 5]
+            >>> print [p.result() for p in pending]
+            [1.8730487823, 1.8731346751, 1.8732148624, 1.8733002183, \
+1.8733945126, 1.8734730005, 1.8735542618, 1.8736412733, 1.8737215544, \
+1.8738091462]
+        '''
+        cdef PendingWrite pending
+        cdef int res
+
+        self._check_prepared(prepared)
+        while self.pending and len(self.pending) >= self.max_pending:
+            self._complete_pending()
+
+        res = self.write_read(self.pipe, prepared.size, prepared.msg, NULL,
+                              NULL)
+        if res:
+            raise BarstException(res)
+        pending = PendingWrite()
+        pending.channel = self
+        self.pending.append(pending)
+        return pending
+
+    cpdef object flush_pending(BarstChannel self):
+        '''
+        Reads the responses of all the writes pending from
+        :meth:`send_async`. Errors are not raised here, instead they are
+        raised by each write's :meth:`PendingWrite.result`.
+        '''
+        self._drain_pending()
+
+    cdef int _check_prepared(BarstChannel self,
+                             PreparedWrite prepared) except -1:
+        if prepared.channel is not self or prepared.chan != self.chan:
+            raise BarstException(msg='The message was not prepared for this '
+                                 'channel, or the channel has been reopened')
+        if prepared.msg == NULL:
+            raise BarstException(BAD_INPUT_PARAMS)
+        if self.response_buff == NULL:
+            self.response_buff = malloc(self.response_size)
+            if self.response_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+        return 0
+
+    cdef int _complete_pending(BarstChannel self) except -1:
+        '''
+        Reads the response of the oldest pending write. If the pipe itself
+        failed, all the pending writes fail with that error.
+        '''
+        cdef PendingWrite pending = self.pending.popleft()
+        cdef DWORD read_size = self.response_size
+        cdef int res = self.read_message(self.pipe, &read_size,
+                                         self.response_buff)
+        try:
+            pending.value = self._parse_write_response(res, read_size)
+        except BarstException as e:
+            pending.error = e
+            if res:
+                self._discard_pending(e)
+        pending.done = 1
+        return 0
+
+    cdef int _drain_pending(BarstChannel self) except -1:
+        '''
+        Reads the responses of all the pending writes. Must be called before
+        any other operation that reads from :attr:`pipe`.
+        '''
+        while self.pending:
+            self._complete_pending()
+        return 0
+
+    cdef object _discard_pending(BarstChannel self, object error):
+        cdef PendingWrite pending
+        while self.pending:
+            pending = self.pending.popleft()
+            pending.error = error
+            pending.done = 1
+
+    cdef object _parse_write_response(BarstChannel self, int res,
+                                      DWORD read_size):
+        '''
+        Parses the server's response, read into :attr:`response_buff`, to a
+        prepared write message. `res` is the error, if any, from reading
+        the pipe. Raises an exception for errors.
+
+        The default handles a :class:`SBaseOut` response with the server
+        time of the write, which is returned.
+        '''
+        cdef SBaseOut *base_read = <SBaseOut *>self.response_buff
+        if not res:
+            if ((read_size != sizeof(SBaseOut) and
+                 read_size != sizeof(SBaseIn)) or
+                ((read_size == sizeof(SBaseIn) or
+                  base_read.sBaseIn.eType != eResponseExD) and
+                 not base_read.sBaseIn.nError)):
+                res = UNEXPECTED_READ
+            else:
+                res = base_read.sBaseIn.nError
+        if res:
+            raise BarstException(res)
+        return base_read.dDouble
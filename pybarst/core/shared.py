@@ -0,0 +1,638 @@
+'''
+Shared memory streams
+======================
+
+Shares the data stream of a single channel with many local processes.
+
+Only one client can read the stream of an
+:class:`~pybarst.ftdi.adc.FTDIADC`, a continuous
+:class:`~pybarst.mcdaq.MCDAQChannel`, or an :class:`~pybarst.rtv.RTVChannel`.
+:class:`SharedPublisher` reads such a stream in a background thread and
+writes each read into a ring buffer of fixed size slots in a named
+`multiprocessing.shared_memory` block. Any number of :class:`SharedSubscriber`
+instances, in any process, attach to the block by its name and read the
+records at their own pace, without copying them and without slowing down the
+publisher.
+
+`multiprocessing.shared_memory` requires python 3.8 or later. With older
+versions the module can be imported, but creating a publisher or subscriber
+raises a :class:`~pybarst.core.exception.BarstException`.
+
+Every record gets a sequence number, starting from 1. When a subscriber
+falls more than a ring's worth of records behind, the records it missed are
+overwritten, which it detects from their sequence numbers. It then skips to
+the oldest record still available and counts the records it skipped in
+:attr:`SharedSubscriber.lost`.
+
+A :class:`SharedRecord` is a view into the ring, so it is only valid until the
+publisher wraps around and overwrites its slot. Once done with the data,
+:attr:`SharedRecord.valid` tells whether the data might have changed while it
+was used.
+
+For example, in the process that reads the channel::
+
+    >>> from pybarst.core.shared import SharedPublisher
+    >>> rtv = RTVChannel(chan=0, server=server, lossless=True)
+    >>> rtv.open_channel()
+    >>> publisher = SharedPublisher(rtv, name='rtv0', num_slots=32)
+    >>> publisher.start()
+
+and in any other process::
+
+    >>> from pybarst.core.shared import SharedSubscriber
+    >>> subscriber = SharedSubscriber('rtv0')
+    >>> print subscriber.info
+    {u'kind': u'rtv', u'width': 640, u'height': 480, u'bpp': 24, \
+u'frame_fmt': u'rgb24'}
+    >>> record = subscriber.read()
+    >>> print record.seq, record.time, len(record.data)
+    12 0.4467132 921600
+    >>> img = numpy.frombuffer(record.data, dtype=numpy.uint8)
+    >>> print record.valid, subscriber.lost
+    True 0
+    >>> del img, record
+    >>> subscriber.close()
+'''
+
+__all__ = ('SharedPublisher', 'SharedSubscriber', 'SharedRecord',
+           'ADCRecord')
+
+import json
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pybarst.core.exception import BarstException
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+header = struct.Struct('<8sIII4x')
+'''The format of the header of the shared memory block; the magic bytes, the
+number of slots, the size of the data of each slot, and the size of the info
+block.
+'''
+
+head_fmt = struct.Struct('<Q')
+'''The format of the sequence number of the last published record, which
+follows :attr:`header`.
+'''
+
+slot_header = struct.Struct('<QdQ8x')
+'''The format of the header of each slot; the sequence number of its record,
+or zero while it is written, its time, and the size of its data.
+'''
+
+adc_header = struct.Struct('<IIIIIdffbbbxHH4x')
+'''The format of the header of a :class:`~pybarst.ftdi.adc.FTDIADC` record,
+which is followed by the data of channel 1 and then channel 2, as doubles.
+'''
+
+magic = b'PYBARST\x01'
+info_size = 4096
+align = 64
+
+ADCRecord = namedtuple('ADCRecord', [
+    'count', 'chan1_ts_idx', 'chan2_ts_idx', 'ts', 'rate', 'fullness',
+    'chan1_oor', 'chan2_oor', 'noref', 'bad_count', 'overflow_count',
+    'chan1_data', 'chan2_data'])
+'''The decoded :class:`~pybarst.ftdi.adc.FTDIADC` record. The fields have the
+same meaning as those of :class:`~pybarst.ftdi.adc.ADCData`, except that
+`chan1_data` and `chan2_data` are memoryviews of doubles into the ring.
+'''
+
+
+def _aligned(size):
+    return (size + align - 1) // align * align
+
+
+def _data_offset():
+    return _aligned(header.size + head_fmt.size + info_size)
+
+
+class SharedRecord(object):
+    '''
+    A record read by a :class:`SharedSubscriber`. Its :attr:`data` is a view
+    into the ring, which must be released, e.g. by deleting the record and any
+    views derived from it, before the subscriber is closed.
+    '''
+
+    seq = 0
+    '''The sequence number of the record.
+    '''
+
+    time = 0.
+    '''The server time of the record, e.g. the time of the image for an
+    :class:`~pybarst.rtv.RTVChannel`.
+    '''
+
+    data = None
+    '''A memoryview of the data of the record in the ring.
+    '''
+
+    subscriber = None
+    '''The :class:`SharedSubscriber` that read the record.
+    '''
+
+    def __init__(self, subscriber, seq, time, data, **kwargs):
+        super(SharedRecord, self).__init__(**kwargs)
+        self.subscriber = subscriber
+        self.seq = seq
+        self.time = time
+        self.data = data
+
+    @property
+    def valid(self):
+        '''Whether the slot of the record still holds it, i.e. whether
+        :attr:`data` has not been overwritten yet. It should be checked after
+        the data was used.
+        '''
+        return self.subscriber._slot_seq(self.seq) == self.seq
+
+    def decode(self):
+        '''
+        Decodes the record according to the kind of the publisher's channel,
+        :attr:`SharedSubscriber.info`. The returned views are also into the
+        ring.
+
+        :returns:
+            For an :class:`~pybarst.rtv.RTVChannel`, and for records published
+            with :meth:`SharedPublisher.publish`, :attr:`data`. For a
+            :class:`~pybarst.mcdaq.MCDAQChannel`, a 2-tuple of memoryviews of
+            the times, doubles, and values, unsigned shorts, of the samples.
+            For an :class:`~pybarst.ftdi.adc.FTDIADC`, an :class:`ADCRecord`.
+        '''
+        kind = self.subscriber.info.get('kind')
+        data = self.data
+        if kind == 'mcdaq':
+            n = len(data) // 10
+            return data[:8 * n].cast('d'), data[8 * n:10 * n].cast('H')
+        if kind == 'adc':
+            fields = adc_header.unpack_from(data)
+            n1, n2 = fields[1], fields[2]
+            offset = adc_header.size
+            chan1 = data[offset:offset + 8 * n1].cast('d')
+            chan2 = data[offset + 8 * n1:offset + 8 * (n1 + n2)].cast('d')
+            return ADCRecord(fields[0], *(fields[3:] + (chan1, chan2)))
+        return data
+
+
+class SharedPublisher(object):
+    '''
+    Reads a channel's stream in a background thread and publishes each read
+    as a record in a named shared memory ring buffer.
+
+    The shared memory block is created when the instance is created, and
+    removed by :meth:`close`, so the publisher should outlive its subscribers.
+
+    Depending on the channel, each record holds:
+
+    * :class:`~pybarst.rtv.RTVChannel`: one image, as read with
+      :meth:`~pybarst.rtv.RTVChannel.read`.
+    * :class:`~pybarst.ftdi.adc.FTDIADC`: one
+      :meth:`~pybarst.ftdi.adc.FTDIADC.read`, see :class:`ADCRecord`.
+    * :class:`~pybarst.mcdaq.MCDAQChannel`: all the samples available
+      when continuous, read directly into the ring with
+      :meth:`~pybarst.mcdaq.MCDAQChannel.read_many`, otherwise a single
+      sample.
+
+    :meth:`SharedRecord.decode` decodes the records in the subscribers.
+
+    :Parameters:
+
+        `channel`: channel instance
+            The opened channel to read, of one of the kinds above. If None,
+            there's no thread and the records are published with
+            :meth:`publish`, and the `kind` key of `info`, if present, sets
+            how :meth:`SharedRecord.decode` decodes them. Defaults to None.
+        `name`: str
+            The name of the shared memory block, which subscribers use to
+            attach. If None, a unique name is generated. Defaults to None.
+        `num_slots`: int
+            The number of records kept in the ring. Defaults to 32.
+        `slot_size`: int
+            The maximum size, in bytes, of a record. If zero, it's computed
+            from the channel; the image size for an RTV channel, the
+            :attr:`~pybarst.ftdi.adc.ADCSettings.transfer_size` of both ADC
+            channels, or 1024 samples for an MC DAQ channel. Required when
+            `channel` is None. Defaults to 0.
+        `info`: dict
+            Additional JSON serializable information about the stream, made
+            available to subscribers in :attr:`SharedSubscriber.info`.
+            Defaults to None.
+    '''
+
+    channel = None
+    '''The channel whose stream is published.
+    '''
+
+    name = ''
+    '''The name of the shared memory block.
+    '''
+
+    info = {}
+    '''The information about the stream given to the subscribers. Its `kind`
+    key is the kind of channel, `'rtv'`, `'adc'`, `'mcdaq'`, or None.
+    '''
+
+    published = 0
+    '''The sequence number of the last published record, i.e. the number of
+    records published.
+    '''
+
+    error = None
+    '''The exception that ended the publishing thread, if it wasn't ended by
+    :meth:`stop`, or None.
+    '''
+
+    def __init__(self, channel=None, name=None, num_slots=32, slot_size=0,
+                 info=None, **kwargs):
+        super(SharedPublisher, self).__init__(**kwargs)
+        if shared_memory is None:
+            raise BarstException(msg='multiprocessing.shared_memory is not '
+                                 'available')
+        if num_slots <= 0:
+            raise BarstException(msg='Invalid num_slots, {}'.format(
+                num_slots))
+
+        self.channel = channel
+        kind, default_size, stream_info = self._describe(channel)
+        self.kind = kind
+        if not slot_size:
+            slot_size = default_size
+        if slot_size <= 0:
+            raise BarstException(msg='Invalid slot_size, {}'.format(
+                slot_size))
+        stream_info.update(info or {})
+        if channel is not None or 'kind' not in stream_info:
+            stream_info['kind'] = kind
+        self.info = stream_info
+        encoded = json.dumps(stream_info).encode('utf8')
+        if len(encoded) > info_size:
+            raise BarstException(msg='The stream info is larger than {} '
+                                 'bytes'.format(info_size))
+
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.stride = _aligned(slot_header.size + slot_size)
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=True,
+            size=_data_offset() + self.stride * num_slots)
+        self.name = self.shm.name
+        self.buf = buf = self.shm.buf
+        header.pack_into(buf, 0, magic, num_slots, slot_size, len(encoded))
+        head_fmt.pack_into(buf, header.size, 0)
+        buf[header.size + head_fmt.size:
+            header.size + head_fmt.size + len(encoded)] = encoded
+        self.published = 0
+        self.thread = None
+        self.running = False
+
+    def _describe(self, channel):
+        if channel is None:
+            return None, 0, {}
+
+        from pybarst.rtv import RTVChannel
+        from pybarst.ftdi.adc import FTDIADC
+        from pybarst.mcdaq import MCDAQChannel
+        if isinstance(channel, RTVChannel):
+            return 'rtv', channel.buffer_size, {
+                'width': channel.width, 'height': channel.height,
+                'bpp': channel.bpp, 'frame_fmt': channel.frame_fmt}
+        if isinstance(channel, FTDIADC):
+            settings = channel.settings
+            return 'adc', adc_header.size + 16 * settings.transfer_size, {
+                'chan1': settings.chan1, 'chan2': settings.chan2,
+                'sampling_rate': settings.sampling_rate}
+        if isinstance(channel, MCDAQChannel):
+            return 'mcdaq', 10 * 1024, {'continuous': channel.continuous}
+        raise BarstException(msg='Cannot publish a {} channel'.format(
+            channel.__class__.__name__))
+
+    def _reserve(self):
+        '''Marks the slot of the next record as being written and returns a
+        memoryview of its data.
+        '''
+        offset = (_data_offset() +
+                  (self.published % self.num_slots) * self.stride)
+        slot_header.pack_into(self.buf, offset, 0, 0., 0)
+        return self.buf[offset + slot_header.size:
+                        offset + slot_header.size + self.slot_size]
+
+    def _commit(self, t, size):
+        '''Publishes the slot returned by :meth:`_reserve`.
+        '''
+        seq = self.published + 1
+        offset = (_data_offset() +
+                  (self.published % self.num_slots) * self.stride)
+        slot_header.pack_into(self.buf, offset, seq, t, size)
+        head_fmt.pack_into(self.buf, header.size, seq)
+        self.published = seq
+        return seq
+
+    def publish(self, t, data):
+        '''
+        Copies `data` into the ring as the next record. This is what the
+        thread does with each read, but can also be used directly when
+        there's no `channel`. It must not be called concurrently.
+
+        :Parameters:
+
+            `t`: float
+                The time of the record.
+            `data`: buffer
+                The data of the record, at most :attr:`slot_size` bytes.
+
+        :returns:
+            The sequence number of the record.
+        '''
+        data = memoryview(data)
+        if data.ndim != 1 or data.itemsize != 1:
+            data = data.cast('B')
+        size = len(data)
+        if size > self.slot_size:
+            raise BarstException(msg='The record, {} bytes, is larger than '
+                                 'slot_size, {}'.format(size, self.slot_size))
+        view = self._reserve()
+        view[:size] = data
+        del view
+        return self._commit(t, size)
+
+    def start(self):
+        '''
+        Starts the thread that reads the channel and publishes the reads. RTV
+        and ADC channels are also activated with
+        :meth:`~pybarst.core.server.BarstChannel.set_state`.
+        '''
+        if self.channel is None:
+            raise BarstException(msg='There is no channel to read')
+        if self.thread is not None:
+            raise BarstException(msg='The publisher is already running')
+        self.error = None
+        if self.kind != 'mcdaq':
+            self.channel.set_state(True)
+        self.running = True
+        self.thread = threading.Thread(target=self._publish_thread,
+                                       name='SharedPublisher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops reading the channel, flushing the data waiting in the server,
+        and waits for the thread to exit. The published records remain
+        available.
+        '''
+        thread = self.thread
+        if thread is None:
+            return
+        self.running = False
+        try:
+            if self.kind == 'mcdaq':
+                if self.channel.continuous:
+                    self.channel.cancel_read(flush=True)
+            else:
+                self.channel.set_state(False, flush=True)
+        finally:
+            thread.join()
+            self.thread = None
+
+    def close(self):
+        '''
+        Stops the thread and removes the shared memory block. Subscribers
+        that are still attached keep their mapping, but no new records are
+        published.
+        '''
+        self.stop()
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def _publish_thread(self):
+        channel = self.channel
+        kind = self.kind
+        continuous = kind == 'mcdaq' and channel.continuous
+        capacity = self.slot_size // 10
+
+        try:
+            while self.running:
+                if kind == 'rtv':
+                    self.publish(*channel.read())
+                elif kind == 'adc':
+                    self._publish_adc(channel.read())
+                elif continuous:
+                    # read the samples directly into the slot
+                    view = self._reserve()
+                    n = channel.read_many(view[:8 * capacity].cast('d'),
+                                          view[8 * capacity:10 * capacity].
+                                          cast('H'))
+                    t = view[:8].cast('d')[0] if n else 0.
+                    if n < capacity:
+                        # make the values follow the times of the record
+                        view[8 * n:10 * n] = \
+                            view[8 * capacity:8 * capacity + 2 * n].tobytes()
+                    del view
+                    if n:
+                        self._commit(t, 10 * n)
+                else:
+                    self._publish_sample(*channel.read())
+        except Exception as e:
+            if self.running:
+                self.error = e
+                self.running = False
+
+    def _publish_sample(self, t, value):
+        view = self._reserve()
+        struct.pack_into('<dH', view, 0, t, value)
+        del view
+        self._commit(t, 10)
+
+    def _publish_adc(self, data):
+        chan1 = data.chan1_data if data.chan1_data is not None else b''
+        chan2 = data.chan2_data if data.chan2_data is not None else b''
+        n1, n2 = len(chan1), len(chan2)
+        size = adc_header.size + 8 * (n1 + n2)
+        if size > self.slot_size:
+            raise BarstException(msg='The ADC data, {} bytes, is larger than '
+                                 'slot_size, {}'.format(size, self.slot_size))
+
+        view = self._reserve()
+        adc_header.pack_into(
+            view, 0, data.count, n1, n2, data.chan1_ts_idx, data.chan2_ts_idx,
+            data.ts, data.rate, data.fullness, data.chan1_oor, data.chan2_oor,
+            data.noref, data.bad_count, data.overflow_count)
+        offset = adc_header.size
+        if n1:
+            view[offset:offset + 8 * n1] = memoryview(chan1).cast('B')
+        if n2:
+            view[offset + 8 * n1:size] = memoryview(chan2).cast('B')
+        del view
+        self._commit(data.ts, size)
+
+
+class SharedSubscriber(object):
+    '''
+    Reads the records of a :class:`SharedPublisher`, possibly in another
+    process, by attaching to its shared memory block.
+
+    Records are read in order. Waiting for a record polls the ring every
+    `poll_interval` seconds, since there's no cross-process notification.
+
+    :Parameters:
+
+        `name`: str
+            The :attr:`SharedPublisher.name` of the publisher.
+        `start`: str
+            Where to start reading. If `'latest'`, the first record read is
+            the next published record, if `'oldest'`, it's the oldest record
+            still in the ring. Defaults to `'latest'`.
+        `poll_interval`: float
+            The time, in seconds, to sleep between checks for new records.
+            Defaults to 0.001.
+    '''
+
+    name = ''
+    '''The name of the shared memory block.
+    '''
+
+    info = {}
+    '''The :attr:`SharedPublisher.info` of the publisher.
+    '''
+
+    next_seq = 1
+    '''The sequence number of the next record to read.
+    '''
+
+    lost = 0
+    '''The number of records that were overwritten before they were read.
+    '''
+
+    def __init__(self, name, start='latest', poll_interval=0.001, **kwargs):
+        super(SharedSubscriber, self).__init__(**kwargs)
+        if shared_memory is None:
+            raise BarstException(msg='multiprocessing.shared_memory is not '
+                                 'available')
+        if start not in ('latest', 'oldest'):
+            raise BarstException(msg='Invalid start, {}'.format(start))
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # otherwise the block is removed when this process exits
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+
+        self.name = name
+        self.buf = buf = self.shm.buf
+        mark, self.num_slots, self.slot_size, size = header.unpack_from(buf)
+        if mark != magic:
+            self.close()
+            raise BarstException(msg='{} is not a publisher\'s shared '
+                                 'memory'.format(name))
+        start_info = header.size + head_fmt.size
+        self.info = json.loads(bytes(buf[start_info:start_info + size]).
+                               decode('utf8'))
+        self.stride = _aligned(slot_header.size + self.slot_size)
+        self.poll_interval = poll_interval
+        self.lost = 0
+        head = self.head
+        if start == 'latest':
+            self.next_seq = head + 1
+        else:
+            self.next_seq = max(1, head - self.num_slots + 1)
+
+    @property
+    def head(self):
+        '''The sequence number of the last published record.
+        '''
+        return head_fmt.unpack_from(self.buf, header.size)[0]
+
+    def _slot_offset(self, seq):
+        return _data_offset() + ((seq - 1) % self.num_slots) * self.stride
+
+    def _slot_seq(self, seq):
+        return slot_header.unpack_from(self.buf, self._slot_offset(seq))[0]
+
+    def poll(self):
+        '''
+        Returns the next record without waiting, or None if it hasn't been
+        published yet. Records that were overwritten before they were read
+        are skipped and added to :attr:`lost`.
+        '''
+        buf = self.buf
+        num_slots = self.num_slots
+        while True:
+            seq = self.next_seq
+            head = self.head
+            if seq > head:
+                return None
+            if head - seq >= num_slots:
+                # skip to the oldest record, leaving room for the one being
+                # written
+                skip = head - num_slots + 2 - seq
+                self.lost += skip
+                self.next_seq += skip
+                continue
+
+            offset = self._slot_offset(seq)
+            slot_seq, t, size = slot_header.unpack_from(buf, offset)
+            self.next_seq += 1
+            if slot_seq == seq:
+                start = offset + slot_header.size
+                data = buf[start:start + size]
+                # the slot may have been rewritten while the header was read
+                if self._slot_seq(seq) == seq:
+                    return SharedRecord(self, seq, t, data)
+                data.release()
+            self.lost += 1
+
+    def read(self, timeout=None):
+        '''
+        Returns the next record, waiting for it to be published.
+
+        :Parameters:
+
+            `timeout`: float
+                The maximum time to wait, in seconds. If None, it waits
+                until a record is published. Defaults to None.
+
+        :returns:
+            A :class:`SharedRecord`, or None if the timeout elapsed.
+        '''
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            record = self.poll()
+            if record is not None:
+                return record
+            if end is not None and time.time() >= end:
+                return None
+            time.sleep(self.poll_interval)
+
+    def latest(self):
+        '''
+        Returns the most recently published record without waiting, skipping
+        any unread older records, which are not counted in :attr:`lost`.
+        Returns None if no new record was published.
+        '''
+        head = self.head
+        if head >= self.next_seq:
+            self.next_seq = head
+        return self.poll()
+
+    def __iter__(self):
+        while True:
+            yield self.read()
+
+    def close(self):
+        '''
+        Detaches from the shared memory block. All the records, and views of
+        their data, must be released first.
+        '''
+        self.buf = None
+        self.shm.close()
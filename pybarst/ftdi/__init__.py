@@ -74,6 +74,7 @@ a continuous read triggered by this client.
     sampling because it will disrupt the device.
 '''
 
-__all__ = ('FTDISettings', 'FTDIChannel', 'FTDIDevice')
+__all__ = ('FTDISettings', 'FTDIChannel', 'FTDIDevice', 'open_channels')
 
-from pybarst.ftdi._ftdi import FTDIChannel, FTDIDevice, FTDISettings
+from pybarst.ftdi._ftdi import (FTDIChannel, FTDIDevice, FTDISettings,
+                                open_channels)
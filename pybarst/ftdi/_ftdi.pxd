@@ -149,6 +149,11 @@ cdef class FTDIChannel(BarstChannel):
     devices, in particular the :class:`~pybarst.ftdi.adc.FTDIADC` peripheral.
     '''
 
+    cpdef object close_channel_server(FTDIChannel self)
+    cdef int _open_main(FTDIChannel self, alloc=*) except -1
+    cdef int _alloc_channel(FTDIChannel self, int man_chan,
+                            int index) except -1
+    cdef object _discover(FTDIChannel self, int stale, alloc=*)
     cdef object _populate_settings(FTDIChannel self)
 
 
@@ -216,3 +221,6 @@ cdef class FTDIDevice(BarstChannel):
     cdef int running
 
     cdef object _send_trigger(FTDIDevice self)
+    cdef object _query_settings(FTDIDevice self)
+    cdef object _parse_settings(FTDIDevice self, char *pbase_out,
+                                DWORD read_size)
@@ -1,6 +1,7 @@
 
 
-__all__ = ('FTDISettings', 'FTDIChannel', 'FTDIDevice')
+__all__ = ('FTDISettings', 'FTDIChannel', 'FTDIDevice', 'open_channels',
+           'discovery_batch')
 
 cdef extern from "stdlib.h" nogil:
     void *malloc(size_t)
@@ -13,16 +14,24 @@ cdef extern from "string.h":
 from pybarst.core.exception import BarstException
 from pybarst.core import join as barst_join
 import sys
+import time
 
 PY3 = sys.version_info > (3, )
 
-cdef dict dictify_ft_info(FT_DEVICE_LIST_INFO_NODE_OS *ft_info):
-    return {'is_open': ft_info.Flags & 1, 'is_high_speed': ft_info.Flags & 2,
-            'is_full_speed': not (ft_info.Flags & 2), 'dev_type': ft_info.Type,
-            'dev_id': ft_info.ID, 'dev_loc': ft_info.LocId,
-            'dev_serial': str(ft_info.SerialNumber),
-            'dev_description': str(ft_info.Description)}
-
+discovery_batch = 8
+'''
+The number of devices queried at once by :class:`FTDIChannel` when it
+discovers the devices of an existing channel. All the queries of a batch are
+written before their responses are read, so a channel with up to this many
+devices is discovered in a single round trip with the server.
+'''
+
+cdef DWORD periph_query_size = (
+    sizeof(SBaseOut) + 2 * sizeof(SBase) + sizeof(SInitPeriphFT) +
+    max(sizeof(SADCInit), sizeof(SValveInit), sizeof(SPinInit)))
+'''
+The maximum size of the server's response to a query of a device's settings.
+'''
 
 cdef class FTDISettings(object):
     '''
@@ -175,23 +184,38 @@ cdef class FTDIChannel(BarstChannel):
         raise exceptions when trying to communicate with it. To resolve it,
         for each instance you'll have to call :meth:`open_channel` to recover
         the connection to the channel.
+
+        See :func:`open_channels` to open many channels at once.
         '''
-        cdef int man_chan, res
-        cdef HANDLE pipe
-        cdef DWORD read_size, bytes_count = 0, settings_size = 0
-        cdef void *phead_out
-        cdef void *phead_in
-        cdef void *settings_buff
-        cdef SBaseIn *pbase
-        cdef SBaseOut *pbase_out
-        cdef FT_DEVICE_LIST_INFO_NODE_OS *ft_dev_info = NULL
-        cdef int i = 0, chan = -1    # i is position in list
-        cdef int found = 0
-        cdef SChanInitFTDI *init_struct
-        cdef object chan_class
-        cdef list dev_list = []
-        cdef FTDISettings device
-        cdef str msg = ''
+        return self._discover(self._open_main(alloc=alloc), alloc=alloc)
+
+    cpdef object close_channel_server(FTDIChannel self):
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel.close_channel_server`.
+
+        It also invalidates the server's FTDI inventory, see
+        :meth:`~pybarst.core.server.BarstServer.invalidate_ftdi_inventory`,
+        because the device's index changes once its channel is closed.
+        '''
+        BarstChannel.close_channel_server(self)
+        self.server.invalidate_ftdi_inventory()
+
+    cdef int _open_main(FTDIChannel self, alloc=False) except -1:
+        '''
+        Finds the channel's device in the server's FTDI inventory, see
+        :meth:`~pybarst.core.server.BarstServer.get_ftdi_inventory`, and
+        creates the channel if it's not open and `alloc` is True.
+        Afterwards, :attr:`pipe_name` is the channel's pipe.
+
+        If creating the channel fails when the device index came from a cached
+        inventory, the inventory is refreshed and it's tried again once.
+        Returns whether the channel was created using a device index from a
+        cached inventory, in which case the index may have been stale and the
+        wrong device opened.
+        '''
+        cdef int man_chan, res = 0, attempt, fresh = 0
+        cdef double t
+        cdef dict dev
         self.close_channel_client()
 
         if not self.desc and not self.serial:
@@ -200,159 +224,127 @@ cdef class FTDIChannel(BarstChannel):
 
         man_chan = self.server.get_manager('ftdi')['chan']
         self.parent_chan = man_chan
-        pipe = self.server.open_pipe('rw')
 
-        # we need to query to get a list of devices connected
+        for attempt in range(2):
+            t = time.time()
+            dev = self.server.find_ftdi_device(self.serial, self.desc, None,
+                                               attempt > 0)
+            fresh = self.server.ftdi_inventory_time >= t
+            if dev is None:
+                if not fresh:    # the device may have been connected since
+                    continue
+                raise BarstException(NO_CHAN, msg='FTDI devices found:\n{}'.
+                    format('\n'.join(map(str,
+                    self.server.get_ftdi_inventory()['devices']))))
+
+            if dev['active']:    # channel was already open
+                self.chan = dev['chan']
+                fresh = 1
+                break
+            if not alloc:
+                raise BarstException(
+                    msg='Channel is not open and alloc is False.')
+
+            res = self._alloc_channel(man_chan, dev['index'])
+            if not res:
+                dev['chan'] = self.chan
+                dev['active'] = True
+                break
+            self.server.invalidate_ftdi_inventory()
+            if fresh:
+                raise BarstException(res)
+
+        self.pipe_name = barst_join(self.server.pipe_name, bytes(man_chan),
+                                    bytes(self.chan))
+        return not fresh
+
+    cdef int _alloc_channel(FTDIChannel self, int man_chan,
+                            int index) except -1:
+        '''
+        Creates the channel on the server for the device at position `index`
+        in the FTDI manager's device list. Returns the error code, if any.
+        '''
+        cdef int res
+        cdef HANDLE pipe
+        cdef DWORD read_size, bytes_count = 0, settings_size = 0
+        cdef void *phead_out
+        cdef SBaseOut phead_in
+        cdef void *settings_buff
+        cdef SBaseIn *pbase
+        cdef SChanInitFTDI *init_struct
+        cdef FTDISettings device
+
         for device in self.channels:
             bytes_count += device.copy_settings(NULL, 0)
-        # max 25 ftdi devices
-        read_size = 25 * (sizeof(SBaseOut) + 2 * sizeof(SBase) +
-                       sizeof(FT_DEVICE_LIST_INFO_NODE_OS) +
-                       sizeof(SChanInitFTDI))
         phead_out = malloc(2 * sizeof(SBaseIn) + sizeof(SBase) +
                            sizeof(SChanInitFTDI) + bytes_count)
-        phead_in = malloc(max(read_size, MIN_BUFF_OUT))
-        if (phead_out == NULL or phead_in == NULL):
-            CloseHandle(pipe)
-            free(phead_out)
-            free(phead_in)
+        if phead_out == NULL:
             raise BarstException(NO_SYS_RESOURCE)
 
         pbase = <SBaseIn *>phead_out
-        pbase.dwSize = 2 * sizeof(SBaseIn)
-        pbase.eType = ePassOn    # pass on to ftdi manager
+        pbase.dwSize = (2 * sizeof(SBaseIn) + sizeof(SBase) +
+                        sizeof(SChanInitFTDI) + bytes_count)
+        pbase.eType = ePassOn
         pbase.nChan = man_chan
         pbase.nError = 0
         pbase += 1
-        pbase.dwSize = sizeof(SBaseIn)
-        pbase.eType = eQuery
-        pbase.nChan = -1    # request info on all the USB connected devices
+        pbase.dwSize = (sizeof(SBaseIn) + sizeof(SBase) +
+                        sizeof(SChanInitFTDI) + bytes_count)
+        pbase.eType = eSet
+        pbase.nChan = index
         pbase.nError = 0
-        res = self.server.write_read(pipe, 2 * sizeof(SBaseIn), phead_out,
-                                     &read_size, phead_in)
+        pbase += 1
+        pbase.dwSize = sizeof(SChanInitFTDI) + sizeof(SBase)
+        pbase.eType = eFTDIChanInit
+        init_struct = <SChanInitFTDI *>(<char *>pbase + sizeof(SBase))
+        init_struct.dwBuffIn = 0
+        init_struct.dwBuffOut = 0
+        init_struct.dwBaud = self.baudrate
+        init_struct += 1
+        settings_buff = init_struct
+        memset(settings_buff, 0, bytes_count)
+        for device in self.channels:
+            settings_size += device.copy_settings(<char *>settings_buff +
+            settings_size, bytes_count - settings_size)
+
+        pipe = self.server.open_pipe('rw')
+        read_size = sizeof(SBaseOut)
+        res = self.write_read(pipe, 2 * sizeof(SBaseIn) + sizeof(SBase) +
+            sizeof(SChanInitFTDI) + bytes_count, phead_out, &read_size,
+            &phead_in)
         if not res:
-            if (read_size == sizeof(SBaseIn) and
-                (<SBaseIn *>phead_in).dwSize == sizeof(SBaseIn) and
-                (<SBaseIn *>phead_in).nError):
-                res = (<SBaseIn *>phead_in).nError
-            elif (read_size < sizeof(SBaseIn) + sizeof(SBaseOut) +
-                  sizeof(SBase) + sizeof(FT_DEVICE_LIST_INFO_NODE_OS)):
-                msg = 'No FTDI device detected'
+            if ((read_size == sizeof(SBaseIn) or read_size ==
+                 sizeof(SBaseOut)) and
+                phead_in.sBaseIn.dwSize == read_size and
+                phead_in.sBaseIn.nError):
+                res = phead_in.sBaseIn.nError
+            elif (read_size != sizeof(SBaseOut) or
+                  phead_in.sBaseIn.dwSize != sizeof(SBaseOut) or
+                  phead_in.sBaseIn.eType != eResponseExL):
                 res = NO_CHAN
-        if res:
-            CloseHandle(pipe)
-            free(phead_out)
-            free(phead_in)
-            raise BarstException(res, msg=msg)
-
-        '''now we should have list of devices, each having a SBaseOut struct
-        followed by SBase followed by FT_DEVICE_LIST_INFO_NODE (and followed by
-        SBase and SChanInitFTDI if the channel is open in the manager). We know
-        if it's open because opened channels have bActive true in SBaseOut
-        (and nChan != -1). If a channel isn't open we can open it after this
-        call by using the location in the list in which it occured. If the
-        channel is open, we can address it only by its channel number.
-        NOTE, the list number for unopened channels are valid only until the
-        next query call.'''
-        pbase_out = <SBaseOut *>(<char *>phead_in + sizeof(SBaseIn))
-        while <char *>pbase_out < <char *>phead_in + read_size:
-            if (pbase_out.sBaseIn.dwSize >= sizeof(SBaseOut) + sizeof(SBase) +
-                sizeof(FT_DEVICE_LIST_INFO_NODE_OS) and
-                pbase_out.sBaseIn.eType == eResponseEx and
-                (<SBase *>(<char *>pbase_out + sizeof(SBaseOut))).eType ==
-                eFTDIChan):
-                ft_dev_info = <FT_DEVICE_LIST_INFO_NODE_OS *>(<char *>pbase_out
-                    + sizeof(SBaseOut) + sizeof(SBase))
-            elif (pbase_out.sBaseIn.dwSize >= 2 * sizeof(SBaseOut) + 2 *
-                  sizeof(SBase) + sizeof(FT_DEVICE_LIST_INFO_NODE_OS) +
-                  sizeof(SChanInitFTDI) and
-                  pbase_out.sBaseIn.eType == eResponseEx and
-                  (<SBase *>(<char *>pbase_out + 2 *
-                             sizeof(SBaseOut))).eType == eFTDIChan):
-                ft_dev_info = <FT_DEVICE_LIST_INFO_NODE_OS *>(<char *>pbase_out
-                    + 2 * sizeof(SBaseOut) + sizeof(SBase))
-            else:
-                res = UNEXPECTED_READ
-                break
-            found = (self.desc is not None and
-                     bytes(ft_dev_info.Description) == self.desc)
-            found = found or (self.serial is not None and
-                bytes(ft_dev_info.SerialNumber) == self.serial)
-            dev_list.append(dictify_ft_info(ft_dev_info))
-            if found:
-                self.ft_info = ft_dev_info[0]
-                chan = pbase_out.sBaseIn.nChan
-                break
-            i += 1
-            pbase_out = <SBaseOut *>(<char *>pbase_out +
-                                     pbase_out.sBaseIn.dwSize)
-
-        if not found:    # didn't find matching device
-            res = NO_CHAN
-        if chan >= 0 and not res:    # channel was already open
-            self.chan = chan
-            res = ALREADY_OPEN
-        if not res and not alloc:
-            CloseHandle(pipe)
-            free(phead_out)
-            free(phead_in)
-            raise BarstException(msg='Channel is not open and alloc is False.')
-
         if not res:
-            # now we need to open the device
-            pbase = <SBaseIn *>phead_out
-            pbase.dwSize = (2 * sizeof(SBaseIn) + sizeof(SBase) +
-                            sizeof(SChanInitFTDI) + bytes_count)
-            pbase.eType = ePassOn
-            pbase.nChan = man_chan
-            pbase.nError = 0
-            pbase += 1
-            pbase.dwSize = (sizeof(SBaseIn) + sizeof(SBase) +
-                            sizeof(SChanInitFTDI) + bytes_count)
-            pbase.eType = eSet
-            pbase.nChan = i
-            pbase.nError = 0
-            pbase += 1
-            pbase.dwSize = sizeof(SChanInitFTDI) + sizeof(SBase)
-            pbase.eType = eFTDIChanInit
-            init_struct = <SChanInitFTDI *>(<char *>pbase + sizeof(SBase))
-            init_struct.dwBuffIn = 0
-            init_struct.dwBuffOut = 0
-            init_struct.dwBaud = self.baudrate
-            init_struct += 1
-            settings_buff = init_struct
-            memset(settings_buff, 0, bytes_count)
-            for device in self.channels:
-                settings_size += device.copy_settings(<char *>settings_buff +
-                settings_size, bytes_count - settings_size)
-
-            read_size = sizeof(SBaseOut)
-            res = self.write_read(pipe, 2 * sizeof(SBaseIn) + sizeof(SBase) +
-                sizeof(SChanInitFTDI) + bytes_count, phead_out, &read_size,
-                phead_in)
-            if not res:
-                if ((read_size == sizeof(SBaseIn) or read_size ==
-                     sizeof(SBaseOut)) and
-                    (<SBaseIn *>phead_in).dwSize == read_size and
-                    (<SBaseIn *>phead_in).nError):
-                    res = (<SBaseIn *>phead_in).nError
-                elif (read_size != sizeof(SBaseOut) or
-                      (<SBaseIn *>phead_in).dwSize != sizeof(SBaseOut) or
-                      (<SBaseIn *>phead_in).eType != eResponseExL):
-                    res = NO_CHAN
-            if not res:
-                self.chan = (<SBaseOut *>phead_in).sBaseIn.nChan
+            self.chan = phead_in.sBaseIn.nChan
 
-        free(phead_in)
         free(phead_out)
         CloseHandle(pipe)
-        if res and res != ALREADY_OPEN:
-            raise BarstException(res, msg='FTDI devices found:\n'.
-                                 format('\n'.join(map(str, dev_list))))
+        return res
 
-        self.pipe_name = barst_join(self.server.pipe_name, bytes(man_chan),
-                                    bytes(self.chan))
+    cdef object _discover(FTDIChannel self, int stale, alloc=False):
+        '''
+        Discovers the devices of the channel after :meth:`_open_main`, and
+        connects the client. If the channel was created using a `stale`
+        device index, and the channel's device is not the requested one, the
+        channel is deleted and created again with a fresh inventory.
+        '''
         self._populate_settings()
+        if stale and not (
+            (self.desc is not None and
+             bytes(self.ft_info.Description) == self.desc) or
+            (self.serial is not None and
+             bytes(self.ft_info.SerialNumber) == self.serial)):
+            self.close_channel_server()
+            self._open_main(alloc=alloc)
+            self._populate_settings()
         BarstChannel.open_channel(self)
         return self.devices[:]
 
@@ -360,19 +352,26 @@ cdef class FTDIChannel(BarstChannel):
         '''
         Fills in the channel settings and creates the devices for the
         channel.
+
+        The devices are queried in batches of :data:`discovery_batch` queries
+        that are all written to the pipe before their responses are read, and
+        each device's settings are parsed directly from its response, so the
+        number of round trips with the server is minimal.
         '''
-        cdef int res, i = 0
+        cdef int res = 0, i = 0, k, n, done = 0
         cdef HANDLE pipe
         cdef DWORD read_size, pos = 0
-        cdef void *phead_in
-        cdef SBaseIn *pbase
+        cdef DWORD buff_size = max(periph_query_size, MIN_BUFF_OUT, (
+            2 * sizeof(SBaseOut) + 2 * sizeof(SBase) +
+            sizeof(FT_DEVICE_LIST_INFO_NODE_OS) + sizeof(SChanInitFTDI)))
+        cdef SBaseIn base
         cdef char *pbase_out
         cdef FT_DEVICE_LIST_INFO_NODE_OS *ft_dev_info = NULL
         cdef SChanInitFTDI *ft_init = NULL
-        self.devices = []
+        cdef FTDIDevice device
         cdef str dev_code
         cdef dict dev_dict
-        cdef str msg = ''
+        self.devices = []
         from pybarst.ftdi.switch import (FTDISerializerIn, FTDISerializerOut,
                                          FTDIPinIn, FTDIPinOut)
         from pybarst.ftdi.adc import FTDIADC
@@ -380,24 +379,27 @@ cdef class FTDIChannel(BarstChannel):
                     'MltRBrd': FTDISerializerIn, 'PinWBrd': FTDIPinOut,
                     'PinRBrd': FTDIPinIn}
 
-        # request the info for the channel
-        pipe = self.open_pipe('rw')
-        read_size = (2 * sizeof(SBaseOut) + 2 * sizeof(SBase) +
-        sizeof(FT_DEVICE_LIST_INFO_NODE_OS) + sizeof(SChanInitFTDI))
-        pbase = <SBaseIn *>malloc(sizeof(SBaseIn))
-        pbase_out = <char *>malloc(max(read_size, MIN_BUFF_OUT))
-        if (pbase == NULL or pbase_out == NULL):
-            CloseHandle(pipe)
-            free(pbase)
-            free(pbase_out)
+        pbase_out = <char *>malloc(buff_size)
+        if pbase_out == NULL:
             raise BarstException(NO_SYS_RESOURCE)
+        pipe = self.open_pipe('rw')
 
-        pbase.dwSize = sizeof(SBaseIn)
-        pbase.eType = eQuery
-        pbase.nChan = -1
-        pbase.nError = 0
-        res = self.write_read(pipe, sizeof(SBaseIn), pbase, &read_size,
-                              pbase_out)
+        # request the info for the channel, followed by the first batch of
+        # devices, before reading any response
+        base.dwSize = sizeof(SBaseIn)
+        base.eType = eQuery
+        base.nChan = -1
+        base.nError = 0
+        res = self.write_read(pipe, sizeof(SBaseIn), &base, NULL, NULL)
+        n = discovery_batch
+        k = 0
+        while not res and k < n:
+            base.nChan = k
+            res = self.write_read(pipe, sizeof(SBaseIn), &base, NULL, NULL)
+            k += 1
+        read_size = buff_size
+        if not res:
+            res = self.read_message(pipe, &read_size, pbase_out)
         if not res:
             if (read_size == sizeof(SBaseIn) and
                 (<SBaseIn *>pbase_out).dwSize == sizeof(SBaseIn) and
@@ -405,7 +407,6 @@ cdef class FTDIChannel(BarstChannel):
                 res = (<SBaseIn *>pbase_out).nError
         if res:
             CloseHandle(pipe)
-            free(pbase)
             free(pbase_out)
             raise BarstException(res)
 
@@ -444,58 +445,71 @@ cdef class FTDIChannel(BarstChannel):
             res = UNEXPECTED_READ
         if res:
             CloseHandle(pipe)
-            free(pbase)
             free(pbase_out)
             raise BarstException(res)
         self.ft_init = ft_init[0]
         self.ft_info = ft_dev_info[0]
-        for k, v in dictify_ft_info(ft_dev_info).iteritems():
-            setattr(self, k, v)
+        for key, v in dictify_ft_info(ft_dev_info).iteritems():
+            setattr(self, key, v)
         self.chan_min_buff_in = ft_init.dwBuffIn
         self.chan_min_buff_out = ft_init.dwBuffOut
         self.baudrate = ft_init.dwBaud
 
-        # now get the devices info and create them
+        # now read the devices info and create them. Once a query fails, there
+        # are no more devices so the remaining responses are not needed
         self.channels = []
-        while 1:
-            pbase.nChan = i
-            read_size = MIN_BUFF_OUT
-            pos = 0
-            res = self.write_read(pipe, sizeof(SBaseIn), pbase, &read_size,
-                                  pbase_out)
-            if not res:
-                if (read_size == sizeof(SBaseIn) and
-                    (<SBaseIn *>pbase_out).dwSize == sizeof(SBaseIn) and
-                    (<SBaseIn *>pbase_out).nError):
-                    res = (<SBaseIn *>pbase_out).nError
-            if res:
-                break
-
-            if ((<SBaseIn *>pbase_out).dwSize <= read_size and
-                (<SBaseIn *>pbase_out).dwSize >= sizeof(SBaseOut) and
-                (<SBase *>pbase_out).eType == eResponseEx):
-                dev_code = (<SBaseOut *>(pbase_out + pos)).szName
-            else:
-                res = UNEXPECTED_READ
-                break
-
-            if dev_code not in dev_dict:
-                res = 0
-                msg = 'Did not recognize FTDI device "{}"'.format(dev_code)
-                break
-
-            self.devices.append(dev_dict[dev_code](pipe_name=self.pipe_name,
-                                                   chan=i, parent=self))
-            self.devices[-1].open_channel()
-            self.devices[-1].close_channel_client()
-            self.channels.append(self.devices[-1].settings)
-            i += 1
-
-        CloseHandle(pipe)
-        free(pbase)
-        free(pbase_out)
+        try:
+            while not done:
+                while i < n:
+                    read_size = buff_size
+                    res = self.read_message(pipe, &read_size, pbase_out)
+                    if not res:
+                        if (read_size == sizeof(SBaseIn) and
+                            (<SBaseIn *>pbase_out).dwSize == sizeof(SBaseIn)
+                            and (<SBaseIn *>pbase_out).nError):
+                            res = (<SBaseIn *>pbase_out).nError
+                    if res:
+                        done = 1
+                        break
+
+                    if ((<SBaseIn *>pbase_out).dwSize <= read_size and
+                        (<SBaseIn *>pbase_out).dwSize >= sizeof(SBaseOut) and
+                        (<SBase *>pbase_out).eType == eResponseEx):
+                        dev_code = (<SBaseOut *>pbase_out).szName
+                    else:
+                        res = UNEXPECTED_READ
+                        done = 1
+                        break
+
+                    if dev_code not in dev_dict:
+                        done = 1
+                        break
+
+                    device = dev_dict[dev_code](pipe_name=self.pipe_name,
+                                                chan=i, parent=self)
+                    device.parent_chan = self.chan
+                    device._parse_settings(pbase_out, read_size)
+                    self.devices.append(device)
+                    self.channels.append(device.settings)
+                    i += 1
+
+                if done:
+                    break
+                # all the devices in the batch exist, query the next batch
+                n += discovery_batch
+                k = i
+                while not res and k < n:
+                    base.nChan = k
+                    res = self.write_read(pipe, sizeof(SBaseIn), &base, NULL,
+                                          NULL)
+                    k += 1
+                if res:
+                    break
+        finally:
+            CloseHandle(pipe)
+            free(pbase_out)
         if res and res != INVALID_CHANN:
-            raise BarstException(res, msg=msg)
+            raise BarstException(res)
 
     cpdef object set_state(FTDIChannel self, int state, flush=False):
         '''
@@ -602,6 +616,50 @@ cdef class FTDIDevice(BarstChannel):
         if res:
             raise BarstException(res)
 
+    cdef object _query_settings(FTDIDevice self):
+        '''
+        Queries the server for the settings of this device using the device's
+        pipe, and parses them with :meth:`_parse_settings`.
+        '''
+        cdef DWORD read_size = max(periph_query_size, MIN_BUFF_OUT)
+        cdef int res
+        cdef SBaseIn base
+        cdef char *pbase_out = <char *>malloc(read_size)
+        if pbase_out == NULL:
+            raise BarstException(NO_SYS_RESOURCE)
+
+        base.dwSize = sizeof(SBaseIn)
+        base.eType = eQuery
+        base.nChan = self.chan
+        base.nError = 0
+        res = self.write_read(self.pipe, sizeof(SBaseIn), &base, &read_size,
+                              pbase_out)
+        if not res:
+            if (read_size == sizeof(SBaseIn) and
+                (<SBaseIn *>pbase_out).dwSize == sizeof(SBaseIn) and
+                (<SBaseIn *>pbase_out).nError):
+                res = (<SBaseIn *>pbase_out).nError
+        try:
+            if res:
+                raise BarstException(res)
+            self._parse_settings(pbase_out, read_size)
+        finally:
+            free(pbase_out)
+
+    cdef object _parse_settings(FTDIDevice self, char *pbase_out,
+                                DWORD read_size):
+        '''
+        Parses the server's response, of size `read_size`, to a query of
+        this device's settings, and fills in the device's settings from it.
+        Each device type overwrites this method.
+
+        It is used both when the device is opened and when the
+        :class:`FTDIChannel` discovers its devices, in which case the
+        device doesn't open its own pipe.
+        '''
+        raise BarstException(msg='{} cannot parse device settings'.format(
+            self.__class__.__name__))
+
     cdef object _send_trigger(FTDIDevice self):
         cdef SBaseIn *pbase_out = <SBaseIn *>malloc(2 * sizeof(SBaseIn))
         cdef SBaseIn *pbase
@@ -626,3 +684,57 @@ cdef class FTDIDevice(BarstChannel):
         free(pbase_out)
         if res:
             raise BarstException(res)
+
+
+def open_channels(channels, alloc=False, threads=None):
+    '''
+    Opens many :class:`FTDIChannel` instances at once, and returns a list
+    with the result of each's :meth:`FTDIChannel.open_channel`.
+
+    The channels are first found and, if needed, created one after the other
+    using their server's main pipe. Then, the devices of all the channels
+    are discovered in parallel using the channels' own pipes.
+
+    :Parameters:
+
+        `channels`: list
+            A list of :class:`FTDIChannel` instances to open.
+        `alloc`: bool
+            Whether to create the channels on the server if they don't
+            exist yet. See :meth:`FTDIChannel.open_channel`. Defaults to False.
+        `threads`: int
+            The number of threads used to discover the devices. If None, a
+            thread is used for each channel. Defaults to None.
+
+    :returns:
+        A list with the :attr:`FTDIChannel.devices` of each channel.
+
+    For example::
+
+        >>> ft1 = FTDIChannel(channels=[], server=server, \
+desc='Birch Board rev1 A')
+        >>> ft2 = FTDIChannel(channels=[], server=server, \
+desc='Birch Board rev1 B')
+        >>> devs1, devs2 = open_channels([ft1, ft2])
+    '''
+    from multiprocessing.pool import ThreadPool
+    cdef FTDIChannel chan
+    cdef list chans = list(channels)
+
+    cdef list stale = []
+    if not chans:
+        return []
+
+    for chan in chans:
+        stale.append(chan._open_main(alloc=alloc))
+
+    def discover(args):
+        cdef FTDIChannel chan = args[0]
+        return chan._discover(args[1], alloc=alloc)
+
+    pool = ThreadPool(threads or len(chans))
+    try:
+        return pool.map(discover, zip(chans, stale))
+    finally:
+        pool.close()
+        pool.join()
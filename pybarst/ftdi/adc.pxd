@@ -316,3 +316,7 @@ cdef class FTDIADC(FTDIDevice):
     cdef SADCInit adc_settings
 
     cpdef object read(FTDIADC self)
+    cdef int _start_stream(FTDIADC self) except -1
+
+    cdef object _parse_settings(FTDIADC self, char *pbase_out,
+                                DWORD read_size)
@@ -309,38 +309,19 @@ desc='Birch Board rev1 B')
         '''
         See :meth:`~pybarst.core.server.BarstChannel.open_channel` for details.
         '''
-        cdef int res
-        cdef DWORD read_size, pos = 0
-        cdef SBaseIn *pbase
-        cdef char *pbase_out
+        FTDIDevice.open_channel(self)
+        self._query_settings()
+
+    cdef object _parse_settings(FTDIADC self, char *pbase_out,
+                                DWORD read_size):
+        '''
+        See :meth:`~pybarst.ftdi.FTDIDevice._parse_settings`.
+        '''
+        cdef DWORD pos = 0
+        cdef int res = 0
         cdef SADCInit *adc_init = NULL
         cdef SInitPeriphFT *ft_init = NULL
         cdef unsigned char mutltiplier, constant, bottom, twin = 1
-        FTDIDevice.open_channel(self)
-
-        read_size = (sizeof(SBaseOut) + 2 * sizeof(SBase) +
-                     sizeof(SADCInit) + sizeof(SInitPeriphFT))
-        pbase = <SBaseIn *>malloc(sizeof(SBaseIn))
-        pbase_out = <char *>malloc(max(read_size, MIN_BUFF_OUT))
-        if pbase == NULL or pbase_out == NULL:
-            free(pbase)
-            free(pbase_out)
-            raise BarstException(NO_SYS_RESOURCE)
-
-        pbase.dwSize = sizeof(SBaseIn)
-        pbase.eType = eQuery
-        pbase.nChan = self.chan
-        pbase.nError = 0
-        res = self.write_read(self.pipe, sizeof(SBaseIn), pbase, &read_size,
-                              pbase_out)
-        if not res:
-            if (read_size == sizeof(SBaseIn) and
-                pbase_out.dwSize == sizeof(SBaseIn) and pbase_out.nError):
-                res = pbase_out.nError
-        free(pbase)
-        if res:
-            free(pbase_out)
-            raise BarstException(res)
 
         while pos < read_size:
             if ((<SBaseIn *>(pbase_out + pos)).dwSize <= read_size - pos and
@@ -369,7 +350,6 @@ desc='Birch Board rev1 B')
         if adc_init == NULL or ft_init == NULL:
             res = UNEXPECTED_READ
         if res:
-            free(pbase_out)
             raise BarstException(res)
 
         self.ft_periph = ft_init[0]
@@ -409,8 +389,6 @@ desc='Birch Board rev1 B')
         reverse=self.adc_settings.bReverseBytes,
         rate_filter=self.adc_settings.ucRateFilter)
 
-        free(pbase_out)
-
     def get_conversion_factors(FTDIADC self):
         '''Returns the factors used to scale the raw data into floating points.
 
@@ -420,6 +398,15 @@ desc='Birch Board rev1 B')
         '''
         return self.adc_settings.ucBitsPerData, self.multiplier, self.subtractend
 
+    cdef int _start_stream(FTDIADC self) except -1:
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._start_stream`.
+        '''
+        if not self.running:
+            self._send_trigger()
+            self.running = 1
+        return 0
+
     cpdef object read(FTDIADC self):
         '''
         Requests the server to read and send the next available data from the
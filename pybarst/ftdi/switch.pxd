@@ -3,6 +3,8 @@ include "../barst_defines.pxi"
 include "../inline_funcs.pxi"
 
 from pybarst.ftdi._ftdi cimport FTDIDevice, FTDISettings
+from pybarst.core.server cimport PreparedWrite
+from pybarst.core.edges cimport EdgeDetector
 
 
 cdef class SerializerSettings(FTDISettings):
@@ -64,14 +66,78 @@ cdef class SerializerSettings(FTDISettings):
 cdef class FTDISerializer(FTDIDevice):
     cdef SValveInit serial_settings
 
+    cdef object _parse_settings(FTDISerializer self, char *pbase_out,
+                                DWORD read_size)
+
 
 cdef class FTDISerializerIn(FTDISerializer):
+    cdef SBaseOut *read_buff
+    '''
+    The buffer into which data is read from the server. It is allocated once
+    when the channel is opened and reused for every read.
+    '''
+    cdef DWORD read_buff_size
+    cdef unsigned char *last_states
+    '''
+    The states of the lines (one byte per line) from the previous read, used
+    to track changes between reads. Only valid when `has_last` is true.
+    '''
+    cdef unsigned char *packed_states
+    cdef int has_last
+
     cpdef object read(FTDISerializerIn self)
+    cdef int _start_stream(FTDISerializerIn self) except -1
+    cpdef object read_packed(FTDISerializerIn self, object as_int=*)
+    cpdef object read_changes(FTDISerializerIn self)
+    cpdef object read_events(FTDISerializerIn self, EdgeDetector detector,
+                             DWORD max_samples=*)
+
+    cdef unsigned char *_read_states(FTDISerializerIn self,
+                                     double *t) except NULL
 
 
 cdef class FTDISerializerOut(FTDISerializer):
     cpdef object write(FTDISerializerOut self, object set_high=*,
                        object set_low=*)
+    cpdef PreparedWrite prepare(FTDISerializerOut self, object set_high=*,
+                                object set_low=*)
+
+
+cdef class _CoalescedBatch(object):
+    cdef int done
+    cdef object t
+    cdef object error
+
+
+cdef class CoalescedSerializerOut(object):
+    cdef public FTDISerializerOut device
+    '''
+    The :class:`FTDISerializerOut` to which the coalesced writes are sent.
+    Read only.
+    '''
+    cdef public double window
+    '''
+    The duration, in seconds, during which concurrent :meth:`write` calls
+    are merged into a single write to the server.
+    '''
+    cdef public object last_time
+    '''
+    The server time of the last write sent to the server, or None if nothing
+    was sent yet. Read only.
+    '''
+    cdef list shadow
+    '''
+    The state of each line as last written to the server: None when unknown,
+    otherwise False or True.
+    '''
+    cdef dict pending
+    cdef _CoalescedBatch batch
+    cdef object cond
+    cdef object write_lock
+
+    cpdef object write(CoalescedSerializerOut self, object set_high=*,
+                       object set_low=*)
+    cpdef object invalidate(CoalescedSerializerOut self)
 
 
 cdef class PinSettings(FTDISettings):
@@ -118,11 +184,55 @@ cdef class PinSettings(FTDISettings):
 cdef class FTDIPin(FTDIDevice):
     cdef SPinInit pin_settings
 
+    cdef object _parse_settings(FTDIPin self, char *pbase_out,
+                                DWORD read_size)
+
 
 cdef class FTDIPinIn(FTDIPin):
+    cdef SBaseOut *read_buff
+    '''
+    The buffer into which data is read from the server. It is allocated on
+    the first read and reused for later reads.
+    '''
+    cdef DWORD read_buff_size
+
     cpdef object read(FTDIPinIn self)
+    cdef int _start_stream(FTDIPinIn self) except -1
+    cpdef object read_events(FTDIPinIn self, EdgeDetector detector,
+                             DWORD max_samples=*)
+
+    cdef unsigned char *_read_states(FTDIPinIn self, double *t) except NULL
+
+
+cdef class PinProgram(object):
+    cdef public list writes
+    '''
+    A list of the writes that make up the program. Each element is a list of
+    (`repeat`, `value`, `mask`) 3-tuples that can be passed as the `data`
+    parameter of :meth:`FTDIPinOut.write`, and whose total `repeat` count does
+    not exceed :attr:`PinSettings.num_bytes`. Read only.
+    '''
+    cdef public unsigned long long duration
+    '''
+    The number of bytes (clock ticks) written by the program, at the channel's
+    :attr:`~pybarst.ftdi.FTDIChannel.chan_baudrate`. Read only.
+    '''
+    cdef public DWORD baudrate
+    '''
+    The channel baud rate with which the program was compiled. Read only.
+    '''
+    cdef public unsigned char mask
+    '''
+    The pins controlled by the program. Pins not in the mask are never
+    changed by the program. Read only.
+    '''
 
 
 cdef class FTDIPinOut(FTDIPin):
     cpdef object write(FTDIPinOut self, object data=*,
                        object buff_mask=*, object buffer=*)
+    cpdef PreparedWrite prepare(FTDIPinOut self, object data=*,
+                                object buff_mask=*, object buffer=*)
+    cpdef object compile_waveform(FTDIPinOut self, object waveforms,
+                                  object units=*)
+    cpdef object write_program(FTDIPinOut self, PinProgram program)
@@ -10,7 +10,7 @@ by the FTDI digital pins.
 
 _all__ = ('SerializerSettings', 'FTDISerializer', 'FTDISerializerIn',
           'FTDISerializerOut', 'PinSettings', 'FTDIPin', 'FTDIPinIn',
-          'FTDIPinOut')
+          'FTDIPinOut', 'PinProgram', 'CoalescedSerializerOut')
 
 
 cdef extern from "stdlib.h" nogil:
@@ -21,8 +21,19 @@ cdef extern from "string.h":
     void *memset (void *, int, size_t)
 
 
+import threading
+import time
+
 from pybarst.core.exception import BarstException
 
+cdef dict _program_cache = {}
+''' The :class:`PinProgram` instances compiled by
+:meth:`FTDIPinOut.compile_waveform`, keyed by their waveforms and channel
+settings.
+'''
+cdef int max_cached_programs = 256
+''' The maximum number of programs cached, after which the cache is cleared.
+'''
 
 cdef class SerializerSettings(FTDISettings):
     '''
@@ -151,37 +162,18 @@ cdef class FTDISerializer(FTDIDevice):
         '''
         See :meth:`~pybarst.core.server.BarstChannel.open_channel` for details.
         '''
-        cdef DWORD read_size, pos = 0
-        cdef int res
-        cdef SBaseIn *pbase
-        cdef char *pbase_out
-        cdef SValveInit *multi_init = NULL
-        cdef SInitPeriphFT *ft_init = NULL
         FTDIDevice.open_channel(self)
+        self._query_settings()
 
-        read_size = (sizeof(SBaseOut) + 2 * sizeof(SBase) + sizeof(SValveInit)
-                     + sizeof(SInitPeriphFT))
-        pbase = <SBaseIn *>malloc(sizeof(SBaseIn))
-        pbase_out = <char *>malloc(max(read_size, MIN_BUFF_OUT))
-        if (pbase == NULL or pbase_out == NULL):
-            free(pbase)
-            free(pbase_out)
-            raise BarstException(NO_SYS_RESOURCE)
-
-        pbase.dwSize = sizeof(SBaseIn)
-        pbase.eType = eQuery
-        pbase.nChan = self.chan
-        pbase.nError = 0
-        res = self.write_read(self.pipe, sizeof(SBaseIn), pbase,
-                              &read_size, pbase_out)
-        if not res:
-            if (read_size == sizeof(SBaseIn) and
-                pbase_out.dwSize == sizeof(SBaseIn) and pbase_out.nError):
-                res = pbase_out.nError
-        free(pbase)
-        if res:
-            free(pbase_out)
-            raise BarstException(res)
+    cdef object _parse_settings(FTDISerializer self, char *pbase_out,
+                                DWORD read_size):
+        '''
+        See :meth:`~pybarst.ftdi.FTDIDevice._parse_settings`.
+        '''
+        cdef DWORD pos = 0
+        cdef int res = 0
+        cdef SValveInit *multi_init = NULL
+        cdef SInitPeriphFT *ft_init = NULL
 
         while pos < read_size:
             if ((<SBaseIn *>(pbase_out + pos)).dwSize <= read_size - pos and
@@ -212,7 +204,6 @@ cdef class FTDISerializer(FTDIDevice):
         if multi_init == NULL or ft_init == NULL:
             res = UNEXPECTED_READ
         if res:
-            free(pbase_out)
             raise BarstException(res)
 
         self.ft_periph = ft_init[0]
@@ -229,7 +220,6 @@ cdef class FTDISerializer(FTDIDevice):
         data_bit=multi_init.ucData, latch_bit=multi_init.ucLatch,
         continuous=multi_init.bContinuous,
         output=self.barst_chan_type == 'MltWBrd')
-        free(pbase_out)
 
 
 cdef class FTDISerializerIn(FTDISerializer):
@@ -262,60 +252,69 @@ cdef class FTDISerializerIn(FTDISerializer):
  True, True, False, True, True, True, True, False, False])
     '''
 
-    cpdef object read(FTDISerializerIn self):
-        ''' Requests the server to read from the serial to parallel input
-        device. This method will wait until the server sends data or an error
-        message, thereby tying up this thread.
-
-        If :attr:`SerializerSettings.continuous` is `False`, each call triggers
-        the server to read from the device which is then sent to the client. If
-        :attr:`SerializerSettings.continuous` is `True`, after the first call
-        to :meth:`read` the server will continuously read from the device and
-        send the results back to the client. This means that if the client
-        doesn't call :meth:`read` frequently enough data will accumulate in the
-        pipe. Also, the data returned might have been acquired before the
-        current :meth:`read` was called.
+    def __cinit__(FTDISerializerIn self, *args, **kwargs):
+        self.read_buff = NULL
+        self.read_buff_size = 0
+        self.last_states = NULL
+        self.packed_states = NULL
+        self.has_last = 0
 
-        To cancel a read request while the read is still waiting, from another
-        thread you must call
-        :meth:`~pybarst.core.server.BarstChannel.close_channel_client`, or
-        :meth:`~pybarst.core.server.BarstChannel.close_channel_server`, or just
-        delete the server, which will cause this method to return with an
-        error.
+    def __dealloc__(FTDISerializerIn self):
+        free(self.read_buff)
+        free(self.last_states)
+        free(self.packed_states)
 
-        A more gentle way of canceling a read request while not currently
-        waiting in :meth:`read`, is to call
-        :meth:`~pybarst.core.server.BarstChannel.set_state` to set it inactive,
-        or :meth:`cancel_read`, both of which will cause the next read
-        operation to return with an error, but will not delete/close the
-        channel. For the latter method, once :meth:`read` returned with an
-        error, a further call to :meth:`read` will cause the reading to start
-        again. See those methods for more details.
+    cpdef object open_channel(FTDISerializerIn self):
+        '''
+        See :meth:`FTDISerializer.open_channel` for details.
 
-        Before this method can be called, :meth:`FTDISerializer.open_channel`
-        must be called and the device must be set to active with
-        :meth:`~pybarst.core.server.BarstChannel.set_state`.
+        In addition, it (re-)allocates the buffers used when reading, and
+        resets the state used by :meth:`read_changes` to track changes.
+        '''
+        cdef DWORD n
+        FTDISerializer.open_channel(self)
+
+        free(self.read_buff)
+        free(self.last_states)
+        free(self.packed_states)
+        self.has_last = 0
+        n = self.serial_settings.dwBoards * 8
+        self.read_buff_size = (sizeof(SBaseOut) + sizeof(SBase) +
+                               n * sizeof(char))
+        self.read_buff = <SBaseOut *>malloc(self.read_buff_size)
+        self.last_states = <unsigned char *>malloc(n * sizeof(char))
+        self.packed_states = <unsigned char *>malloc(
+            self.serial_settings.dwBoards * sizeof(char))
+        if (self.read_buff == NULL or self.last_states == NULL or
+            self.packed_states == NULL):
+            free(self.read_buff)
+            free(self.last_states)
+            free(self.packed_states)
+            self.read_buff = NULL
+            self.last_states = NULL
+            self.packed_states = NULL
+            raise BarstException(NO_SYS_RESOURCE)
 
-        :returns:
-            2-tuple of (`time`, `data`). `time` is the time that the data was
-            read in server time,
-            :meth:`pybarst.core.server.BarstServer.clock`.
-            `data` is a list of size 8 * :attr:`SerializerSettings.num_boards`,
-            where each element corresponds (True / False) to the state of the
-            corresponding pin on the 75HC589.
+    cdef unsigned char *_read_states(FTDISerializerIn self,
+                                     double *t) except NULL:
+        '''
+        Does the actual reading from the server. It returns a pointer to the
+        states read, one byte per line, which is valid until the next read.
+        The server time of the read is stored in `t`.
 
-            The order in the list is for the lowest element, 0, to represent
-            the closest (farthest)? port in the device.
+        The states of the previous read, if any, are still in
+        :attr:`last_states` when this returns, it's up to the caller to
+        update them.
         '''
-        cdef DWORD read_size = (sizeof(SBaseOut) + sizeof(SBase) +
-            self.serial_settings.dwBoards * 8 * sizeof(char))
-        cdef DWORD read_size_out = read_size, i
+        cdef DWORD read_size = self.read_buff_size
+        cdef DWORD read_size_out = read_size
         cdef int res = 0
-        cdef SBaseOut *pbase
-        cdef list vals = [False, ] * (<int>self.serial_settings.dwBoards * 8)
+        cdef SBaseOut *pbase = self.read_buff
         cdef int r
-        cdef char *states
-        cdef tuple result
+
+        if pbase == NULL:
+            raise BarstException(msg='You cannot read until the channel '
+                                 'has been opened')
 
         '''
         This is only important for continuous mode.
@@ -336,16 +335,10 @@ cdef class FTDISerializerIn(FTDISerializer):
             if self.serial_settings.bContinuous:
                 self.running = 1
 
-        pbase = <SBaseOut *>malloc(read_size)
-        if pbase == NULL:
-            raise BarstException(NO_SYS_RESOURCE)
-
         with nogil:
             r = ReadFile(self.pipe, pbase, read_size, &read_size_out, NULL)
         if not r:
-            res = WIN_ERROR(GetLastError())
-            free(pbase)
-            raise BarstException(res)
+            raise BarstException(WIN_ERROR(GetLastError()))
 
         if ((read_size_out != sizeof(SBaseIn) and
              read_size_out != sizeof(SBaseOut) and
@@ -367,15 +360,234 @@ cdef class FTDISerializerIn(FTDISerializer):
             res = DEVICE_CLOSING
         if res:
             self.running = 0
-            free(pbase)
             raise BarstException(res)
 
-        states = <char *>pbase + sizeof(SBaseOut) + sizeof(SBase)
-        for i in range(self.serial_settings.dwBoards * 8):
+        t[0] = pbase.dDouble
+        return <unsigned char *>pbase + sizeof(SBaseOut) + sizeof(SBase)
+
+    cdef int _start_stream(FTDISerializerIn self) except -1:
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._start_stream`.
+        '''
+        if not self.serial_settings.bContinuous:
+            raise BarstException(msg='Only a continuous channel can be '
+                                 'streamed')
+        if not self.running:
+            self._send_trigger()
+            self.running = 1
+        return 0
+
+    cpdef object read(FTDISerializerIn self):
+        ''' Requests the server to read from the serial to parallel input
+        device. This method will wait until the server sends data or an error
+        message, thereby tying up this thread.
+
+        If :attr:`SerializerSettings.continuous` is `False`, each call triggers
+        the server to read from the device which is then sent to the client. If
+        :attr:`SerializerSettings.continuous` is `True`, after the first call
+        to :meth:`read` the server will continuously read from the device and
+        send the results back to the client. This means that if the client
+        doesn't call :meth:`read` frequently enough data will accumulate in the
+        pipe. Also, the data returned might have been acquired before the
+        current :meth:`read` was called.
+
+        To cancel a read request while the read is still waiting, from another
+        thread you must call
+        :meth:`~pybarst.core.server.BarstChannel.close_channel_client`, or
+        :meth:`~pybarst.core.server.BarstChannel.close_channel_server`, or just
+        delete the server, which will cause this method to return with an
+        error.
+
+        A more gentle way of canceling a read request while not currently
+        waiting in :meth:`read`, is to call
+        :meth:`~pybarst.core.server.BarstChannel.set_state` to set it inactive,
+        or :meth:`cancel_read`, both of which will cause the next read
+        operation to return with an error, but will not delete/close the
+        channel. For the latter method, once :meth:`read` returned with an
+        error, a further call to :meth:`read` will cause the reading to start
+        again. See those methods for more details.
+
+        Before this method can be called, :meth:`FTDISerializer.open_channel`
+        must be called and the device must be set to active with
+        :meth:`~pybarst.core.server.BarstChannel.set_state`.
+
+        See also :meth:`read_packed` and :meth:`read_changes` for reading
+        without creating a list element for each line.
+
+        :returns:
+            2-tuple of (`time`, `data`). `time` is the time that the data was
+            read in server time,
+            :meth:`pybarst.core.server.BarstServer.clock`.
+            `data` is a list of size 8 * :attr:`SerializerSettings.num_boards`,
+            where each element corresponds (True / False) to the state of the
+            corresponding pin on the 75HC589.
+
+            The order in the list is for the lowest element, 0, to represent
+            the closest (farthest)? port in the device.
+        '''
+        cdef DWORD i, n = self.serial_settings.dwBoards * 8
+        cdef double t
+        cdef unsigned char *states = self._read_states(&t)
+        cdef list vals = [False, ] * (<int>n)
+
+        for i in range(n):
             vals[i] = states[i] != 0
-        result = (pbase.dDouble, vals)
-        free(pbase)
-        return result
+        memcpy(self.last_states, states, n)
+        self.has_last = 1
+        return t, vals
+
+    cpdef object read_packed(FTDISerializerIn self, object as_int=False):
+        '''
+        Similar to :meth:`read`, except that the states of the lines are
+        returned packed as bits, rather than as a list of bools. This avoids
+        creating a python object for each line.
+
+        :Parameters:
+
+            `as_int`: bool
+                Whether to return the states as a python int, rather than as
+                bytes. Defaults to `False`.
+
+        :returns:
+            2-tuple of (`time`, `data`). `time` is the same as in :meth:`read`.
+            If `as_int` is `False`, `data` is a bytes instance of size
+            :attr:`SerializerSettings.num_boards`, where bit `j` of byte `i`
+            is the state of line `8 * i + j`. So e.g. the state of line 10 is
+            `data[1] & (1 << 2)`. If `as_int` is `True`, `data` is an int
+            where bit `i` is the state of line `i`.
+
+        For example::
+
+            >>> t, data = dev.read_packed()
+            >>> print t, repr(data)
+            7.350556310186866 '\xed\x7b'
+            >>> t, data = dev.read_packed(as_int=True)
+            >>> print t, bin(data)
+            7.35192418239101 0b111101111101101
+        '''
+        cdef DWORD i, n = self.serial_settings.dwBoards
+        cdef double t
+        cdef unsigned char *states = self._read_states(&t)
+        cdef unsigned char *packed = self.packed_states
+        cdef unsigned char b
+
+        for i in range(n):
+            b = (((states[0] != 0)) | ((states[1] != 0) << 1) |
+                 ((states[2] != 0) << 2) | ((states[3] != 0) << 3) |
+                 ((states[4] != 0) << 4) | ((states[5] != 0) << 5) |
+                 ((states[6] != 0) << 6) | ((states[7] != 0) << 7))
+            packed[i] = b
+            states += 8
+        memcpy(self.last_states, states - 8 * n, 8 * n)
+        self.has_last = 1
+
+        if not as_int:
+            return t, packed[:n]
+
+        val = 0
+        for i in range(n, 0, -1):
+            val = (val << 8) | packed[i - 1]
+        return t, val
+
+    cpdef object read_changes(FTDISerializerIn self):
+        '''
+        Similar to :meth:`read`, except that only the lines whose state
+        changed since the previous read (by any of the read methods) are
+        returned. The previous states are kept internally, so in continuous
+        mode, a client only interested in the transitions never has to create
+        objects for lines that did not change.
+
+        For the first read after :meth:`open_channel`, all the lines are
+        considered to have changed.
+
+        :returns:
+            3-tuple of (`time`, `set_high`, `set_low`). `time` is the same as
+            in :meth:`read`. `set_high` is a list of the indices of the lines
+            that changed from low to high, and `set_low` is a list of the
+            indices of the lines that changed from high to low. Both lists
+            are in increasing order and are empty if nothing changed.
+
+        For example::
+
+            >>> print dev.read_changes()
+            (7.350556310186866, [0, 2, 3, 5, 6, 7, 8, 9, 11, 12, 13, 14], \
+[1, 4, 10, 15])
+            >>> print dev.read_changes()
+            (7.35192418239101, [], [])
+            >>> print dev.read_changes()
+            (7.35329712923011, [4], [12])
+        '''
+        cdef DWORD i, n = self.serial_settings.dwBoards * 8
+        cdef double t
+        cdef unsigned char *states = self._read_states(&t)
+        cdef unsigned char *last = self.last_states
+        cdef unsigned char val
+        cdef list set_high = []
+        cdef list set_low = []
+
+        if not self.has_last:
+            for i in range(n):
+                if states[i]:
+                    set_high.append(i)
+                else:
+                    set_low.append(i)
+        else:
+            for i in range(n):
+                val = states[i] != 0
+                if val != (last[i] != 0):
+                    if val:
+                        set_high.append(i)
+                    else:
+                        set_low.append(i)
+        memcpy(last, states, n)
+        self.has_last = 1
+        return t, set_high, set_low
+
+    cpdef object read_events(FTDISerializerIn self, EdgeDetector detector,
+                             DWORD max_samples=0):
+        '''
+        Similar to :meth:`read_changes`, except that it keeps reading until
+        at least one line changed, and the changes are extracted by
+        `detector`, which can debounce the lines.
+
+        :Parameters:
+
+            `detector`: :class:`~pybarst.core.edges.EdgeDetector`
+                The detector, tracking
+                8 * :attr:`SerializerSettings.num_boards` lines, that keeps
+                the states of the lines between calls. The first sample it
+                processes only sets the states.
+            `max_samples`: unsigned int
+                If not zero, the method returns after reading this many
+                samples, even if nothing changed. Defaults to 0.
+
+        :returns:
+            A list of (`time`, `line`, `state`) events, see
+            :class:`~pybarst.core.edges.EdgeDetector`. It can only be empty
+            when `max_samples` is not zero.
+
+        For example::
+
+            >>> detector = EdgeDetector(16)
+            >>> print dev.read_events(detector)
+            [(7.35329712923011, 4, 1), (7.35329712923011, 12, 0)]
+        '''
+        cdef DWORD n = self.serial_settings.dwBoards * 8
+        cdef DWORD count = 0
+        cdef double t
+        cdef unsigned char *states
+        cdef list events = []
+
+        if detector.num_lines != n:
+            raise BarstException(msg='The detector must track {} lines, not '
+                                 '{}'.format(n, detector.num_lines))
+        while not events and (not max_samples or count < max_samples):
+            states = self._read_states(&t)
+            memcpy(self.last_states, states, n)
+            self.has_last = 1
+            detector.feed_states(t, states, events)
+            count += 1
+        return events
 
     cpdef object cancel_read(FTDISerializerIn self, flush=False):
         '''
@@ -464,25 +676,42 @@ cdef class FTDISerializerOut(FTDISerializer):
             :meth:`pybarst.core.server.BarstServer.clock`, when the data was
             written.
         '''
+        return self.send(self.prepare(set_high=set_high, set_low=set_low))
+
+    cpdef PreparedWrite prepare(FTDISerializerOut self, object set_high=[],
+                                object set_low=[]):
+        '''
+        Encodes the message that :meth:`write` would send to the server for
+        these parameters, so that it can be sent repeatedly and with minimal
+        overhead with :meth:`~pybarst.core.server.BarstChannel.send`.
+
+        The parameters are the same as for :meth:`write`. The returned message
+        can only be sent by this instance, and becomes invalid once the
+        channel is closed.
+
+        :returns:
+            A :class:`~pybarst.core.server.PreparedWrite` instance.
+
+        For example::
+
+            >>> msg = dev.prepare(set_high=[0, 5], set_low=[3])
+            >>> print dev.send(msg)
+            0.01900274788
+        '''
         cdef SBaseIn *pbase
-        cdef SBaseIn *pbase_out
         cdef SValveData *states
         cdef unsigned short idx
         cdef DWORD write_size = (2 * sizeof(SBaseIn) + sizeof(SBase) +
             sizeof(SValveData) * (len(set_high) + len(set_low)))
-        cdef DWORD read_size = sizeof(SBaseOut)
-        cdef SBaseOut base_read
-        cdef int res
+        cdef PreparedWrite prepared = PreparedWrite()
 
         if (not set_high) and not set_low:
             raise BarstException(
                 msg='You have not provided any data to write.')
-        pbase_out = <SBaseIn *>malloc(write_size)
-        if pbase_out == NULL:
-            raise BarstException(NO_SYS_RESOURCE)
-        memset(pbase_out, 0, write_size)
+        pbase = <SBaseIn *>prepared.alloc(write_size)
+        prepared.channel = self
+        prepared.chan = self.chan
 
-        pbase = pbase_out
         pbase.dwSize = write_size
         pbase.eType = ePassOn
         pbase.nChan = self.chan
@@ -496,7 +725,7 @@ cdef class FTDISerializerOut(FTDISerializer):
         pbase.dwSize = write_size - 2 * sizeof(SBaseIn)
         pbase.eType = eFTDIMultiWriteData
 
-        states = <SValveData *>(<char *>pbase_out + sizeof(SBase) +
+        states = <SValveData *>(<char *>prepared.msg + sizeof(SBase) +
                                 2 * sizeof(SBaseIn))
         for idx in set_low:
             states.usIndex = idx
@@ -505,22 +734,167 @@ cdef class FTDISerializerOut(FTDISerializer):
             states.usIndex = idx
             states.bValue = True
             states += 1
+        return prepared
 
-        res = self.write_read(self.pipe, write_size, pbase_out, &read_size,
-                              &base_read);
-        if not res:
-            if ((read_size != sizeof(SBaseOut) and
-                 read_size != sizeof(SBaseIn)) or
-                ((read_size == sizeof(SBaseIn) or
-                  base_read.sBaseIn.eType != eResponseExD) and
-                 not base_read.sBaseIn.nError)):
-                res = UNEXPECTED_READ
-            else:
-                res = base_read.sBaseIn.nError
-        free(pbase_out)
-        if res:
-            raise BarstException(res)
-        return base_read.dDouble
+
+cdef class _CoalescedBatch(object):
+    '''
+    The result of a single coalesced write, shared by all the
+    :meth:`CoalescedSerializerOut.write` calls merged into it.
+    '''
+
+    def __cinit__(_CoalescedBatch self):
+        self.done = 0
+        self.t = None
+        self.error = None
+
+
+cdef class CoalescedSerializerOut(object):
+    '''
+    Coalesces writes to a :class:`FTDISerializerOut` device.
+
+    It keeps a local shadow copy of the states of all the
+    8 * :attr:`SerializerSettings.num_boards` lines as last written, and only
+    sends the changes that are not already set. Additionally, all the
+    :meth:`write` calls made, e.g. from different threads, within
+    :attr:`window` seconds of each other are merged into a single write to the
+    server. Every call then returns the server time of that single write.
+
+    The shadow states are only aware of the writes done through this
+    instance. If other clients also write to the device, :meth:`invalidate`
+    should be called so that all the requested states are sent again.
+
+    :Parameters:
+
+        `device`: :class:`FTDISerializerOut`
+            The device to which to write. It should be opened and active
+            before calling :meth:`write`.
+        `window`: float
+            The duration, in seconds, to wait for more writes before
+            sending them to the server. If zero, there's no waiting, but
+            writes made while a previous write is being sent are still merged.
+            Defaults to 0.001.
+
+    For example::
+
+        >>> coalesced = CoalescedSerializerOut(dev, window=0.002)
+        >>> coalesced.write(set_high=[0, 5], set_low=[3])
+        0.01900274788
+        >>> # nothing is sent because the lines are already in these states
+        >>> coalesced.write(set_high=[5], set_low=[3])
+        0.01900274788
+    '''
+
+    def __init__(CoalescedSerializerOut self, FTDISerializerOut device,
+                 double window=0.001, **kwargs):
+        super(CoalescedSerializerOut, self).__init__(**kwargs)
+        self.device = device
+        self.window = window
+        self.last_time = None
+        self.pending = {}
+        self.batch = None
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.shadow = [None, ] * (8 * device.serial_settings.dwBoards)
+
+    cpdef object write(CoalescedSerializerOut self, object set_high=[],
+                       object set_low=[]):
+        '''
+        Requests to update the states of some lines of the device. The
+        parameters are the same as :meth:`FTDISerializerOut.write`. If a line
+        is requested by several calls in the same coalesced write, the last
+        request wins.
+
+        The method blocks until the coalesced write containing these changes
+        was sent to the server, or raises the exception raised when sending
+        it.
+
+        :returns:
+            float. The server time,
+            :meth:`pybarst.core.server.BarstServer.clock`, when the coalesced
+            write was written. If none of the merged changes needed to be sent
+            because the lines were already in the requested states, the time
+            of the last write sent is returned instead.
+        '''
+        cdef _CoalescedBatch batch
+        cdef int leader = 0
+        cdef int n = len(self.shadow)
+        cdef dict pending
+        cdef list high = [], low = [], shadow = self.shadow
+
+        if (not set_high) and not set_low:
+            raise BarstException(
+                msg='You have not provided any data to write.')
+        for idx in list(set_high) + list(set_low):
+            if idx < 0 or idx >= n:
+                raise BarstException(msg='Line index {} is not between 0 '
+                                     'and {}'.format(idx, n - 1))
+
+        with self.cond:
+            for idx in set_low:
+                self.pending[idx] = False
+            for idx in set_high:
+                self.pending[idx] = True
+            if self.batch is None:
+                self.batch = _CoalescedBatch()
+                leader = 1
+            batch = self.batch
+
+            if not leader:
+                while not batch.done:
+                    self.cond.wait()
+                if batch.error is not None:
+                    raise batch.error
+                return batch.t
+
+        if self.window > 0:
+            time.sleep(self.window)
+
+        # only one batch is sent at a time, a new batch collects requests
+        # while this one is sent
+        with self.write_lock:
+            with self.cond:
+                pending = self.pending
+                self.pending = {}
+                self.batch = None
+
+            for idx, val in pending.items():
+                if shadow[idx] is not val:
+                    if val:
+                        high.append(idx)
+                    else:
+                        low.append(idx)
+            try:
+                if high or low:
+                    for idx in high:
+                        shadow[idx] = None
+                    for idx in low:
+                        shadow[idx] = None
+                    self.last_time = self.device.write(set_high=high,
+                                                       set_low=low)
+                    for idx in high:
+                        shadow[idx] = True
+                    for idx in low:
+                        shadow[idx] = False
+                batch.t = self.last_time
+            except Exception as e:
+                batch.error = e
+
+        with self.cond:
+            batch.done = 1
+            self.cond.notify_all()
+        if batch.error is not None:
+            raise batch.error
+        return batch.t
+
+    cpdef object invalidate(CoalescedSerializerOut self):
+        '''
+        Marks the states of all the lines as unknown, so that subsequent
+        writes are sent to the server even if they match the last states
+        written through this instance.
+        '''
+        with self.write_lock:
+            self.shadow[:] = [None, ] * len(self.shadow)
 
 
 cdef class PinSettings(FTDISettings):
@@ -625,37 +999,18 @@ cdef class FTDIPin(FTDIDevice):
         '''
         See :meth:`~pybarst.core.server.BarstChannel.open_channel` for details.
         '''
-        cdef DWORD read_size, pos = 0
-        cdef int res
-        cdef SBaseIn *pbase
-        cdef char *pbase_out
-        cdef SPinInit *pin_init = NULL
-        cdef SInitPeriphFT *ft_init = NULL
         FTDIDevice.open_channel(self)
+        self._query_settings()
 
-        read_size = (sizeof(SBaseOut) + 2 * sizeof(SBase) + sizeof(SPinInit) +
-                     sizeof(SInitPeriphFT))
-        pbase = <SBaseIn *>malloc(sizeof(SBaseIn))
-        pbase_out = <char *>malloc(max(read_size, MIN_BUFF_OUT))
-        if (pbase == NULL or pbase_out == NULL):
-            free(pbase)
-            free(pbase_out)
-            raise BarstException(NO_SYS_RESOURCE)
-
-        pbase.dwSize = sizeof(SBaseIn)
-        pbase.eType = eQuery
-        pbase.nChan = self.chan
-        pbase.nError = 0
-        res = self.write_read(self.pipe, sizeof(SBaseIn), pbase, &read_size,
-                              pbase_out)
-        if not res:
-            if (read_size == sizeof(SBaseIn) and
-                pbase_out.dwSize == sizeof(SBaseIn) and pbase_out.nError):
-                res = pbase_out.nError
-        free(pbase)
-        if res:
-            free(pbase_out)
-            raise BarstException(res)
+    cdef object _parse_settings(FTDIPin self, char *pbase_out,
+                                DWORD read_size):
+        '''
+        See :meth:`~pybarst.ftdi.FTDIDevice._parse_settings`.
+        '''
+        cdef DWORD pos = 0
+        cdef int res = 0
+        cdef SPinInit *pin_init = NULL
+        cdef SInitPeriphFT *ft_init = NULL
 
         while pos < read_size:
             if ((<SBaseIn *>(pbase_out + pos)).dwSize <= read_size - pos and
@@ -686,7 +1041,6 @@ cdef class FTDIPin(FTDIDevice):
         if pin_init == NULL or ft_init == NULL:
             res = UNEXPECTED_READ
         if res:
-            free(pbase_out)
             raise BarstException(res)
 
         self.ft_periph = ft_init[0]
@@ -702,7 +1056,6 @@ cdef class FTDIPin(FTDIDevice):
         bitmask=pin_init.ucActivePins, init_val=pin_init.ucInitialVal,
         continuous=pin_init.bContinuous,
         output=self.barst_chan_type == 'PinWBrd')
-        free(pbase_out)
 
 
 cdef class FTDIPinIn(FTDIPin):
@@ -747,6 +1100,25 @@ byte1, byte2)
     result in reading them ms apart.
     '''
 
+    def __cinit__(FTDIPinIn self, *args, **kwargs):
+        self.read_buff = NULL
+        self.read_buff_size = 0
+
+    def __dealloc__(FTDIPinIn self):
+        free(self.read_buff)
+
+    cdef int _start_stream(FTDIPinIn self) except -1:
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._start_stream`.
+        '''
+        if not self.pin_settings.bContinuous:
+            raise BarstException(msg='Only a continuous channel can be '
+                                 'streamed')
+        if not self.running:
+            self._send_trigger()
+            self.running = 1
+        return 0
+
     cpdef object read(FTDIPinIn self):
         '''
         Requests the server to read the pins from the FTDI channel. This method
@@ -789,31 +1161,93 @@ byte1, byte2)
             where each element corresponds to a bit field of the states of the
             pins. See class description.
         '''
+        cdef list vals = [0, ] * self.pin_settings.usBytesUsed
+        cdef int i
+        cdef double t
+        cdef unsigned char *states = self._read_states(&t)
+
+        for i in range(self.pin_settings.usBytesUsed):
+            vals[i] = states[i]
+        return t, vals
+
+    cpdef object read_events(FTDIPinIn self, EdgeDetector detector,
+                             DWORD max_samples=0):
+        '''
+        Reads, like :meth:`read`, until at least one of the pins changed
+        state, and returns the changes, as extracted by `detector`.
+
+        Each of the :attr:`PinSettings.num_bytes` bytes of a read is a
+        separate sample of the pins, however, they all share the time of the
+        read.
+
+        :Parameters:
+
+            `detector`: :class:`~pybarst.core.edges.EdgeDetector`
+                The detector, tracking 8 lines, one for each pin, that keeps
+                the states of the pins between calls. The first sample it
+                processes only sets the states.
+            `max_samples`: unsigned int
+                If not zero, the method returns after reading at least this
+                many samples, even if nothing changed. Defaults to 0.
+
+        :returns:
+            A list of (`time`, `pin`, `state`) events, see
+            :class:`~pybarst.core.edges.EdgeDetector`. It can only be empty
+            when `max_samples` is not zero.
+
+        For example::
+
+            >>> detector = EdgeDetector(8, debounce=0.001)
+            >>> print dev.read_events(detector)
+            [(1.25621763275, 0, 0), (1.25621763275, 2, 1)]
+        '''
+        cdef DWORD count = 0
+        cdef int i
+        cdef double t
+        cdef unsigned char *states
+        cdef list events = []
+
+        if detector.num_lines != 8:
+            raise BarstException(msg='The detector must track 8 lines, not '
+                                 '{}'.format(detector.num_lines))
+        while not events and (not max_samples or count < max_samples):
+            states = self._read_states(&t)
+            for i in range(self.pin_settings.usBytesUsed):
+                detector.feed_bits(t, states[i], events)
+            count += self.pin_settings.usBytesUsed
+        return events
+
+    cdef unsigned char *_read_states(FTDIPinIn self, double *t) except NULL:
+        '''
+        Does the actual reading from the server. It returns a pointer to the
+        :attr:`PinSettings.num_bytes` bytes read, which is valid until the
+        next read. The server time of the read is stored in `t`.
+        '''
         cdef DWORD read_size = (sizeof(SBaseOut) + sizeof(SBase) +
             self.pin_settings.usBytesUsed * sizeof(char))
         cdef DWORD read_size_out = read_size
         cdef int res = 0
         cdef SBaseOut *pbase
-        cdef list vals = [0, ] * self.pin_settings.usBytesUsed
-        cdef int i, r
-        cdef unsigned char *states
-        cdef tuple result
+        cdef int r
+
+        if self.read_buff_size != read_size:
+            free(self.read_buff)
+            self.read_buff_size = 0
+            self.read_buff = <SBaseOut *>malloc(read_size)
+            if self.read_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.read_buff_size = read_size
+        pbase = self.read_buff
 
         if (not self.pin_settings.bContinuous) or not self.running:
             self._send_trigger()
             if self.pin_settings.bContinuous:
                 self.running = 1
 
-        pbase = <SBaseOut *>malloc(read_size)
-        if pbase == NULL:
-            raise BarstException(NO_SYS_RESOURCE)
-
         with nogil:
             r = ReadFile(self.pipe, pbase, read_size, &read_size_out, NULL)
         if not r:
-            res = WIN_ERROR(GetLastError())
-            free(pbase)
-            raise BarstException(res)
+            raise BarstException(WIN_ERROR(GetLastError()))
         if ((read_size_out != sizeof(SBaseIn) and
              read_size_out != sizeof(SBaseOut) and
              read_size_out != read_size) or
@@ -834,15 +1268,10 @@ byte1, byte2)
             res = DEVICE_CLOSING
         if res:
             self.running = 0
-            free(pbase)
             raise BarstException(res)
 
-        states = <unsigned char *>pbase + sizeof(SBaseOut) + sizeof(SBase)
-        for i in range(self.pin_settings.usBytesUsed):
-            vals[i] = states[i]
-        result = (pbase.dDouble, vals)
-        free(pbase)
-        return result
+        t[0] = pbase.dDouble
+        return <unsigned char *>pbase + sizeof(SBaseOut) + sizeof(SBase)
 
     cpdef object cancel_read(FTDIPinIn self, flush=False):
         '''
@@ -994,15 +1423,39 @@ desc='Birch Board rev1 A')
             >>> print 'read: {}, 0b{:08b}'.format(t, val)
             read: 1.34642093973, 0b11010000
         '''
-        cdef DWORD write_size, read_size = sizeof(SBaseOut)
-        cdef SBaseOut base_read
+        return self.send(self.prepare(data=data, buff_mask=buff_mask,
+                                      buffer=buffer))
+
+    cpdef PreparedWrite prepare(FTDIPinOut self, object data=[],
+                                object buff_mask=None, object buffer=[]):
+        '''
+        Encodes the message that :meth:`write` would send to the server for
+        these parameters, so that it can be sent repeatedly and with minimal
+        overhead with :meth:`~pybarst.core.server.BarstChannel.send`.
+
+        The parameters are the same as for :meth:`write`. The returned message
+        can only be sent by this instance, and becomes invalid once the
+        channel is closed.
+
+        :returns:
+            A :class:`~pybarst.core.server.PreparedWrite` instance.
+
+        For example::
+
+            >>> high = dev.prepare(buff_mask=0xFF, buffer=[0b00110000])
+            >>> low = dev.prepare(buff_mask=0xFF, buffer=[0b00000000])
+            >>> for i in range(1000):
+            ...     dev.send(high)
+            ...     dev.send(low)
+        '''
+        cdef DWORD write_size
         cdef SBaseIn *pbase
-        cdef SBaseIn *pbase_out
-        cdef int res, count = 0
+        cdef int count = 0
         cdef unsigned short repeat
         cdef unsigned char val, mask
         cdef SPinWData *pin_data
         cdef unsigned char *pin_buff
+        cdef PreparedWrite prepared = PreparedWrite()
 
         if buff_mask is None:
             write_size = (2 * sizeof(SBaseIn) + sizeof(SBase) +
@@ -1017,11 +1470,10 @@ desc='Birch Board rev1 A')
         if data and (buff_mask is not None or buffer):
             raise BarstException(
                 msg='You provided data both with data and buffer parameters.')
-        pbase_out = <SBaseIn *>malloc(write_size)
-        if pbase_out == NULL:
-            raise BarstException(NO_SYS_RESOURCE)
+        pbase = <SBaseIn *>prepared.alloc(write_size)
+        prepared.channel = self
+        prepared.chan = self.chan
 
-        pbase = pbase_out
         pbase.dwSize = write_size
         pbase.eType = ePassOn
         pbase.nChan = self.chan
@@ -1054,23 +1506,200 @@ desc='Birch Board rev1 A')
                 pin_buff += 1
             count += len(buffer)
         if count > self.settings.num_bytes:
-            free(pbase_out)
             raise BarstException(msg='Number of bytes to be written, {} '
             'is larger than num_bytes, {}'.format(count,
                                                   self.settings.num_bytes))
+        return prepared
 
-        res = self.write_read(self.pipe, write_size, pbase_out, &read_size,
-                              &base_read)
-        if not res:
-            if ((read_size != sizeof(SBaseOut) and
-                 read_size != sizeof(SBaseIn)) or
-                ((read_size == sizeof(SBaseIn) or
-                  base_read.sBaseIn.eType != eResponseExD) and
-                 not base_read.sBaseIn.nError)):
-                res = UNEXPECTED_READ
+    cpdef object compile_waveform(FTDIPinOut self, object waveforms,
+                                  object units='s'):
+        '''
+        Compiles per pin waveforms into a :class:`PinProgram`, the minimal
+        run-length encoding that can be written with :meth:`write_program`.
+
+        Each byte written to the pins is output for a single clock tick of
+        the channel's :attr:`~pybarst.ftdi.FTDIChannel.chan_baudrate`, so a
+        waveform is converted to a sequence of bytes, and consecutive identical
+        bytes are merged into a single (`repeat`, `value`, `mask`) element.
+        The sequence is then split into writes of at most
+        :attr:`PinSettings.num_bytes` bytes.
+
+        Compiled programs are cached by their content, so compiling the same
+        waveforms again with the same channel settings returns the
+        same :class:`PinProgram` without encoding it again.
+
+        :Parameters:
+
+            `waveforms`: dict
+                A dict whose keys are the pin numbers (0 - 7) and whose values
+                are lists of (`level`, `duration`) 2-tuples, describing the
+                waveform of the pin. In order, the pin is held high (`level`
+                is True) or low for `duration`. Pins not in the dict are not
+                changed. All pins must be controlled by this device, see
+                :attr:`PinSettings.bitmask`.
+
+                Pins whose waveforms end before the longest waveform keep
+                their last level until the end of the program. Similarly, after
+                the program finishes, all pins keep their last level, so
+                the duration of the final level of the program is not
+                written out.
+            `units`: str
+                The units of `duration`. Can be `'s'` for seconds, in which
+                case it's rounded to the nearest clock tick, or `'ticks'`, for
+                clock ticks of the channel's baud rate. Defaults to `'s'`.
+
+        :returns:
+            A :class:`PinProgram` instance.
+
+        For example::
+
+            >>> # a 1 ms pulse on pin 4, while pin 5 is held low for 0.5 ms
+            >>> # and is then high
+            >>> prog = dev.compile_waveform({4: [(1, 0.001), (0, 0.001)], \
+5: [(0, 0.0005), (1, 0.0015)]})
+            >>> print prog.baudrate, prog.duration
+            100000 101
+            >>> print prog.writes
+            [[(50, 16, 48), (50, 48, 48), (1, 32, 48)]]
+            >>> print dev.write_program(prog)
+            [1.34564691796]
+        '''
+        cdef DWORD baudrate = self.parent.baudrate
+        cdef unsigned short num_bytes = self.pin_settings.usBytesUsed
+        cdef unsigned char bitmask = self.pin_settings.ucActivePins
+        cdef unsigned char mask = 0, value
+        cdef unsigned long long t, end, count, chunk_count, repeat
+        cdef int pin
+        cdef list edges, runs, writes, chunk, items
+        cdef tuple key
+        cdef PinProgram program
+
+        if units != 's' and units != 'ticks':
+            raise BarstException(msg='Invalid units, "{}". Acceptable values '
+                                 'are "s" and "ticks"'.format(units))
+        if not waveforms:
+            raise BarstException(
+                msg='You have not provided any waveform to compile.')
+        if not num_bytes or (units == 's' and not baudrate):
+            raise BarstException(msg='The channel must be opened before '
+                                 'compiling waveforms.')
+
+        items = []
+        for pin, waveform in sorted(waveforms.items()):
+            items.append((pin, tuple([(1 if level else 0, duration)
+                                      for level, duration in waveform])))
+        key = (tuple(items), units, baudrate, num_bytes, bitmask)
+        if key in _program_cache:
+            return _program_cache[key]
+
+        # convert each waveform into a list of (tick, level) edges
+        edges = []
+        end = 0
+        for pin, waveform in waveforms.items():
+            if pin < 0 or pin > 7 or not (bitmask & (1 << pin)):
+                raise BarstException(msg='Pin {} is not controlled by this '
+                'device, whose bitmask is 0b{:08b}'.format(pin, bitmask))
+            mask |= 1 << pin
+            t = 0
+            for level, duration in waveform:
+                if duration < 0:
+                    raise BarstException(msg='Pin {} has a negative duration, '
+                                         '{}'.format(pin, duration))
+                if units == 's':
+                    count = <unsigned long long>(duration * baudrate + 0.5)
+                else:
+                    count = duration
+                if not count:
+                    continue
+                edges.append((t, pin, 1 if level else 0))
+                t += count
+            end = max(end, t)
+        if not end:
+            raise BarstException(msg='The waveforms have zero duration.')
+
+        # merge all the pins into runs of identical bytes
+        edges.sort()
+        runs = []
+        value = 0
+        t = 0
+        i = 0
+        while i < len(edges):
+            if edges[i][0] > t:
+                if runs and runs[-1][1] == value:
+                    runs[-1][0] += edges[i][0] - t
+                else:
+                    runs.append([edges[i][0] - t, value])
+                t = edges[i][0]
+            _, pin, level = edges[i]
+            if level:
+                value |= 1 << pin
             else:
-                res = base_read.sBaseIn.nError
-        free(pbase_out)
-        if res:
-            raise BarstException(res)
-        return base_read.dDouble
+                value &= ~(1 << pin)
+            i += 1
+        # after the program the pins hold their last value, so the final run
+        # only needs to be written once
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+
+        # split the runs into writes of at most num_bytes and 16-bit repeats
+        writes = []
+        chunk = []
+        chunk_count = 0
+        for count, value in runs:
+            while count:
+                if chunk_count == num_bytes:
+                    writes.append(chunk)
+                    chunk = []
+                    chunk_count = 0
+                repeat = min(count, num_bytes - chunk_count, 0xFFFF)
+                chunk.append((<unsigned short>repeat, value, mask))
+                chunk_count += repeat
+                count -= repeat
+        if chunk:
+            writes.append(chunk)
+
+        program = PinProgram()
+        program.writes = writes
+        program.duration = t + 1
+        program.baudrate = baudrate
+        program.mask = mask
+        if len(_program_cache) >= max_cached_programs:
+            _program_cache.clear()
+        _program_cache[key] = program
+        return program
+
+    cpdef object write_program(FTDIPinOut self, PinProgram program):
+        '''
+        Writes a :class:`PinProgram` compiled with :meth:`compile_waveform`.
+
+        Each of the program's :attr:`PinProgram.writes` is encoded with
+        :meth:`prepare` before any is sent, and they are then written in
+        order. Within a single write, the bytes are output at the channel's
+        baud rate, however, there may be a gap between consecutive writes.
+
+        :returns:
+            A list of the server times,
+            :meth:`pybarst.core.server.BarstServer.clock`, when each of the
+            writes was written.
+        '''
+        if program.baudrate != self.parent.baudrate:
+            raise BarstException(msg='The program was compiled for a baud '
+            'rate of {}, but the channel baud rate is {}'.format(
+            program.baudrate, self.parent.baudrate))
+        cdef list messages = [self.prepare(data=data)
+                              for data in program.writes]
+        return [self.send(message) for message in messages]
+
+
+cdef class PinProgram(object):
+    '''
+    A waveform program compiled by :meth:`FTDIPinOut.compile_waveform` and
+    written with :meth:`FTDIPinOut.write_program`. See those methods for
+    details.
+
+    This class is not instantiated by the user, and its attributes should
+    not be modified.
+    '''
+    pass
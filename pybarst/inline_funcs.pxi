@@ -42,3 +42,10 @@ cdef inline object tdecode(object s):
     if PY3 and isinstance(s, bytes):
         return s.decode('utf8')
     return s
+
+cdef inline dict dictify_ft_info(FT_DEVICE_LIST_INFO_NODE_OS *ft_info):
+    return {'is_open': ft_info.Flags & 1, 'is_high_speed': ft_info.Flags & 2,
+            'is_full_speed': not (ft_info.Flags & 2), 'dev_type': ft_info.Type,
+            'dev_id': ft_info.ID, 'dev_loc': ft_info.LocId,
+            'dev_serial': str(ft_info.SerialNumber),
+            'dev_description': str(ft_info.Description)}
@@ -69,6 +69,8 @@ the channel from the server as well as for all the clients. If
 this client.
 '''
 
-__all__ = ('MCDAQChannel', )
+__all__ = ('MCDAQChannel', 'MCDAQSequence', 'unpack_lines',
+           'line_transitions')
 
-from pybarst.mcdaq._mcdaq import MCDAQChannel
+from pybarst.mcdaq._mcdaq import MCDAQChannel, MCDAQSequence, unpack_lines, \
+    line_transitions
@@ -2,13 +2,25 @@
 include "../barst_defines.pxi"
 include "../inline_funcs.pxi"
 
-from pybarst.core.server cimport BarstChannel, BarstServer
+from pybarst.core.server cimport BarstChannel, BarstServer, PreparedWrite
+from pybarst.core.edges cimport EdgeDetector
 
 
 cdef class MCDAQChannel(BarstChannel):
     cdef SChanInitMCDAQ daq_init
     cdef int reading
     cdef HANDLE read_pipe
+    cdef object read_error
+    '''
+    An error read by :meth:`read_many` after it read some samples, which is
+    raised by the next read.
+    '''
+    cdef object event_times
+    cdef object event_values
+    '''
+    The arrays into which :meth:`read_events` reads the samples in
+    continuous mode.
+    '''
 
     cdef public object direction
     '''
@@ -37,6 +49,52 @@ cdef class MCDAQChannel(BarstChannel):
 
     cpdef object write(MCDAQChannel self, unsigned short mask,
                        unsigned short value)
+    cpdef PreparedWrite prepare(MCDAQChannel self, unsigned short mask,
+                                unsigned short value)
     cpdef object read(MCDAQChannel self)
+    cdef HANDLE _stream_pipe(MCDAQChannel self)
+    cdef int _start_stream(MCDAQChannel self) except -1
+    cpdef object read_many(MCDAQChannel self, object times, object values,
+                           int block=*)
+    cpdef object read_events(MCDAQChannel self, EdgeDetector detector,
+                             DWORD max_samples=*)
+    cpdef object play_sequence(MCDAQChannel self, object steps, int wait=*)
 
     cdef inline object _send_trigger(MCDAQChannel self)
+
+
+cdef class MCDAQSequence(object):
+    cdef char *msgs
+    '''
+    The encoded write messages of all the steps, one after the other.
+    '''
+    cdef double *offsets_buff
+    cdef double *times_buff
+    cdef int chan
+    cdef int stopping
+    cdef object thread
+
+    cdef public MCDAQChannel channel
+    '''
+    The :class:`MCDAQChannel` to which the sequence is written. Read only.
+    '''
+    cdef public DWORD count
+    '''
+    The number of steps in the sequence. Read only.
+    '''
+    cdef public list offsets
+    '''
+    The list of the requested times, in seconds, of each step relative to
+    the start of the sequence. Read only.
+    '''
+    cdef public object times
+    '''
+    Once the sequence finished playing, a numpy float64 array, or an
+    `array.array('d')` if numpy is not available, of the server times, see
+    :meth:`~pybarst.core.server.BarstServer.clock`, when each step was
+    written. Otherwise None. Read only.
+    '''
+    cdef public object error
+    '''
+    The exception that stopped the sequence, or None. Read only.
+    '''
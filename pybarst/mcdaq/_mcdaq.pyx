@@ -1,18 +1,108 @@
 
 
-__all__ = ('MCDAQChannel', )
+__all__ = ('MCDAQChannel', 'MCDAQSequence', 'unpack_lines', 'line_transitions')
 
 cdef extern from "stdlib.h" nogil:
     void *malloc(size_t)
     void free(void *)
-cdef extern from "string.h":
+cdef extern from "string.h" nogil:
     void *memcpy(void *, const void *, size_t)
     void *memset (void *, int, size_t)
 
 
+from cpython.buffer cimport (PyObject_GetBuffer, PyBuffer_Release,
+                             PyBuffer_FillInfo, PyBUF_WRITABLE, PyBUF_FORMAT,
+                             PyBUF_ANY_CONTIGUOUS)
 from pybarst.core.exception import BarstException
 from pybarst.core import join as barst_join
 
+from cpython.array cimport array, clone
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+cdef inline int _parse_sample(SBaseOut *pbase, DWORD read_size_out,
+                              DWORD read_size) nogil:
+    '''
+    Checks a message read from the read pipe of the channel and returns its
+    error, if any. A valid message holds a sample.
+    '''
+    if ((read_size_out != sizeof(SBaseIn) and
+         read_size_out != sizeof(SBaseOut) and
+         read_size_out != read_size) or
+        ((read_size_out == sizeof(SBaseIn) or
+          read_size_out == sizeof(SBaseOut)) and
+         not pbase.sBaseIn.nError and
+         pbase.sBaseIn.eType != eCancelReadRequest) or
+        (read_size_out == read_size and
+         not pbase.sBaseIn.nError and
+         pbase.sBaseIn.eType != eCancelReadRequest and
+         (pbase.sBaseIn.eType != eResponseExD or
+          (<SBaseIn *>(<char *>pbase +
+                     sizeof(SBaseOut))).eType != eData))):
+        return UNEXPECTED_READ
+    elif pbase.sBaseIn.nError:
+        return pbase.sBaseIn.nError
+    elif pbase.sBaseIn.eType == eCancelReadRequest:
+        return DEVICE_CLOSING
+    return 0
+
+
+cdef DWORD _write_size = (sizeof(SBaseIn) + sizeof(SBase) +
+                         sizeof(SMCDAQWData))
+'''The size of a write message.
+'''
+
+
+cdef inline void *_encode_write(SBaseIn *pbase_write, int chan,
+                                unsigned short mask,
+                                unsigned short value) nogil:
+    '''
+    Encodes a write message into `pbase_write`, which must be
+    :attr:`_write_size` large, and returns the memory following it.
+    '''
+    cdef SMCDAQWData daq_data
+    daq_data.usValue = value
+    daq_data.usBitSelect = mask
+    pbase_write.dwSize = _write_size
+    pbase_write.eType = eData
+    pbase_write.nChan = chan
+    pbase_write.nError = 0
+    (<SBase *>(<char *>pbase_write +
+               sizeof(SBaseIn))).dwSize = _write_size - sizeof(SBaseIn)
+    (<SBase *>(<char *>pbase_write +
+               sizeof(SBaseIn))).eType = eMCDAQWriteData
+    (<SMCDAQWData *>(<char *>pbase_write + sizeof(SBaseIn) +
+                     sizeof(SBase)))[0] = daq_data
+    return <char *>pbase_write + _write_size
+
+
+cdef int _get_buffer(object obj, Py_buffer *buf, bytes fmt,
+                     int flags) except -1:
+    cdef array arr
+    cdef int itemsize = 8 if fmt == b'd' else (2 if fmt == b'H' else 1)
+    if isinstance(obj, array):
+        # array.array doesn't export a new style buffer on python 2
+        arr = obj
+        if (arr.ob_descr.itemsize != itemsize or
+                arr.ob_descr.typecode != (<char *>fmt)[0]):
+            raise BarstException(msg='The buffer must be of type {}'.format(
+                fmt))
+        PyBuffer_FillInfo(buf, arr, arr.data.as_voidptr,
+                          len(arr) * itemsize, 0, flags & ~PyBUF_FORMAT)
+        return 0
+
+    PyObject_GetBuffer(obj, buf, flags | PyBUF_FORMAT | PyBUF_ANY_CONTIGUOUS)
+    if (buf.itemsize != itemsize or
+            (buf.format != NULL and not (<bytes>buf.format).endswith(fmt))):
+        PyBuffer_Release(buf)
+        raise BarstException(msg='The buffer must be of type {}'.format(fmt))
+    return 0
+
 
 cdef class MCDAQChannel(BarstChannel):
     '''
@@ -73,6 +163,8 @@ init_val=0)
         self.server = server
         self.read_pipe = NULL
         self.reading = 0
+        self.read_error = None
+        self.event_times = self.event_values = None
         memset(&self.daq_init, 0, sizeof(SChanInitMCDAQ))
 
     cpdef object open_channel(MCDAQChannel self):
@@ -110,6 +202,7 @@ init_val=0)
         chan_init.bContinuous = self.continuous
 
         self.reading = 0
+        self.read_error = None
         man_chan = self.server.get_manager('mcdaq')['chan']
         self.parent_chan = man_chan
         pipe = self.server.open_pipe('rw')
@@ -264,46 +357,87 @@ init_val=0)
             >>> print(daq.write(mask=0x0001, value=0x0000))
             3.58652372654
         '''
-        cdef DWORD write_size = (sizeof(SBaseIn) + sizeof(SBase) +
-                                 sizeof(SMCDAQWData))
-        cdef DWORD read_size = sizeof(SBaseOut)
-        cdef SMCDAQWData daq_data
-        cdef SBaseIn *pbase_write = <SBaseIn *>malloc(write_size)
-        cdef SBaseOut base_read
-        if pbase_write == NULL:
-            raise BarstException(NO_SYS_RESOURCE)
+        return self.send(self.prepare(mask, value))
 
-        daq_data.usValue = value
-        daq_data.usBitSelect = mask
-        pbase_write.dwSize = write_size
-        pbase_write.eType = eData
-        pbase_write.nChan = self.chan
-        pbase_write.nError = 0
-        (<SBase *>(<char *>pbase_write +
-                   sizeof(SBaseIn))).dwSize = write_size - sizeof(SBaseIn)
-        (<SBase *>(<char *>pbase_write +
-                   sizeof(SBaseIn))).eType = eMCDAQWriteData
-        (<SMCDAQWData *>(<char *>pbase_write + sizeof(SBaseIn) +
-                         sizeof(SBase)))[0] = daq_data
-
-        res = self.write_read(self.pipe, write_size, pbase_write, &read_size,
-                              &base_read)
-        if not res:
-            if ((read_size != sizeof(SBaseOut) and
-                 read_size != sizeof(SBaseIn)) or
-                (read_size == sizeof(SBaseIn) and
-                 not base_read.sBaseIn.nError) or
-                (read_size == sizeof(SBaseOut) and
-                 base_read.sBaseIn.eType != eResponseExD)):
-                res = UNEXPECTED_READ
-            else:
-                res = base_read.sBaseIn.nError
+    cpdef PreparedWrite prepare(MCDAQChannel self, unsigned short mask,
+                                unsigned short value):
+        '''
+        Encodes the message that :meth:`write` would send to the server for
+        these parameters, so that it can be sent repeatedly and with minimal
+        overhead with :meth:`~pybarst.core.server.BarstChannel.send` or
+        :meth:`~pybarst.core.server.BarstChannel.send_async`.
 
-        free(pbase_write)
-        if res:
-            raise BarstException(res)
+        The parameters are the same as for :meth:`write`. The returned message
+        can only be sent by this instance, and becomes invalid once the
+        channel is closed.
+
+        :returns:
+            A :class:`~pybarst.core.server.PreparedWrite` instance.
+
+        For example::
+
+            >>> msg = daq.prepare(mask=0x00FF, value=0x000F)
+            >>> print(daq.send(msg))
+            3.58502208323
+        '''
+        cdef PreparedWrite prepared = PreparedWrite()
+        _encode_write(<SBaseIn *>prepared.alloc(_write_size), self.chan, mask,
+                      value)
+        prepared.channel = self
+        prepared.chan = self.chan
+        return prepared
+
+    cpdef object play_sequence(MCDAQChannel self, object steps,
+                               int wait=True):
+        '''
+        Writes a timed sequence of values to the device, from a dedicated
+        high priority thread. See :class:`MCDAQSequence`.
+
+        :Parameters:
+
+            `steps`: list
+                The list of (`delay`, `mask`, `value`) steps. See
+                :class:`MCDAQSequence`.
+            `wait`: bool
+                Whether to wait until the sequence finished. Defaults to True.
+
+        :returns:
+            If `wait`, the array of the server times when each step was
+            written, see :meth:`MCDAQSequence.wait`. Otherwise, the started
+            :class:`MCDAQSequence`.
+
+        For example::
+
+            >>> # two 1 ms pulses on line 0, 10 ms apart
+            >>> steps = [(0, 0x0001, 0x0001), (0.001, 0x0001, 0),
+            ...          (0.009, 0x0001, 0x0001), (0.001, 0x0001, 0)]
+            >>> times = daq.play_sequence(steps)
+            >>> print(numpy.diff(times))
+            [ 0.00101563  0.00899121  0.00100223]
+        '''
+        cdef MCDAQSequence sequence = MCDAQSequence(self, steps)
+        sequence.start()
+        if wait:
+            return sequence.wait()
+        return sequence
 
-        return base_read.dDouble
+    cdef HANDLE _stream_pipe(MCDAQChannel self):
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._stream_pipe`.
+        '''
+        return self.read_pipe
+
+    cdef int _start_stream(MCDAQChannel self) except -1:
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._start_stream`.
+        '''
+        if not self.daq_init.bContinuous:
+            raise BarstException(msg='Only a continuous channel can be '
+                                 'streamed')
+        if not self.reading:
+            self._send_trigger()
+            self.reading = 1
+        return 0
 
     cpdef object read(MCDAQChannel self):
         '''
@@ -357,6 +491,9 @@ init_val=0)
         cdef unsigned short val = 0
         cdef tuple result
 
+        if self.read_error is not None:
+            e, self.read_error = self.read_error, None
+            raise e
         if (not self.daq_init.bContinuous) or not self.reading:
             self._send_trigger()
             if self.daq_init.bContinuous:
@@ -373,24 +510,7 @@ init_val=0)
             res = WIN_ERROR(GetLastError())
             free(pbase)
             raise BarstException(res)
-        if ((read_size_out != sizeof(SBaseIn) and
-             read_size_out != sizeof(SBaseOut) and
-             read_size_out != read_size) or
-            ((read_size_out == sizeof(SBaseIn) or
-              read_size_out == sizeof(SBaseOut)) and
-             not pbase.sBaseIn.nError and
-             pbase.sBaseIn.eType != eCancelReadRequest) or
-            (read_size_out == read_size and
-             not pbase.sBaseIn.nError and
-             pbase.sBaseIn.eType != eCancelReadRequest and
-             (pbase.sBaseIn.eType != eResponseExD or
-              (<SBaseIn *>(<char *>pbase +
-                         sizeof(SBaseOut))).eType != eData))):
-            res = UNEXPECTED_READ
-        elif pbase.sBaseIn.nError:
-            res = pbase.sBaseIn.nError
-        elif pbase.sBaseIn.eType == eCancelReadRequest:
-            res = DEVICE_CLOSING
+        res = _parse_sample(pbase, read_size_out, read_size)
         if res:
             self.reading = 0
             free(pbase)
@@ -401,6 +521,183 @@ init_val=0)
         free(pbase)
         return result
 
+    cpdef object read_many(MCDAQChannel self, object times, object values,
+                           int block=True):
+        '''
+        Reads all the samples that the server already sent in continuous
+        mode, into the preallocated `times` and `values` arrays, rather than
+        one sample at a time with :meth:`read`.
+
+        The samples are read from the pipe without the GIL, until there are
+        no more samples waiting or the arrays are full. No Python objects
+        are created for the samples, so this can keep up with a much higher
+        sampling rate than :meth:`read`.
+
+        This method is only callable when :attr:`continuous` is `True`. Like
+        :meth:`read`, the first call starts the server's continuous reading.
+
+        :Parameters:
+
+            `times`: writable float64 buffer
+                A writable, contiguous, buffer of doubles, e.g. a numpy
+                float64 array or `array.array('d')`, into which the server
+                times of the samples are read.
+            `values`: writable uint16 buffer
+                A writable, contiguous, buffer of unsigned shorts, e.g. a
+                numpy uint16 array or `array.array('H')`, into which the
+                values of the samples are read. See :meth:`read`.
+            `block`: bool
+                Whether to wait for at least one sample, if none is waiting
+                to be read. Defaults to True.
+
+        :returns:
+            The number of samples read, which were stored at the start of the
+            arrays.
+
+        If an error is read after some samples were read, those samples are
+        returned and the error is raised by the next call to
+        :meth:`read_many` or :meth:`read`.
+
+        For example::
+
+            >>> times = numpy.empty(4096, dtype=numpy.float64)
+            >>> values = numpy.empty(4096, dtype=numpy.uint16)
+            >>> n = daq.read_many(times, values)
+            >>> print(n, times[:n], values[:n])
+            (3, array([ 3.5920170227,  3.5920851541,  3.5921532613]), \
+array([15, 15, 14], dtype=uint16))
+            >>> lines = unpack_lines(values, n)
+        '''
+        cdef Py_buffer tbuf, vbuf
+        cdef DWORD read_size = sizeof(SBaseOut) + sizeof(SBaseIn)
+        cdef DWORD read_size_out, avail
+        cdef Py_ssize_t n = 0, count
+        cdef int res = 0
+        cdef SBaseOut *pbase
+        cdef double *ptimes
+        cdef unsigned short *pvalues
+        cdef HANDLE pipe
+
+        if not self.daq_init.bContinuous:
+            raise BarstException(msg='read_many can only be used with a '
+                                 'continuous channel')
+        if self.read_error is not None:
+            e, self.read_error = self.read_error, None
+            raise e
+
+        _get_buffer(times, &tbuf, b'd', PyBUF_WRITABLE)
+        try:
+            _get_buffer(values, &vbuf, b'H', PyBUF_WRITABLE)
+        except:
+            PyBuffer_Release(&tbuf)
+            raise
+        count = min(tbuf.len // 8, vbuf.len // 2)
+        ptimes = <double *>tbuf.buf
+        pvalues = <unsigned short *>vbuf.buf
+
+        pbase = <SBaseOut *>malloc(read_size)
+        try:
+            if pbase == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            if not self.reading:
+                self._send_trigger()
+                self.reading = 1
+
+            pipe = self.read_pipe
+            with nogil:
+                while n < count:
+                    if n or not block:
+                        if not PeekNamedPipe(pipe, NULL, 0, NULL, &avail,
+                                             NULL):
+                            res = WIN_ERROR(GetLastError())
+                            break
+                        if not avail:
+                            break
+                    read_size_out = read_size
+                    if not ReadFile(pipe, pbase, read_size, &read_size_out,
+                                    NULL):
+                        res = WIN_ERROR(GetLastError())
+                        break
+                    res = _parse_sample(pbase, read_size_out, read_size)
+                    if res:
+                        break
+                    ptimes[n] = pbase.dDouble
+                    pvalues[n] = <unsigned short>(<SBaseIn *>(
+                        <char *>pbase + sizeof(SBaseOut))).dwInfo
+                    n += 1
+        finally:
+            free(pbase)
+            PyBuffer_Release(&tbuf)
+            PyBuffer_Release(&vbuf)
+
+        if res:
+            self.reading = 0
+            if not n:
+                raise BarstException(res)
+            self.read_error = BarstException(res)
+        return n
+
+    cpdef object read_events(MCDAQChannel self, EdgeDetector detector,
+                             DWORD max_samples=0):
+        '''
+        Reads samples, like :meth:`read`, until at least one of the input
+        lines changed state, and returns the changes.
+
+        Only the changes are returned, so a client interested in the
+        transitions doesn't create any objects for the samples in which
+        nothing changed. In continuous mode, the samples are read in bulk
+        with :meth:`read_many`.
+
+        :Parameters:
+
+            `detector`: :class:`~pybarst.core.edges.EdgeDetector`
+                The detector, tracking 16 lines, that keeps the states of the
+                lines between calls. The first sample it processes only sets
+                the states.
+            `max_samples`: unsigned int
+                If not zero, the method returns after reading about this many
+                samples, even if nothing changed. Defaults to 0.
+
+        :returns:
+            A list of (`time`, `line`, `state`) events, see
+            :class:`~pybarst.core.edges.EdgeDetector`. It can only be empty
+            when `max_samples` is not zero.
+
+        For example::
+
+            >>> detector = EdgeDetector(16)
+            >>> print(daq.read_events(detector))
+            [(4.2535237, 3, 1)]
+        '''
+        cdef list events = []
+        cdef DWORD count = 0
+        cdef Py_ssize_t i, n
+        cdef double t
+        cdef unsigned short val
+        cdef array times, values
+
+        if detector.num_lines != 16:
+            raise BarstException(msg='The detector must track 16 lines, not '
+                                 '{}'.format(detector.num_lines))
+        if self.daq_init.bContinuous and self.event_times is None:
+            self.event_times = array('d', [0.]) * 256
+            self.event_values = array('H', [0]) * 256
+
+        while not events and (not max_samples or count < max_samples):
+            if self.daq_init.bContinuous:
+                n = self.read_many(self.event_times, self.event_values, True)
+                times = self.event_times
+                values = self.event_values
+                for i in range(n):
+                    detector.feed_bits(times.data.as_doubles[i],
+                                       values.data.as_ushorts[i], events)
+                count += n
+            else:
+                t, val = self.read()
+                detector.feed_bits(t, val, events)
+                count += 1
+        return events
+
     cdef inline object _send_trigger(MCDAQChannel self):
         cdef SBaseIn base_out
         cdef int res
@@ -451,3 +748,358 @@ init_val=0)
             server is always active.
         '''
         pass
+
+
+def unpack_lines(values, Py_ssize_t count=-1, out=None):
+    '''
+    Unpacks the 16 lines of each sample read with
+    :meth:`MCDAQChannel.read_many` into a (`count`, 16) array of the states
+    of each line.
+
+    :Parameters:
+
+        `values`: uint16 buffer
+            The sample values, e.g. the `values` array of
+            :meth:`MCDAQChannel.read_many`.
+        `count`: int
+            The number of samples at the start of `values` to unpack. If -1,
+            all of `values` is unpacked. Defaults to -1.
+        `out`: writable buffer of bytes
+            A writable buffer of at least `count` * 16 bytes, e.g. a numpy
+            bool or uint8 array, into which line `j` of sample `i` is stored
+            at `i * 16 + j`, 1 if high and 0 if low. If None, a new
+            (`count`, 16) numpy bool array is created, or a `bytearray` if
+            numpy is not available. Defaults to None.
+
+    :returns:
+        `out`.
+
+    For example::
+
+        >>> values = numpy.array([15, 14], dtype=numpy.uint16)
+        >>> print(unpack_lines(values)[:, :4])
+        [[ True  True  True  True]
+         [False  True  True  True]]
+    '''
+    cdef Py_buffer vbuf, obuf
+    cdef Py_ssize_t i
+    cdef int j
+    cdef unsigned short *pvalues
+    cdef unsigned char *pout
+
+    _get_buffer(values, &vbuf, b'H', 0)
+    try:
+        if count < 0 or count > vbuf.len // 2:
+            count = vbuf.len // 2
+        if out is None:
+            if numpy is not None:
+                out = numpy.empty((count, 16), dtype=numpy.bool_)
+            else:
+                out = bytearray(count * 16)
+        PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE | PyBUF_ANY_CONTIGUOUS)
+        try:
+            if obuf.len < count * 16:
+                raise BarstException(msg='The output buffer is too small, {} '
+                'instead of {}'.format(obuf.len, count * 16))
+            pvalues = <unsigned short *>vbuf.buf
+            pout = <unsigned char *>obuf.buf
+            with nogil:
+                for i in range(count):
+                    for j in range(16):
+                        pout[i * 16 + j] = (pvalues[i] >> j) & 1
+        finally:
+            PyBuffer_Release(&obuf)
+    finally:
+        PyBuffer_Release(&vbuf)
+    return out
+
+
+def line_transitions(times, values, Py_ssize_t count=-1, initial=None):
+    '''
+    Finds the samples read with :meth:`MCDAQChannel.read_many` at which each
+    of the 16 lines changed state.
+
+    :Parameters:
+
+        `times`, `values`: float64 and uint16 buffers
+            The `times` and `values` arrays of :meth:`MCDAQChannel.read_many`.
+        `count`: int
+            The number of samples at the start of the arrays to process. If
+            -1, all of them are processed. Defaults to -1.
+        `initial`: unsigned short
+            The value of the sample preceding the first sample, e.g. the last
+            sample of the previous call. If None, the first sample is
+            compared to nothing and is not a transition. Defaults to None.
+
+    :returns:
+        A list of 16 lists, one for each line. Each is a list of 2-tuples of
+        (`time`, `state`) for each sample in which the line changed to
+        `state`, 1 if high and 0 if low.
+
+    For example::
+
+        >>> times = numpy.array([1., 2., 3.])
+        >>> values = numpy.array([15, 14, 15], dtype=numpy.uint16)
+        >>> print(line_transitions(times, values)[:2])
+        [[(2.0, 0), (3.0, 1)], []]
+    '''
+    cdef Py_buffer tbuf, vbuf
+    cdef Py_ssize_t i, start = 0
+    cdef int j
+    cdef unsigned short prev, changed
+    cdef unsigned short *pvalues
+    cdef double *ptimes
+    cdef list lines = [[] for _ in range(16)]
+
+    _get_buffer(times, &tbuf, b'd', 0)
+    try:
+        _get_buffer(values, &vbuf, b'H', 0)
+    except:
+        PyBuffer_Release(&tbuf)
+        raise
+    try:
+        if count < 0 or count > min(tbuf.len // 8, vbuf.len // 2):
+            count = min(tbuf.len // 8, vbuf.len // 2)
+        ptimes = <double *>tbuf.buf
+        pvalues = <unsigned short *>vbuf.buf
+        if not count:
+            return lines
+        if initial is None:
+            prev = pvalues[0]
+            start = 1
+        else:
+            prev = initial
+
+        for i in range(start, count):
+            changed = prev ^ pvalues[i]
+            if changed:
+                for j in range(16):
+                    if (changed >> j) & 1:
+                        lines[j].append((ptimes[i], (pvalues[i] >> j) & 1))
+            prev = pvalues[i]
+    finally:
+        PyBuffer_Release(&tbuf)
+        PyBuffer_Release(&vbuf)
+    return lines
+
+
+cdef class MCDAQSequence(object):
+    '''
+    A timed sequence of writes to a :class:`MCDAQChannel`.
+
+    All the write messages are encoded when the sequence is created. When
+    started, a dedicated thread, running at time critical priority, writes
+    each message at its scheduled time without the GIL, using its own pipe
+    to the channel, and records the server time of each write. Comparing
+    those times to :attr:`offsets` shows the achieved timing.
+
+    Each write still waits for the server's response before the next
+    write, so steps closer than the round trip time with the server are
+    delayed.
+
+    :Parameters:
+
+        `channel`: :class:`MCDAQChannel`
+            The opened channel to write to.
+        `steps`: list
+            The list of (`delay`, `mask`, `value`) steps. `delay` is the time,
+            in seconds, to wait after the previous step, or after starting
+            for the first step, before writing `value` with `mask`. See
+            :meth:`MCDAQChannel.write`.
+
+    For example::
+
+        >>> steps = [(0, 0x00FF, 0x000F), (0.005, 0x00FF, 0x0000)]
+        >>> sequence = MCDAQSequence(daq, steps)
+        >>> sequence.start()
+        >>> times = sequence.wait()
+        >>> print(times[1] - times[0], sequence.offsets[1])
+        (0.00501274, 0.005)
+    '''
+
+    def __cinit__(MCDAQSequence self, MCDAQChannel channel, object steps,
+                  **kwargs):
+        cdef DWORD i
+        cdef double offset = 0
+        cdef unsigned short mask, value
+        cdef char *msg
+        self.msgs = NULL
+        self.offsets_buff = NULL
+        self.times_buff = NULL
+        self.channel = channel
+        self.chan = channel.chan
+        self.count = len(steps)
+        self.offsets = []
+        self.times = None
+        self.error = None
+        self.thread = None
+        self.stopping = 0
+        if not self.count:
+            raise BarstException(msg='The sequence is empty')
+        if not channel.connected:
+            raise BarstException(msg='The channel must be opened before '
+                                 'creating a sequence')
+
+        self.msgs = <char *>malloc(self.count * _write_size)
+        self.offsets_buff = <double *>malloc(self.count * sizeof(double))
+        self.times_buff = <double *>malloc(self.count * sizeof(double))
+        if (self.msgs == NULL or self.offsets_buff == NULL or
+                self.times_buff == NULL):
+            raise BarstException(NO_SYS_RESOURCE)
+
+        msg = self.msgs
+        for i in range(self.count):
+            delay, mask, value = steps[i]
+            if delay < 0:
+                raise BarstException(msg='Invalid delay, {}, of step {}'.
+                                     format(delay, i))
+            offset += delay
+            self.offsets_buff[i] = offset
+            self.offsets.append(offset)
+            msg = <char *>_encode_write(<SBaseIn *>msg, self.chan, mask,
+                                        value)
+
+    def __init__(MCDAQSequence self, MCDAQChannel channel, object steps,
+                 **kwargs):
+        pass
+
+    def __dealloc__(MCDAQSequence self):
+        free(self.msgs)
+        free(self.offsets_buff)
+        free(self.times_buff)
+
+    property done:
+        '''
+        Whether the sequence finished playing.
+        '''
+        def __get__(MCDAQSequence self):
+            return self.times is not None or self.error is not None
+
+    def start(MCDAQSequence self):
+        '''
+        Starts playing the sequence in its thread. A sequence can be played
+        again once it finished.
+        '''
+        if self.thread is not None and self.thread.is_alive():
+            raise BarstException(msg='The sequence is already playing')
+        if (not self.channel.connected) or self.channel.chan != self.chan:
+            raise BarstException(msg='The channel has been closed or '
+                                 'reopened since the sequence was created')
+        self.times = None
+        self.error = None
+        self.stopping = 0
+        self.thread = threading.Thread(target=self._run,
+                                       name='MCDAQSequence')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(MCDAQSequence self):
+        '''
+        Stops playing the sequence before the next step, and waits for the
+        thread to exit.
+        '''
+        self.stopping = 1
+        if self.thread is not None:
+            self.thread.join()
+
+    def wait(MCDAQSequence self, timeout=None):
+        '''
+        Waits until the sequence finished playing.
+
+        :Parameters:
+
+            `timeout`: float
+                The maximum time, in seconds, to wait. If None, it waits until
+                it finished. Defaults to None.
+
+        :returns:
+            The :attr:`times` array, or None if it timed out. If a write
+            failed, the error is raised.
+        '''
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return None
+        if self.error is not None:
+            raise self.error
+        return self.times
+
+    def _run(MCDAQSequence self):
+        cdef HANDLE pipe
+        cdef DWORD i = 0, n, read_size, count = self.count
+        cdef int res = 0
+        cdef int64_t freq, start, now, target
+        cdef SBaseOut response
+        cdef Py_buffer view
+        cdef array arr
+        cdef char *msg = self.msgs
+        cdef double *offsets = self.offsets_buff
+        cdef double *times = self.times_buff
+
+        try:
+            pipe = self.channel.open_pipe('rw')
+        except Exception as e:
+            self.error = e
+            return
+
+        with nogil:
+            SetThreadPriority(GetCurrentThread(),
+                              THREAD_PRIORITY_TIME_CRITICAL)
+            QueryPerformanceFrequency(<LARGE_INTEGER *>&freq)
+            QueryPerformanceCounter(<LARGE_INTEGER *>&start)
+            while i < count and not self.stopping:
+                target = start + <int64_t>(offsets[i] * freq)
+                while not self.stopping:
+                    QueryPerformanceCounter(<LARGE_INTEGER *>&now)
+                    if now >= target:
+                        break
+                    # Sleep(1) can take up to the default timer resolution,
+                    # ~15.6 ms, so only sleep while further away than that
+                    # and spin to the exact time
+                    if target - now > freq // 50:
+                        Sleep(1)
+                    else:
+                        Sleep(0)
+                if self.stopping:
+                    break
+
+                read_size = sizeof(SBaseOut)
+                if (not WriteFile(pipe, msg, _write_size, &n, NULL) or
+                        n != _write_size or
+                        not ReadFile(pipe, &response, sizeof(SBaseOut),
+                                     &read_size, NULL)):
+                    res = WIN_ERROR(GetLastError())
+                    break
+                if ((read_size != sizeof(SBaseOut) and
+                     read_size != sizeof(SBaseIn)) or
+                    ((read_size == sizeof(SBaseIn) or
+                      response.sBaseIn.eType != eResponseExD) and
+                     not response.sBaseIn.nError)):
+                    res = UNEXPECTED_READ
+                    break
+                if response.sBaseIn.nError:
+                    res = response.sBaseIn.nError
+                    break
+                times[i] = response.dDouble
+                msg += _write_size
+                i += 1
+        CloseHandle(pipe)
+
+        if res:
+            self.error = BarstException(res)
+        elif i < count:
+            self.error = BarstException(msg='The sequence was stopped after '
+                                        '{} steps'.format(i))
+        else:
+            if numpy is not None:
+                result = numpy.empty(count, dtype=numpy.float64)
+                PyObject_GetBuffer(result, &view, PyBUF_ANY_CONTIGUOUS |
+                                   PyBUF_WRITABLE)
+                memcpy(view.buf, times, count * sizeof(double))
+                PyBuffer_Release(&view)
+            else:
+                # array.array doesn't export a new style buffer on python 2
+                arr = clone(array('d'), count, False)
+                memcpy(arr.data.as_doubles, times, count * sizeof(double))
+                result = arr
+            self.times = result
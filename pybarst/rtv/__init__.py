@@ -41,6 +41,6 @@ supported, and if it is called,
 called before :meth:`RTVChannel.open_channel` can be called again.
 '''
 
-__all__ = ('RTVChannel', )
+__all__ = ('RTVChannel', 'RTVFrame')
 
-from pybarst.rtv._rtv import RTVChannel
+from pybarst.rtv._rtv import RTVChannel, RTVFrame
@@ -87,5 +87,69 @@ cdef class RTVChannel(BarstChannel):
     the current settings. This is automatically set by the server and is read
     only.
     '''
+    cdef public int frame_pool_size
+    '''
+    The number of frames preallocated in the frame pool when the channel is
+    opened. The frames are read with :meth:`read_frame`, which reads directly
+    into a free frame of the pool. If zero, the pool is not created and only
+    :meth:`read` can be used. Defaults to zero.
+    '''
+    cdef public list free_frames
+    '''
+    The frames of the pool which are not currently used by a client, i.e.
+    which can be returned by :meth:`read_frame`. Read only.
+    '''
+    cdef int pool_generation
+    '''
+    Incremented every time the pool is reallocated so that frames of an older
+    pool are not returned to the current pool.
+    '''
+    cdef SBaseOut *roi_buff
+    '''
+    The buffer into which :meth:`read_rois` reads the full image. It's
+    allocated on the first call and reused by later calls.
+    '''
+    cdef DWORD roi_buff_size
 
     cpdef object read(RTVChannel self)
+    cdef int _start_stream(RTVChannel self) except -1
+    cpdef object read_frame(RTVChannel self)
+    cpdef object read_rois(RTVChannel self, object rois, object out=*)
+
+    cdef int _read_into(RTVChannel self, SBaseOut *pbase) except -1
+    cdef object _release_frame(RTVChannel self, object frame)
+
+
+cdef class RTVFrame(object):
+    cdef char *buff
+    '''
+    The buffer holding the full message read from the server, including the
+    headers preceding the image data.
+    '''
+    cdef char *data
+    cdef Py_ssize_t shape[3]
+    cdef Py_ssize_t strides[3]
+    cdef int ndim
+    cdef int exports
+    '''
+    The number of buffer views of the frame that are still alive.
+    '''
+    cdef int generation
+    cdef int in_use
+
+    cdef public RTVChannel channel
+    '''
+    The :class:`RTVChannel` to whose pool the frame belongs. Read only.
+    '''
+    cdef public double time
+    '''
+    The time, in channel time, that the image was read, see
+    :meth:`~pybarst.core.server.BarstServer.clock`. Read only.
+    '''
+    cdef public DWORD size
+    '''
+    The size of the image data in bytes, i.e.
+    :attr:`RTVChannel.buffer_size`. Read only.
+    '''
+
+    cpdef object release(RTVFrame self)
@@ -1,13 +1,15 @@
 
 
-__all__ = ('RTVChannel', )
+__all__ = ('RTVChannel', 'RTVFrame')
 
 from cpython.ref cimport PyObject
+from cpython.buffer cimport (PyObject_GetBuffer, PyBuffer_Release,
+                             PyBUF_SIMPLE, PyBUF_WRITABLE)
 
 cdef extern from "stdlib.h" nogil:
     void *malloc(size_t)
     void free(void *)
-cdef extern from "string.h":
+cdef extern from "string.h" nogil:
     void *memcpy(void *, const void *, size_t)
     void *memset (void *, int, size_t)
 cdef extern from "Python.h":
@@ -66,6 +68,9 @@ cdef class RTVChannel(BarstChannel):
             Whether all frames should be sent to the client or if frames should
             only be sent when no other frames are waiting to be sent. See
             :attr:`lossless`. Defaults to `True`.
+        `frame_pool_size`: int
+            The number of frames preallocated for :meth:`read_frame`. See
+            :attr:`frame_pool_size`. Defaults to `0`.
 
     For example::
 
@@ -101,7 +106,7 @@ frame_fmt='rgb24', lossless=False)
                   unsigned char u_saturation=127,
                   unsigned char v_saturation=90,
                   unsigned char luma_contrast=124, unsigned char luma_filt=0,
-                  int lossless=True, **kwargs):
+                  int lossless=True, int frame_pool_size=0, **kwargs):
         pass
 
     def __cinit__(RTVChannel self, int chan, BarstServer server,
@@ -110,7 +115,7 @@ frame_fmt='rgb24', lossless=False)
                   unsigned char u_saturation=127,
                   unsigned char v_saturation=90,
                   unsigned char luma_contrast=124, unsigned char luma_filt=0,
-                  int lossless=True, **kwargs):
+                  int lossless=True, int frame_pool_size=0, **kwargs):
         self.chan = chan
         self.server = server
         self.video_fmt = video_fmt
@@ -122,9 +127,18 @@ frame_fmt='rgb24', lossless=False)
         self.luma_contrast = luma_contrast
         self.luma_filt = luma_filt
         self.lossless = lossless
+        self.frame_pool_size = frame_pool_size
+        self.free_frames = []
+        self.pool_generation = 0
+        self.roi_buff = NULL
+        self.roi_buff_size = 0
         self.active_state = 0
         memset(&self.rtv_init, 0, sizeof(SChanInitRTV))
 
+    def __dealloc__(RTVChannel self):
+        free(self.roi_buff)
+        self.roi_buff = NULL
+
     cpdef object open_channel(RTVChannel self):
         '''
         Opens a new channel on the server and connects the
@@ -251,8 +265,24 @@ frame_fmt='rgb24', lossless=False)
         if res:
             raise BarstException(res)
 
+        self.pool_generation += 1
+        self.free_frames = []
+        for i in range(max(self.frame_pool_size, 0)):
+            frame = RTVFrame(self)
+            frame.in_use = 0
+            self.free_frames.append(frame)
         BarstChannel.open_channel(self)
 
+    cdef int _start_stream(RTVChannel self) except -1:
+        '''
+        See :meth:`~pybarst.core.server.BarstChannel._start_stream`. The
+        server sends the images once the channel is activated.
+        '''
+        if not self.connected or not self.active_state:
+            raise BarstException(msg='The channel must be opened and '
+                                 'activated before it can be streamed')
+        return 0
+
     cpdef object read(RTVChannel self):
         '''
         Reads an images sampled from the camera connected to port controlled
@@ -322,28 +352,218 @@ frame_fmt='rgb24', lossless=False)
             is set (i.e. not -1), then after the size has been exceeded, the
             server will go into an error state.
         '''
-        cdef int res = 0, r
-        cdef DWORD read_size = (self.rtv_init.dwBuffSize + sizeof(SBaseOut) +
-                                sizeof(SBase))
-        cdef SBaseOut *pbase = <SBaseOut *>malloc(read_size)
+        cdef SBaseOut *pbase
         cdef double time
         cdef PyObject *cy_arr
 
+        if not self.connected:
+            raise BarstException(msg='You cannot read until the channel '
+                                 'has been opened')
+        if not self.active_state:
+            raise BarstException(msg='You cannot read until the channel '
+                                 'has been activated')
+
+        pbase = <SBaseOut *>malloc(self.rtv_init.dwBuffSize +
+                                   sizeof(SBaseOut) + sizeof(SBase))
         if pbase == NULL:
             raise BarstException(NO_SYS_RESOURCE)
+        try:
+            self._read_into(pbase)
+            time = pbase.dDouble
+            cy_arr = PyByteArray_FromStringAndSize(
+                <char *>pbase + sizeof(SBaseOut) + sizeof(SBase),
+                self.rtv_init.dwBuffSize * sizeof(char))
+            arr = <object>cy_arr
+            Py_DECREF(cy_arr)
+        finally:
+            free(pbase)
+        return time, arr
+
+    cpdef object read_frame(RTVChannel self):
+        '''
+        Similar to :meth:`read`, except that the image is read directly into a
+        free frame of the channel's frame pool, instead of being copied into a
+        newly created `bytearray`.
+
+        The pool is allocated with :attr:`frame_pool_size` frames when the
+        channel is opened. A frame returned by this method is not reused until
+        the client calls :meth:`RTVFrame.release` on it, at which point it's
+        returned to the pool. If all the frames of the pool are in use, an
+        exception is raised.
+
+        :returns:
+            A :class:`RTVFrame` instance holding the image. Its
+            :attr:`RTVFrame.time` is the time that the data was read in channel
+            time, :meth:`~pybarst.core.server.BarstServer.clock`.
+
+        For example::
+
+            >>> rtv = RTVChannel(chan=0, server=server, \
+video_fmt='full_NTSC', frame_fmt='rgb24', frame_pool_size=4)
+            >>> rtv.open_channel()
+            >>> rtv.set_state(True)
+            >>> frame = rtv.read_frame()
+            >>> arr = np.asarray(frame)
+            >>> print frame.time, arr.shape, arr.dtype
+            0.0544582486987 (480, 640, 3) uint8
+            >>> # process the image and then return the frame to the pool
+            >>> del arr
+            >>> frame.release()
+        '''
+        cdef RTVFrame frame
+        if not self.connected:
+            raise BarstException(msg='You cannot read until the channel '
+                                 'has been opened')
+        if not self.active_state:
+            raise BarstException(msg='You cannot read until the channel '
+                                 'has been activated')
+        if not self.free_frames:
+            raise BarstException(NO_SYS_RESOURCE, msg='All the {} frames of '
+            'the frame pool are in use'.format(self.frame_pool_size))
+
+        frame = self.free_frames.pop()
+        try:
+            self._read_into(<SBaseOut *>frame.buff)
+        except:
+            self.free_frames.append(frame)
+            raise
+        frame.time = (<SBaseOut *>frame.buff).dDouble
+        frame.in_use = 1
+        return frame
+
+    cpdef object read_rois(RTVChannel self, object rois, object out=None):
+        '''
+        Similar to :meth:`read`, except that instead of the whole image, only
+        the given regions of it are returned, optionally subsampled.
+
+        The image is read into a buffer that is reused by all the calls, and
+        the regions are copied from it directly into the output buffers,
+        without the GIL. So the full image is never copied into a python
+        object.
+
+        This requires an image format whose pixels are :attr:`bpp` bytes
+        each, i.e. all the tested formats of :attr:`frame_fmt`.
+
+        :Parameters:
+
+            `rois`: list
+                A list of regions, each a 4-tuple of (`x`, `y`, `width`,
+                `height`), or 5-tuple of (`x`, `y`, `width`, `height`, `step`),
+                in pixels. `x`, `y` is the top left corner of the region,
+                which must fit in the image. When `step` is provided, only
+                every `step` pixel, in both directions, is returned, e.g. a
+                `step` of 2 downsamples the region by 2. `step` defaults to 1.
+            `out`: list
+                A list, with an element for each region of `rois`, of writable
+                contiguous buffers, e.g. a `bytearray` or numpy array, into
+                which the region is copied. A region of `width` and `height`
+                with `step` results in `ceil(height / step)` rows of
+                `ceil(width / step)` pixels of :attr:`bpp` bytes. If None,
+                new `bytearray` are created. Defaults to None.
+
+        :returns:
+            2-tuple of (`time`, `out`). `time` is the time that the image was
+            read in channel time, and `out` is the list of the buffers holding
+            the regions, either as passed in, or newly created.
+
+        For example::
+
+            >>> # the center of the image and the whole image at half size
+            >>> t, (center, half) = rtv.read_rois([(160, 120, 320, 240), \
+(0, 0, 640, 480, 2)])
+            >>> print t, len(center), len(half)
+            0.0704396276054 230400 230400
+        '''
+        cdef Py_buffer buf
+        cdef int x, y, w, h, step, ow, oh, r, c
+        cdef int width = self.width, height = self.height, bpp = self.bpp
+        cdef size_t row_size, src_row = <size_t>width * bpp
+        cdef DWORD size = (self.rtv_init.dwBuffSize + sizeof(SBaseOut) +
+                           sizeof(SBase))
+        cdef char *img
+        cdef char *src
+        cdef char *dst
+        cdef double time
+
         if not self.connected:
             raise BarstException(msg='You cannot read until the channel '
                                  'has been opened')
         if not self.active_state:
             raise BarstException(msg='You cannot read until the channel '
                                  'has been activated')
+        if <DWORD>(width * height * bpp) != self.rtv_init.dwBuffSize:
+            raise BarstException(BAD_INPUT_PARAMS, msg='Regions are not '
+            'supported for the {} format'.format(self.frame_fmt))
+
+        specs = []
+        for roi in rois:
+            if len(roi) == 4:
+                x, y, w, h = roi
+                step = 1
+            else:
+                x, y, w, h, step = roi
+            if (x < 0 or y < 0 or w <= 0 or h <= 0 or step <= 0 or
+                x + w > width or y + h > height):
+                raise BarstException(BAD_INPUT_PARAMS, msg='Invalid region, '
+                '{}, for a {}x{} image'.format(roi, width, height))
+            specs.append((x, y, w, h, step))
+        if out is None:
+            out = []
+            for x, y, w, h, step in specs:
+                out.append(bytearray(((w + step - 1) // step) *
+                                     ((h + step - 1) // step) * bpp))
+        elif len(out) != len(specs):
+            raise BarstException(BAD_INPUT_PARAMS, msg='{} output buffers '
+            'provided for {} regions'.format(len(out), len(specs)))
+
+        if self.roi_buff_size != size:
+            free(self.roi_buff)
+            self.roi_buff_size = 0
+            self.roi_buff = <SBaseOut *>malloc(size)
+            if self.roi_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.roi_buff_size = size
+        self._read_into(self.roi_buff)
+        time = self.roi_buff.dDouble
+        img = <char *>self.roi_buff + sizeof(SBaseOut) + sizeof(SBase)
+
+        for i in range(len(specs)):
+            x, y, w, h, step = specs[i]
+            ow = (w + step - 1) // step
+            oh = (h + step - 1) // step
+            row_size = <size_t>ow * bpp
+            PyObject_GetBuffer(out[i], &buf, PyBUF_SIMPLE | PyBUF_WRITABLE)
+            try:
+                if <size_t>buf.len < row_size * oh:
+                    raise BarstException(BAD_INPUT_PARAMS, msg='The output '
+                    'buffer is {} bytes, but {} bytes are required'.format(
+                        buf.len, row_size * oh))
+                dst = <char *>buf.buf
+                with nogil:
+                    for r in range(oh):
+                        src = img + (<size_t>(y + r * step) * src_row +
+                                     <size_t>x * bpp)
+                        if step == 1:
+                            memcpy(dst, src, row_size)
+                            dst += row_size
+                        else:
+                            for c in range(ow):
+                                memcpy(dst, src, bpp)
+                                dst += bpp
+                                src += <size_t>step * bpp
+            finally:
+                PyBuffer_Release(&buf)
+        return time, out
+
+    cdef int _read_into(RTVChannel self, SBaseOut *pbase) except -1:
+        cdef int res = 0, r
+        cdef DWORD read_size = (self.rtv_init.dwBuffSize + sizeof(SBaseOut) +
+                                sizeof(SBase))
 
         with nogil:
             r = ReadFile(self.pipe, pbase, read_size, &read_size, NULL)
         if not r:
-            res = WIN_ERROR(GetLastError())
-            free(pbase)
-            raise BarstException(res)
+            raise BarstException(WIN_ERROR(GetLastError()))
 
         if ((read_size != sizeof(SBaseIn) and read_size != sizeof(SBaseOut) and
              read_size != self.rtv_init.dwBuffSize + sizeof(SBaseOut) +
@@ -361,18 +581,13 @@ frame_fmt='rgb24', lossless=False)
         if res:
             if res == DEVICE_CLOSING:
                 self.active_state = 0
-            free(pbase)
             raise BarstException(res)
+        return 0
 
-        time = pbase.dDouble
-        cy_arr = PyByteArray_FromStringAndSize(
-            <char *>pbase + sizeof(SBaseOut) + sizeof(SBase),
-            self.rtv_init.dwBuffSize * sizeof(char))
-        arr = <object>cy_arr
-        Py_DECREF(cy_arr)
-
-        free(pbase)
-        return time, arr
+    cdef object _release_frame(RTVChannel self, object frame):
+        # frames of a previous pool are simply dropped
+        if (<RTVFrame>frame).generation == self.pool_generation:
+            self.free_frames.append(frame)
 
     cpdef object set_state(RTVChannel self, int state, flush=False):
         '''
@@ -406,3 +621,89 @@ frame_fmt='rgb24', lossless=False)
         self._set_state(state, self.pipe if state else NULL, self.chan, flush)
         if state or flush:
             self.active_state = state
+
+
+cdef class RTVFrame(object):
+    '''
+    A frame of a :class:`RTVChannel` frame pool, holding a single image read
+    with :meth:`RTVChannel.read_frame`.
+
+    The frame supports the buffer protocol, so the image can be accessed
+    without copying, e.g. with `numpy.asarray(frame)` or `memoryview(frame)`.
+    The buffer is of unsigned bytes and its shape is (`height`, `width`,
+    `bpp`) given by :attr:`RTVChannel.height`, :attr:`RTVChannel.width`, and
+    :attr:`RTVChannel.bpp`. If the image size is not a multiple of those, e.g.
+    for the untested formats, the buffer is one dimensional instead.
+
+    Frames are created by the channel, not by the user.
+    '''
+
+    def __cinit__(RTVFrame self, RTVChannel channel, **kwargs):
+        cdef DWORD size = channel.rtv_init.dwBuffSize
+        self.channel = channel
+        self.size = size
+        self.generation = channel.pool_generation
+        self.exports = 0
+        self.in_use = 0
+        self.time = 0.
+        self.buff = <char *>malloc(size + sizeof(SBaseOut) + sizeof(SBase))
+        if self.buff == NULL:
+            raise BarstException(NO_SYS_RESOURCE)
+        self.data = self.buff + sizeof(SBaseOut) + sizeof(SBase)
+
+        if (channel.width > 0 and channel.height > 0 and channel.bpp and
+            <DWORD>(channel.width * channel.height * channel.bpp) == size):
+            self.ndim = 3
+            self.shape[0] = channel.height
+            self.shape[1] = channel.width
+            self.shape[2] = channel.bpp
+        else:
+            self.ndim = 1
+            self.shape[0] = size
+            self.shape[1] = self.shape[2] = 1
+        self.strides[2] = 1
+        self.strides[1] = self.shape[2]
+        self.strides[0] = self.shape[1] * self.shape[2]
+        if self.ndim == 1:
+            self.strides[0] = 1
+
+    def __dealloc__(RTVFrame self):
+        free(self.buff)
+
+    def __getbuffer__(RTVFrame self, Py_buffer *buffer, int flags):
+        if not self.in_use:
+            raise BarstException(msg='The frame has been released to the '
+                                 'pool and cannot be accessed')
+        buffer.buf = self.data
+        buffer.obj = self
+        buffer.len = self.size
+        buffer.readonly = 0
+        buffer.itemsize = 1
+        buffer.format = 'B'
+        buffer.ndim = self.ndim
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+        self.exports += 1
+
+    def __releasebuffer__(RTVFrame self, Py_buffer *buffer):
+        self.exports -= 1
+
+    cpdef object release(RTVFrame self):
+        '''
+        Returns the frame to the pool of its :attr:`channel` so that it can be
+        reused by :meth:`RTVChannel.read_frame`.
+
+        All the buffers of the frame, e.g. numpy arrays created from it, must
+        have been deleted before the frame is released, otherwise an
+        exception is raised. Once released, the frame must not be used
+        anymore.
+        '''
+        if not self.in_use:
+            return
+        if self.exports:
+            raise BarstException(msg='The frame cannot be released while {} '
+            'buffer(s) of it are still in use'.format(self.exports))
+        self.in_use = 0
+        self.channel._release_frame(self)
@@ -0,0 +1,639 @@
+'''
+RTV capture
+============
+
+Continuously reads the images of a :class:`~pybarst.rtv.RTVChannel` in a
+background thread.
+
+When an RTV channel is active the server keeps sending images to the client.
+If the client doesn't read them quickly enough, with
+:attr:`~pybarst.rtv.RTVChannel.lossless` `True` the images accumulate in the
+server, and with it `False` the first images read after a pause are old.
+:class:`RTVCapture` reads the images as soon as they arrive, so the server's
+pipe is always drained, and queues them locally according to a policy,
+dropping images that the consumer cannot keep up with.
+
+Images of a static scene can be skipped by attaching a :class:`RTVChangeGate`
+to the capture, which only passes images that changed relative to a reference
+image.
+
+Several channels can be captured together with :class:`RTVCaptureGroup`,
+which combines their images into sets of images captured at the same time.
+
+For example::
+
+    >>> from pybarst.rtv.capture import RTVCapture
+    >>> rtv = RTVChannel(chan=0, server=server, lossless=True)
+    >>> rtv.open_channel()
+    >>> capture = RTVCapture(rtv, policy='decimate', fps=10)
+    >>> capture.start()
+    >>> for t, data in capture:
+    ...     print t, len(data)
+    ...     if t > 1:
+    ...         break
+    0.0466714387735 921600
+    0.146715087723 921600
+    ...
+    1.01458052254 921600
+    >>> capture.stop()
+    >>> print capture.received, capture.dropped, capture.decimated
+    32 0 21
+'''
+
+__all__ = ('RTVCapture', 'RTVChangeGate', 'RTVCaptureGroup', 'RTVFrameSet')
+
+import threading
+import time
+from collections import deque
+
+from pybarst.core.exception import BarstException
+from pybarst.rtv import RTVFrame
+from pybarst.rtv.convert import frame_difference
+
+
+class RTVCapture(object):
+    '''
+    Reads the images of a :class:`~pybarst.rtv.RTVChannel` in a background
+    thread into a bounded local queue.
+
+    Each image is a 2-tuple of (`time`, `data`) as returned by
+    :meth:`~pybarst.rtv.RTVChannel.read`. If the channel has a frame pool,
+    :attr:`~pybarst.rtv.RTVChannel.frame_pool_size`, the images are read with
+    :meth:`~pybarst.rtv.RTVChannel.read_frame` instead and `data` is a
+    :class:`~pybarst.rtv.RTVFrame` that the consumer must
+    :meth:`~pybarst.rtv.RTVFrame.release` when done. Images dropped by the
+    capture are released automatically. If all the frames of the pool are in
+    use, the image is read with :meth:`~pybarst.rtv.RTVChannel.read` and
+    dropped, so that the pipe is still drained.
+
+    The images can be consumed either by iterating over the instance, or
+    with :meth:`get`, which return the images in order, or with
+    :meth:`latest`, which returns the most recent image and drops the older
+    ones. Only one consumer should be used at a time.
+
+    :Parameters:
+
+        `channel`: :class:`~pybarst.rtv.RTVChannel`
+            The opened, but not yet active, channel from which to read.
+        `policy`: str
+            How images are queued. Can be one of `'keep_all'`, where all the
+            images are queued until :attr:`max_frames` are waiting, after which
+            new images are dropped, `'keep_latest'`, where only the most recent
+            image is kept, or `'decimate'`, which is like `'keep_all'`, except
+            that images are only queued at a rate of at most `fps`. Defaults to
+            `'keep_all'`.
+        `max_frames`: int
+            The maximum number of images waiting in the queue. Defaults to 30.
+        `fps`: float
+            The maximum rate of the queued images when `policy` is
+            `'decimate'`. Defaults to None.
+        `cond`: `threading.Condition`
+            The condition used to protect the queue and notify when images
+            arrive. Captures whose images are consumed together can share
+            one. If None, a new one is created. Defaults to None.
+        `gate`: :class:`RTVChangeGate`
+            If not None, only images passed by the gate are queued. The others
+            are counted in :attr:`gated`. Defaults to None.
+    '''
+
+    policies = ('keep_all', 'keep_latest', 'decimate')
+
+    channel = None
+    '''The :class:`~pybarst.rtv.RTVChannel` from which images are read.
+    '''
+
+    policy = 'keep_all'
+    '''The queuing policy. See :class:`RTVCapture`.
+    '''
+
+    max_frames = 30
+    '''The maximum number of queued images.
+    '''
+
+    fps = None
+    '''The queuing rate when :attr:`policy` is `'decimate'`.
+    '''
+
+    received = 0
+    '''The number of images read from the server since :meth:`start`.
+    '''
+
+    dropped = 0
+    '''The number of images dropped because the consumer did not keep up.
+    '''
+
+    decimated = 0
+    '''The number of images dropped to keep the `'decimate'` rate.
+    '''
+
+    gated = 0
+    '''The number of images skipped by :attr:`gate` because they didn't
+    change.
+    '''
+
+    gate = None
+    '''The :class:`RTVChangeGate`, if any, through which images must pass to
+    be queued.
+    '''
+
+    error = None
+    '''The exception that ended the capture, if it wasn't ended by
+    :meth:`stop`, or None.
+    '''
+
+    def __init__(self, channel, policy='keep_all', max_frames=30, fps=None,
+                 cond=None, gate=None, **kwargs):
+        super(RTVCapture, self).__init__(**kwargs)
+        if policy not in self.policies:
+            raise BarstException(msg='Invalid policy {}. Acceptable policies '
+                                 'are {}'.format(policy, self.policies))
+        if policy == 'decimate' and not fps or fps is not None and fps <= 0:
+            raise BarstException(msg='Invalid fps, {}'.format(fps))
+        if max_frames <= 0:
+            raise BarstException(msg='Invalid max_frames, {}'.format(
+                max_frames))
+        self.channel = channel
+        self.policy = policy
+        self.max_frames = max_frames if policy != 'keep_latest' else 1
+        self.fps = fps
+        self.gate = gate
+        self.queue = deque()
+        self.cond = cond if cond is not None else threading.Condition()
+        self.thread = None
+        self.running = False
+        self.last_time = None
+
+    def start(self):
+        '''
+        Activates the channel with :meth:`~pybarst.rtv.RTVChannel.set_state`
+        and starts the capture thread.
+        '''
+        if self.thread is not None:
+            raise BarstException(msg='The capture is already running')
+        self.received = self.dropped = self.decimated = self.gated = 0
+        if self.gate is not None:
+            self.gate.reset()
+        self.error = None
+        self.last_time = None
+        self.channel.set_state(True)
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_thread,
+                                       name='RTVCapture')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Deactivates the channel, flushing the images waiting in the server,
+        and waits for the capture thread to exit. Images already queued can
+        still be read.
+        '''
+        thread = self.thread
+        if thread is None:
+            return
+        with self.cond:
+            self.running = False
+        try:
+            self.channel.set_state(False, flush=True)
+        finally:
+            thread.join()
+            self.thread = None
+            with self.cond:
+                self.cond.notify_all()
+
+    def latest(self):
+        '''
+        Returns the most recent queued image without blocking, dropping any
+        older queued images, or None if no image is waiting.
+        '''
+        with self.cond:
+            if not self.queue:
+                return None
+            item = self.queue.pop()
+            while self.queue:
+                self._drop(self.queue.popleft())
+        return item
+
+    def get(self, timeout=None):
+        '''
+        Returns the oldest queued image, waiting for one to arrive if the
+        queue is empty.
+
+        :Parameters:
+
+            `timeout`: float
+                The maximum time to wait, in seconds. If None, it waits
+                until an image arrives or the capture stops. Defaults to None.
+
+        :returns:
+            The (`time`, `data`) image, or None if the timeout elapsed or the
+            capture stopped before an image arrived. When the capture stopped
+            due to an error, the error is raised instead once the queue is
+            empty.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while not self.queue and self.running:
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            if self.queue:
+                return self.queue.popleft()
+            if self.error is not None:
+                raise self.error
+        return None
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                with self.cond:
+                    if not self.running and not self.queue:
+                        return
+                continue
+            yield item
+
+    def clear(self):
+        '''
+        Drops all the queued images.
+        '''
+        with self.cond:
+            while self.queue:
+                self._drop(self.queue.popleft())
+
+    def _drop(self, item):
+        self.dropped += 1
+        if isinstance(item[1], RTVFrame):
+            item[1].release()
+
+    def _capture_thread(self):
+        channel = self.channel
+        pool = channel.frame_pool_size > 0
+        queue = self.queue
+        cond = self.cond
+        period = 1. / self.fps if self.fps else 0.
+        decimate = self.policy == 'decimate'
+        latest = self.policy == 'keep_latest'
+        gate = self.gate
+
+        while True:
+            try:
+                if pool and channel.free_frames:
+                    frame = channel.read_frame()
+                    item = frame.time, frame
+                elif pool:
+                    # the pool is exhausted, drain the pipe regardless
+                    channel.read()
+                    with cond:
+                        self.received += 1
+                        self.dropped += 1
+                    continue
+                else:
+                    item = channel.read()
+
+                if gate is not None and not gate.accept(channel, *item):
+                    with cond:
+                        self.received += 1
+                        self.gated += 1
+                    if pool:
+                        item[1].release()
+                    continue
+            except Exception as e:
+                with cond:
+                    if self.running:
+                        self.error = e
+                        self.running = False
+                    cond.notify_all()
+                return
+
+            with cond:
+                self.received += 1
+                if decimate:
+                    if (self.last_time is not None and
+                            item[0] - self.last_time < period):
+                        self.decimated += 1
+                        if pool:
+                            item[1].release()
+                        continue
+                    self.last_time = item[0]
+                if latest:
+                    while queue:
+                        self._drop(queue.popleft())
+                elif len(queue) >= self.max_frames:
+                    self._drop(item)
+                    continue
+                queue.append(item)
+                cond.notify_all()
+
+
+class RTVChangeGate(object):
+    '''
+    Passes only the images that changed relative to a reference image.
+
+    The change is measured with :func:`~pybarst.rtv.convert.frame_difference`,
+    the mean absolute difference of the pixels on a grid, and an image passes
+    when it's at least :attr:`threshold`. Each image that passes becomes the
+    new reference. The first image always passes, as does the first image
+    after :attr:`refresh` seconds elapsed since the reference was taken, so
+    that a static scene is still sampled periodically.
+
+    The images must be in the `gray`, `rgb15`, `rgb16`, `rgb24`, or `rgb32`
+    :attr:`~pybarst.rtv.RTVChannel.frame_fmt`.
+
+    :Parameters:
+
+        `threshold`: float
+            The value of :attr:`threshold`. Defaults to 2.
+        `refresh`: float
+            The value of :attr:`refresh`. Defaults to None.
+        `step`: int
+            The grid spacing used to compare the images, see
+            :func:`~pybarst.rtv.convert.frame_difference`. Defaults to 8.
+
+    For example::
+
+        >>> gate = RTVChangeGate(threshold=3, refresh=60)
+        >>> capture = RTVCapture(rtv, gate=gate)
+        >>> capture.start()
+        >>> time.sleep(10)
+        >>> capture.stop()
+        >>> print gate.passed, gate.skipped, capture.gated
+        12 289 289
+    '''
+
+    threshold = 2.
+    '''The minimum mean absolute difference, between 0 and 255, for an image
+    to pass.
+    '''
+
+    refresh = None
+    '''The duration, in seconds of server time, after which the next image
+    passes and becomes the reference, even if it didn't change. If None, the
+    reference is only replaced by images that changed.
+    '''
+
+    step = 8
+    '''The grid spacing, in pixels, used to compare the images.
+    '''
+
+    passed = 0
+    '''The number of images that passed.
+    '''
+
+    skipped = 0
+    '''The number of images that didn't pass.
+    '''
+
+    difference = 0.
+    '''The difference of the last image compared.
+    '''
+
+    def __init__(self, threshold=2., refresh=None, step=8, **kwargs):
+        super(RTVChangeGate, self).__init__(**kwargs)
+        if threshold < 0 or step <= 0 or refresh is not None and refresh < 0:
+            raise BarstException(msg='Invalid threshold, {}, refresh, {}, or '
+                                 'step {}'.format(threshold, refresh, step))
+        self.threshold = threshold
+        self.refresh = refresh
+        self.step = step
+        self.reset()
+
+    def reset(self):
+        '''
+        Drops the reference image and resets the counters, so that the next
+        image passes.
+        '''
+        self.reference = None
+        self.reference_time = None
+        self.passed = self.skipped = 0
+        self.difference = 0.
+
+    def accept(self, channel, t, data):
+        '''
+        Returns whether the image passes the gate.
+
+        :Parameters:
+
+            `channel`: :class:`~pybarst.rtv.RTVChannel`
+                The channel that read the image.
+            `t`, `data`: the time and image as returned by
+                :meth:`~pybarst.rtv.RTVChannel.read`, or a
+                :class:`~pybarst.rtv.RTVFrame` image.
+        '''
+        if (self.reference is not None and (self.refresh is None or
+                t - self.reference_time < self.refresh)):
+            self.difference = frame_difference(
+                data, self.reference, channel.frame_fmt, channel.width,
+                channel.height, self.step)
+            if self.difference < self.threshold:
+                self.skipped += 1
+                return False
+
+        # copy, because the image may be a pool frame that is reused
+        self.reference = bytearray(data)
+        self.reference_time = t
+        self.passed += 1
+        return True
+
+
+class RTVFrameSet(object):
+    '''
+    A set of images, one from each channel of a :class:`RTVCaptureGroup`,
+    captured at the same time.
+    '''
+
+    time = 0.
+    '''The server time of the set, the time of its latest image.
+    '''
+
+    frames = []
+    '''A list of the (`time`, `data`) images, in the order of the group's
+    channels. See :class:`RTVCapture` for `data`.
+    '''
+
+    skew = []
+    '''A list, in the order of the group's channels, of the time of each
+    image relative to :attr:`time`. The values are zero or negative.
+    '''
+
+    def __init__(self, frames, **kwargs):
+        super(RTVFrameSet, self).__init__(**kwargs)
+        self.frames = frames
+        self.time = t = max([item[0] for item in frames])
+        self.skew = [item[0] - t for item in frames]
+
+    def release(self):
+        '''
+        Releases all the :class:`~pybarst.rtv.RTVFrame` images of the set
+        back to their pools.
+        '''
+        for t, data in self.frames:
+            if isinstance(data, RTVFrame):
+                data.release()
+
+
+class RTVCaptureGroup(object):
+    '''
+    Captures from many :class:`~pybarst.rtv.RTVChannel` concurrently and
+    aligns their images into :class:`RTVFrameSet` sets by server time.
+
+    Each channel is captured by its own :class:`RTVCapture`, with the
+    `'keep_all'` policy, so all the channels are read concurrently. Images
+    are matched when the times of the oldest queued image of all the channels
+    are within `tolerance` of each other. When they aren't, the images which
+    are too old to match the most recent of them are dropped and counted in
+    :attr:`missing`.
+
+    :Parameters:
+
+        `channels`: list
+            The opened, but not yet active,
+            :class:`~pybarst.rtv.RTVChannel` channels, e.g. from different
+            ports of one or more cards. The channels should be on the same
+            server so that their times are comparable.
+        `tolerance`: float
+            The maximum difference, in seconds, between the times of the
+            images of a set. Defaults to 1 / 60. of a second, half a frame.
+        `max_frames`: int
+            The maximum number of images queued for each channel. See
+            :class:`RTVCapture`. Defaults to 30.
+
+    For example::
+
+        >>> channels = [RTVChannel(chan=i, server=server, lossless=True) \
+for i in range(4)]
+        >>> for chan in channels:
+        ...     chan.open_channel()
+        >>> group = RTVCaptureGroup(channels)
+        >>> group.start()
+        >>> frame_set = group.get()
+        >>> print frame_set.time, frame_set.skew
+        0.0967521 [-0.00021, 0.0, -0.00532, -0.00044]
+        >>> group.stop()
+        >>> print group.sets, group.missing
+        1 [0, 1, 0, 0]
+    '''
+
+    captures = []
+    '''The :class:`RTVCapture` of each channel.
+    '''
+
+    tolerance = 1 / 60.
+    '''The maximum time difference between the images of a set.
+    '''
+
+    missing = []
+    '''A list, in the order of the channels, of the number of images of
+    each channel that were dropped because they didn't match the images of
+    the other channels.
+    '''
+
+    sets = 0
+    '''The number of :class:`RTVFrameSet` sets returned.
+    '''
+
+    def __init__(self, channels, tolerance=1 / 60., max_frames=30,
+                 **kwargs):
+        super(RTVCaptureGroup, self).__init__(**kwargs)
+        if not channels:
+            raise BarstException(msg='No channels provided')
+        if tolerance < 0:
+            raise BarstException(msg='Invalid tolerance, {}'.format(
+                tolerance))
+        self.cond = threading.Condition()
+        self.tolerance = tolerance
+        self.captures = [RTVCapture(chan, max_frames=max_frames,
+                                    cond=self.cond) for chan in channels]
+        self.missing = [0] * len(channels)
+
+    def start(self):
+        '''
+        Starts capturing all the channels. See :meth:`RTVCapture.start`.
+        '''
+        self.missing = [0] * len(self.captures)
+        self.sets = 0
+        started = []
+        try:
+            for capture in self.captures:
+                capture.start()
+                started.append(capture)
+        except Exception:
+            for capture in started:
+                capture.stop()
+            raise
+
+    def stop(self):
+        '''
+        Stops capturing all the channels. See :meth:`RTVCapture.stop`.
+        '''
+        error = None
+        for capture in self.captures:
+            try:
+                capture.stop()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def get(self, timeout=None):
+        '''
+        Returns the oldest set of matched images, waiting until a set is
+        available.
+
+        :Parameters:
+
+            `timeout`: float
+                The maximum time to wait, in seconds. If None, it waits
+                until a set is available or a capture stopped. Defaults to
+                None.
+
+        :returns:
+            A :class:`RTVFrameSet`, or None if the timeout elapsed or a
+            capture stopped before a set was available. If a capture stopped
+            due to an error, the error is raised instead.
+        '''
+        captures = self.captures
+        tolerance = self.tolerance
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.cond:
+            while True:
+                if all([c.queue for c in captures]):
+                    heads = [c.queue[0][0] for c in captures]
+                    newest = max(heads)
+                    if newest - min(heads) <= tolerance:
+                        self.sets += 1
+                        return RTVFrameSet(
+                            [c.queue.popleft() for c in captures])
+
+                    for i, capture in enumerate(captures):
+                        if heads[i] < newest - tolerance:
+                            self.missing[i] += 1
+                            item = capture.queue.popleft()
+                            if isinstance(item[1], RTVFrame):
+                                item[1].release()
+                    continue
+
+                for capture in captures:
+                    if not capture.queue and not capture.running:
+                        if capture.error is not None:
+                            raise capture.error
+                        return None
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.cond.wait(remaining)
+
+    def __iter__(self):
+        while True:
+            frame_set = self.get()
+            if frame_set is None:
+                return
+            yield frame_set
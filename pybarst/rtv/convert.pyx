@@ -0,0 +1,409 @@
+'''
+RTV frame conversion
+=====================
+
+Converts the images returned by a :class:`~pybarst.rtv.RTVChannel` from their
+capture format, :attr:`~pybarst.rtv.RTVChannel.frame_fmt`, into rgb24, gray,
+or planar rgb images.
+
+Capturing in the 16-bit formats, `rgb16` or `rgb15`, halves the data sent
+through the channel's pipe compared to `rgb24`. :func:`convert` can then
+convert those images into rgb24 images. The conversion is done without the
+GIL, with the image split into bands of rows that are converted in parallel
+by a pool of threads.
+
+:func:`frame_difference` computes how much an image changed relative to a
+reference image, e.g. to skip storing images of a static scene, see
+:class:`~pybarst.rtv.capture.RTVChangeGate`.
+
+For example::
+
+    >>> from pybarst.rtv.convert import convert, converted_size
+    >>> rtv = RTVChannel(chan=0, server=server, frame_fmt='rgb16')
+    >>> rtv.open_channel()
+    >>> rtv.set_state(True)
+    >>> t, data = rtv.read()
+    >>> out = bytearray(converted_size('rgb24', rtv.width, rtv.height))
+    >>> convert(data, rtv.frame_fmt, rtv.width, rtv.height, 'rgb24', out)
+    >>> print len(data), len(out)
+    614400 921600
+'''
+
+__all__ = ('convert', 'converted_size', 'frame_difference', 'src_formats',
+           'dst_formats', 'default_threads', 'close_pools')
+
+include "../barst_defines.pxi"
+
+from cpython.buffer cimport (PyObject_GetBuffer, PyBuffer_Release,
+                             PyBUF_SIMPLE, PyBUF_WRITABLE)
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import atexit
+import threading
+
+from pybarst.core.exception import BarstException
+
+
+cdef enum:
+    SRC_RGB16 = 0
+    SRC_RGB15 = 1
+    SRC_GRAY = 2
+    SRC_RGB24 = 3
+    SRC_RGB32 = 4
+
+cdef enum:
+    DST_RGB24 = 0
+    DST_GRAY = 1
+    DST_PLANAR = 2
+
+
+cdef dict src_fmts = {'rgb16': SRC_RGB16, 'rgb15': SRC_RGB15,
+                      'gray': SRC_GRAY, 'rgb24': SRC_RGB24,
+                      'rgb32': SRC_RGB32}
+cdef dict dst_fmts = {'rgb24': DST_RGB24, 'gray': DST_GRAY,
+                      'planar': DST_PLANAR}
+cdef int[5] src_bpp = [2, 2, 1, 3, 4]
+cdef int[3] dst_bpp = [3, 1, 3]
+
+src_formats = sorted(src_fmts.keys())
+'''
+The capture formats, :attr:`~pybarst.rtv.RTVChannel.frame_fmt`, that can be
+converted.
+'''
+dst_formats = sorted(dst_fmts.keys())
+'''
+The formats into which images can be converted. `rgb24` is 3 bytes per pixel
+in r, g, b order, `gray` is a single byte per pixel, and `planar` is the r, g,
+and b planes, each of `width * height` bytes, one after the other.
+'''
+default_threads = cpu_count()
+'''
+The number of threads used by :func:`convert` when `threads` is None.
+Defaults to the number of CPUs.
+'''
+cdef dict pools = {}
+cdef object pools_lock = threading.Lock()
+
+
+cdef object _get_pool(int n):
+    '''
+    Returns the thread pool of `n` threads used by :func:`convert`, creating
+    it the first time.
+    '''
+    with pools_lock:
+        pool = pools.get(n)
+        if pool is None:
+            pool = pools[n] = ThreadPool(n)
+        return pool
+
+
+def close_pools():
+    '''
+    Closes the thread pools used by :func:`convert` and waits for their
+    threads to exit. It's called automatically when python exits, and
+    :func:`convert` creates new pools when called afterwards.
+    '''
+    with pools_lock:
+        closing = list(pools.values())
+        pools.clear()
+    for pool in closing:
+        pool.close()
+        pool.join()
+
+atexit.register(close_pools)
+
+
+cdef inline int decode_pixel(int src_fmt, const unsigned char *s,
+                             unsigned int *r, unsigned int *g,
+                             unsigned int *b) nogil:
+    cdef unsigned int v
+    if src_fmt == SRC_RGB16:
+        v = s[0] | (<unsigned int>s[1] << 8)
+        r[0] = (v >> 11) & 0x1F
+        g[0] = (v >> 5) & 0x3F
+        b[0] = v & 0x1F
+        r[0] = (r[0] << 3) | (r[0] >> 2)
+        g[0] = (g[0] << 2) | (g[0] >> 4)
+        b[0] = (b[0] << 3) | (b[0] >> 2)
+    elif src_fmt == SRC_RGB15:
+        v = s[0] | (<unsigned int>s[1] << 8)
+        r[0] = (v >> 10) & 0x1F
+        g[0] = (v >> 5) & 0x1F
+        b[0] = v & 0x1F
+        r[0] = (r[0] << 3) | (r[0] >> 2)
+        g[0] = (g[0] << 3) | (g[0] >> 2)
+        b[0] = (b[0] << 3) | (b[0] >> 2)
+    elif src_fmt == SRC_GRAY:
+        r[0] = g[0] = b[0] = s[0]
+    else:
+        r[0] = s[0]
+        g[0] = s[1]
+        b[0] = s[2]
+    return 0
+
+
+cdef int convert_rows(int src_fmt, int dst_fmt, const unsigned char *src,
+                      unsigned char *dst, int width, int height, int start,
+                      int end) nogil:
+    cdef int x, y
+    cdef int bpp = src_bpp[src_fmt]
+    cdef size_t plane = <size_t>width * height
+    cdef size_t i
+    cdef const unsigned char *s
+    cdef unsigned char *d
+    cdef unsigned int r = 0, g = 0, b = 0
+
+    for y in range(start, end):
+        s = src + <size_t>y * width * bpp
+        i = <size_t>y * width
+        for x in range(width):
+            decode_pixel(src_fmt, s, &r, &g, &b)
+            s += bpp
+
+            if dst_fmt == DST_RGB24:
+                d = dst + 3 * i
+                d[0] = r
+                d[1] = g
+                d[2] = b
+            elif dst_fmt == DST_GRAY:
+                if src_fmt == SRC_GRAY:
+                    dst[i] = r
+                else:
+                    # ITU-R BT.601 luma
+                    dst[i] = (77 * r + 150 * g + 29 * b) >> 8
+            else:
+                dst[i] = r
+                dst[plane + i] = g
+                dst[2 * plane + i] = b
+            i += 1
+    return 0
+
+
+cdef double grid_difference(int src_fmt, const unsigned char *src,
+                            const unsigned char *ref, int width, int height,
+                            int step) nogil:
+    cdef int x, y
+    cdef int bpp = src_bpp[src_fmt]
+    cdef size_t offset
+    cdef unsigned long long total = 0, count = 0
+    cdef unsigned int r = 0, g = 0, b = 0, r2 = 0, g2 = 0, b2 = 0
+
+    y = step // 2
+    while y < height:
+        x = step // 2
+        while x < width:
+            offset = (<size_t>y * width + x) * bpp
+            x += step
+            if src_fmt == SRC_GRAY:
+                r = src[offset]
+                r2 = ref[offset]
+                total += r - r2 if r >= r2 else r2 - r
+                count += 1
+                continue
+            decode_pixel(src_fmt, src + offset, &r, &g, &b)
+            decode_pixel(src_fmt, ref + offset, &r2, &g2, &b2)
+            total += r - r2 if r >= r2 else r2 - r
+            total += g - g2 if g >= g2 else g2 - g
+            total += b - b2 if b >= b2 else b2 - b
+            count += 3
+        y += step
+    if not count:
+        return 0.
+    return <double>total / <double>count
+
+
+cdef class _Conversion(object):
+    cdef const unsigned char *src
+    cdef unsigned char *dst
+    cdef int src_fmt
+    cdef int dst_fmt
+    cdef int width
+    cdef int height
+
+    def run(_Conversion self, band):
+        cdef int start, end
+        start, end = band
+        with nogil:
+            convert_rows(self.src_fmt, self.dst_fmt, self.src, self.dst,
+                         self.width, self.height, start, end)
+
+
+def converted_size(dst_fmt, int width, int height):
+    '''
+    Returns the number of bytes required to hold an image of the given size
+    once converted to `dst_fmt`.
+
+    :Parameters:
+
+        `dst_fmt`: str
+            The format of the converted image, one of :attr:`dst_formats`.
+        `width`, `height`: int
+            The size of the image, e.g. :attr:`~pybarst.rtv.RTVChannel.width`
+            and :attr:`~pybarst.rtv.RTVChannel.height`.
+    '''
+    if dst_fmt not in dst_fmts:
+        raise BarstException(BAD_INPUT_PARAMS, msg='Invalid destination '
+        'format {}. Acceptable formats are {}'.format(dst_fmt, dst_formats))
+    return dst_bpp[<int>dst_fmts[dst_fmt]] * width * height
+
+
+def convert(src, src_fmt, int width, int height, dst_fmt='rgb24', out=None,
+            threads=None):
+    '''
+    Converts an image from its capture format into `dst_fmt`.
+
+    The GIL is released during the conversion. When more than one thread is
+    used, the image is split into bands of rows, each converted in parallel by
+    a thread of a shared thread pool.
+
+    :Parameters:
+
+        `src`: buffer
+            The image data as returned by
+            :meth:`~pybarst.rtv.RTVChannel.read`, or a
+            :class:`~pybarst.rtv.RTVFrame`. Any contiguous object supporting
+            the buffer protocol can be used.
+        `src_fmt`: str
+            The format of the image in `src`, i.e. the channel's
+            :attr:`~pybarst.rtv.RTVChannel.frame_fmt`. Can be one of
+            :attr:`src_formats`.
+        `width`, `height`: int
+            The size of the image, i.e. the channel's
+            :attr:`~pybarst.rtv.RTVChannel.width` and
+            :attr:`~pybarst.rtv.RTVChannel.height`.
+        `dst_fmt`: str
+            The format into which to convert the image, one of
+            :attr:`dst_formats`. Defaults to `'rgb24'`.
+        `out`: buffer
+            A writable contiguous buffer, e.g. a `bytearray` or numpy array,
+            of at least :func:`converted_size` bytes into which the image is
+            converted. If None, a new `bytearray` is created. Defaults to None.
+        `threads`: int
+            The number of threads to use. If None, :attr:`default_threads` is
+            used. Defaults to None.
+
+    :returns:
+        `out`, or the newly created `bytearray` if `out` was None.
+    '''
+    cdef Py_buffer src_buf, dst_buf
+    cdef _Conversion conv
+    cdef int n, i, rows
+    cdef size_t src_size, dst_size
+
+    if src_fmt not in src_fmts:
+        raise BarstException(BAD_INPUT_PARAMS, msg='Invalid source format '
+        '{}. Acceptable formats are {}'.format(src_fmt, src_formats))
+    if width <= 0 or height <= 0:
+        raise BarstException(BAD_INPUT_PARAMS, msg='Invalid image size, '
+                             '{}x{}'.format(width, height))
+    dst_size = converted_size(dst_fmt, width, height)
+    src_size = <size_t>src_bpp[<int>src_fmts[src_fmt]] * width * height
+    if out is None:
+        out = bytearray(dst_size)
+    n = threads if threads is not None else default_threads
+    n = max(min(n, height), 1)
+
+    conv = _Conversion()
+    conv.src_fmt = src_fmts[src_fmt]
+    conv.dst_fmt = dst_fmts[dst_fmt]
+    conv.width = width
+    conv.height = height
+
+    PyObject_GetBuffer(src, &src_buf, PyBUF_SIMPLE)
+    try:
+        PyObject_GetBuffer(out, &dst_buf, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            if <size_t>src_buf.len < src_size:
+                raise BarstException(BAD_INPUT_PARAMS, msg='The source is {} '
+                'bytes, but {} bytes are required'.format(src_buf.len,
+                                                         src_size))
+            if <size_t>dst_buf.len < dst_size:
+                raise BarstException(BAD_INPUT_PARAMS, msg='The output is {} '
+                'bytes, but {} bytes are required'.format(dst_buf.len,
+                                                         dst_size))
+            conv.src = <const unsigned char *>src_buf.buf
+            conv.dst = <unsigned char *>dst_buf.buf
+
+            if n == 1:
+                conv.run((0, height))
+            else:
+                pool = _get_pool(n)
+                rows = (height + n - 1) // n
+                bands = []
+                for i in range(n):
+                    if i * rows < height:
+                        bands.append((i * rows, min((i + 1) * rows, height)))
+                pool.map(conv.run, bands)
+        finally:
+            PyBuffer_Release(&dst_buf)
+    finally:
+        PyBuffer_Release(&src_buf)
+    return out
+
+
+def frame_difference(src, ref, src_fmt, int width, int height, int step=8):
+    '''
+    Returns the mean absolute difference between the pixels of two images,
+    sampled on a grid.
+
+    Only the pixels on a grid with a spacing of `step` pixels are compared,
+    and for color images, the r, g, and b values are compared separately, after
+    being expanded to 8 bits. The GIL is released during the computation.
+
+    :Parameters:
+
+        `src`, `ref`: buffer
+            The images to compare, e.g. as returned by
+            :meth:`~pybarst.rtv.RTVChannel.read`, or a
+            :class:`~pybarst.rtv.RTVFrame`. Any contiguous object supporting
+            the buffer protocol can be used.
+        `src_fmt`: str
+            The format of both images. Can be one of :attr:`src_formats`.
+        `width`, `height`: int
+            The size of the images.
+        `step`: int
+            The spacing of the grid in pixels, in both directions. Defaults to
+            8, i.e. one in 64 pixels is compared.
+
+    :returns:
+        The mean absolute difference, between 0 and 255.
+
+    For example::
+
+        >>> t, ref = rtv.read()
+        >>> t, data = rtv.read()
+        >>> print frame_difference(data, ref, rtv.frame_fmt, rtv.width, \
+rtv.height)
+        0.6171875
+    '''
+    cdef Py_buffer src_buf, ref_buf
+    cdef size_t size
+    cdef int fmt
+    cdef double res
+
+    if src_fmt not in src_fmts:
+        raise BarstException(BAD_INPUT_PARAMS, msg='Invalid source format '
+        '{}. Acceptable formats are {}'.format(src_fmt, src_formats))
+    if width <= 0 or height <= 0 or step <= 0:
+        raise BarstException(BAD_INPUT_PARAMS, msg='Invalid image size, '
+                             '{}x{}, or step {}'.format(width, height, step))
+    fmt = src_fmts[src_fmt]
+    size = <size_t>src_bpp[fmt] * width * height
+
+    PyObject_GetBuffer(src, &src_buf, PyBUF_SIMPLE)
+    try:
+        PyObject_GetBuffer(ref, &ref_buf, PyBUF_SIMPLE)
+        try:
+            if <size_t>src_buf.len < size or <size_t>ref_buf.len < size:
+                raise BarstException(BAD_INPUT_PARAMS, msg='The images are '
+                '{} and {} bytes, but {} bytes are required'.format(
+                    src_buf.len, ref_buf.len, size))
+            with nogil:
+                res = grid_difference(
+                    fmt, <const unsigned char *>src_buf.buf,
+                    <const unsigned char *>ref_buf.buf, width, height, step)
+        finally:
+            PyBuffer_Release(&ref_buf)
+    finally:
+        PyBuffer_Release(&src_buf)
+    return res
@@ -0,0 +1,369 @@
+'''
+RTV recording
+==============
+
+Records the raw images of a :class:`~pybarst.rtv.RTVChannel` to disk and reads
+them back.
+
+:class:`RTVRecorder` captures the images with a
+:class:`~pybarst.rtv.capture.RTVCapture`, and a separate writer thread copies
+them, unchanged, into a preallocated memory-mapped data file, one image after
+the other. Because the capture thread only queues the images, acquisition
+never waits on the disk. Next to the data file, an index file stores the
+format of the images, and the offset and server time of each image.
+
+:class:`RTVRecording` opens such a recording and provides random access to
+its images, by number or by time.
+
+For example::
+
+    >>> from pybarst.rtv.record import RTVRecorder, RTVRecording
+    >>> rtv = RTVChannel(chan=0, server=server, lossless=True)
+    >>> rtv.open_channel()
+    >>> recorder = RTVRecorder(rtv, 'video.raw', max_frames=300)
+    >>> recorder.start()
+    >>> time.sleep(5)
+    >>> recorder.stop()
+    >>> print recorder.frames_written, recorder.dropped
+    150 0
+    >>> recording = RTVRecording('video.raw')
+    >>> print len(recording), recording.width, recording.height
+    150 640 480
+    >>> t, img = recording[10]
+    >>> print t, img.shape
+    0.378211425 (480, 640, 3)
+    >>> print recording.nearest(2.5)
+    75
+    >>> recording.close()
+'''
+
+__all__ = ('RTVRecorder', 'RTVRecording')
+
+import json
+import mmap
+import struct
+import threading
+from bisect import bisect_left
+
+from pybarst.core.exception import BarstException
+from pybarst.rtv import RTVFrame
+from pybarst.rtv.capture import RTVCapture
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+index_record = struct.Struct('<Qd')
+'''The format of each image record in the index file, its offset in the
+data file followed by its server time.
+'''
+
+index_version = 1
+
+
+def _as_bytes_view(data):
+    view = memoryview(data)
+    if view.ndim != 1 or view.format != 'B':
+        if hasattr(view, 'cast'):
+            return view.cast('B')
+        return view.tobytes()
+    return view
+
+
+class RTVRecorder(object):
+    '''
+    Records the images of a :class:`~pybarst.rtv.RTVChannel` into a
+    memory-mapped data file and an index file.
+
+    The data file is named `filename` and the index file is named
+    `filename` + `'.idx'`. The data file is preallocated to hold `max_frames`
+    images, and it's truncated to the images actually recorded when
+    :meth:`stop` is called. Once `max_frames` images were recorded, new images
+    are skipped.
+
+    The index file starts with a line holding a json dict of the format
+    metadata; `video_fmt`, `frame_fmt`, `width`, `height`, `bpp`, and
+    `buffer_size` of the channel. It's followed by a :attr:`index_record`
+    for each image.
+
+    :Parameters:
+
+        `channel`: :class:`~pybarst.rtv.RTVChannel`
+            The opened, but not yet active, channel to record.
+        `filename`: str
+            The name of the data file. It's overwritten if it exists.
+        `max_frames`: int
+            The maximum number of images recorded.
+        `policy`, `queue_frames`, `fps`, `gate`:
+            The `policy`, `max_frames`, `fps`, and `gate` of the
+            :class:`~pybarst.rtv.capture.RTVCapture` used to capture the
+            images. `queue_frames` defaults to 64, see
+            :class:`~pybarst.rtv.capture.RTVCapture` for the others. With a
+            :class:`~pybarst.rtv.capture.RTVChangeGate` `gate`, only the
+            images that changed are recorded.
+    '''
+
+    capture = None
+    '''The :class:`~pybarst.rtv.capture.RTVCapture` used to read the images.
+    '''
+
+    frames_written = 0
+    '''The number of images written to the data file.
+    '''
+
+    skipped = 0
+    '''The number of images captured after the data file was full.
+    '''
+
+    error = None
+    '''The exception that ended the writer thread, or None.
+    '''
+
+    def __init__(self, channel, filename, max_frames, policy='keep_all',
+                 queue_frames=64, fps=None, gate=None, **kwargs):
+        super(RTVRecorder, self).__init__(**kwargs)
+        if max_frames <= 0:
+            raise BarstException(msg='Invalid max_frames, {}'.format(
+                max_frames))
+        self.channel = channel
+        self.filename = filename
+        self.max_frames = max_frames
+        self.capture = RTVCapture(channel, policy=policy,
+                                  max_frames=queue_frames, fps=fps,
+                                  gate=gate)
+        self.thread = None
+
+    @property
+    def dropped(self):
+        '''The number of images dropped by :attr:`capture` because the writer
+        thread did not keep up.
+        '''
+        return self.capture.dropped
+
+    def start(self):
+        '''
+        Creates the files and starts capturing and recording the images.
+        '''
+        if self.thread is not None:
+            raise BarstException(msg='The recorder is already running')
+        channel = self.channel
+        if not channel.connected:
+            raise BarstException(msg='You cannot record until the channel '
+                                 'has been opened')
+        self.frames_written = self.skipped = 0
+        self.error = None
+        size = channel.buffer_size
+
+        data = open(self.filename, 'w+b')
+        try:
+            data.truncate(size * self.max_frames)
+            mm = mmap.mmap(data.fileno(), size * self.max_frames)
+        except Exception:
+            data.close()
+            raise
+        index = open(self.filename + '.idx', 'wb')
+        meta = {'version': index_version, 'video_fmt': channel.video_fmt,
+                'frame_fmt': channel.frame_fmt, 'width': channel.width,
+                'height': channel.height, 'bpp': channel.bpp,
+                'buffer_size': size}
+        index.write((json.dumps(meta) + '\n').encode('utf-8'))
+
+        self.thread = threading.Thread(target=self._writer_thread,
+                                       args=(data, mm, index, size),
+                                       name='RTVRecorder')
+        self.thread.daemon = True
+        try:
+            self.capture.start()
+        except Exception:
+            mm.close()
+            data.close()
+            index.close()
+            self.thread = None
+            raise
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops the capture, waits until all the captured images are written,
+        and closes the files.
+        '''
+        if self.thread is None:
+            return
+        try:
+            self.capture.stop()
+        finally:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _writer_thread(self, data, mm, index, size):
+        view = None
+        try:
+            try:
+                view = memoryview(mm)
+            except TypeError:
+                pass
+            offset = 0
+            end = size * self.max_frames
+
+            for t, img in self.capture:
+                try:
+                    if offset + size > end:
+                        self.skipped += 1
+                        continue
+                    if view is not None:
+                        view[offset:offset + size] = _as_bytes_view(img)
+                    else:
+                        mm[offset:offset + size] = memoryview(img).tobytes()
+                finally:
+                    if isinstance(img, RTVFrame):
+                        img.release()
+                index.write(index_record.pack(offset, t))
+                offset += size
+                self.frames_written += 1
+        except Exception as e:
+            self.error = e
+            try:
+                self.capture.stop()
+            except Exception:
+                pass
+            self.capture.clear()
+        finally:
+            if view is not None and hasattr(view, 'release'):
+                view.release()
+            mm.flush()
+            mm.close()
+            data.truncate(size * self.frames_written)
+            data.close()
+            index.close()
+
+
+class RTVRecording(object):
+    '''
+    Opens a recording made with :class:`RTVRecorder` for reading.
+
+    The images are returned as a numpy array of shape (`height`, `width`,
+    `bpp`) that is a view into the memory-mapped data file, or if numpy is
+    not available, a similarly shaped `memoryview`. Indexing is O(1), and
+    finding an image by time is O(log(n)).
+
+    :Parameters:
+
+        `filename`: str
+            The name of the data file, as given to :class:`RTVRecorder`.
+    '''
+
+    video_fmt = ''
+    '''The :attr:`~pybarst.rtv.RTVChannel.video_fmt` of the recorded channel.
+    '''
+
+    frame_fmt = ''
+    '''The :attr:`~pybarst.rtv.RTVChannel.frame_fmt` of the recorded channel.
+    '''
+
+    width = 0
+    '''The width of the images.
+    '''
+
+    height = 0
+    '''The height of the images.
+    '''
+
+    bpp = 0
+    '''The bytes per pixel of the images.
+    '''
+
+    buffer_size = 0
+    '''The size, in bytes, of each image.
+    '''
+
+    times = []
+    '''The list of the server times of the images.
+    '''
+
+    offsets = []
+    '''The list of the offsets of the images in the data file.
+    '''
+
+    def __init__(self, filename, **kwargs):
+        super(RTVRecording, self).__init__(**kwargs)
+        with open(filename + '.idx', 'rb') as fh:
+            meta = json.loads(fh.readline().decode('utf-8'))
+            records = fh.read()
+        if meta.get('version') != index_version:
+            raise BarstException(msg='Unsupported recording version, '
+                                 '{}'.format(meta.get('version')))
+        for key in ('video_fmt', 'frame_fmt', 'width', 'height', 'bpp',
+                    'buffer_size'):
+            setattr(self, key, meta[key])
+
+        n = len(records) // index_record.size
+        self.offsets = offsets = []
+        self.times = times = []
+        for i in range(n):
+            offset, t = index_record.unpack_from(records,
+                                                 i * index_record.size)
+            offsets.append(offset)
+            times.append(t)
+
+        self.data = open(filename, 'rb')
+        self.mm = None
+        if n:
+            self.mm = mmap.mmap(self.data.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        self.shape = (self.height, self.width, self.bpp)
+        if self.width * self.height * self.bpp != self.buffer_size:
+            self.shape = (self.buffer_size, )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, k):
+        '''
+        Returns the (`time`, `image`) of image number `k`. Without numpy,
+        `image` is a memoryview of the image, or on python 2, its bytes.
+        '''
+        t = self.times[k]
+        offset = self.offsets[k]
+        if numpy is not None:
+            img = numpy.frombuffer(self.mm, dtype=numpy.uint8,
+                                   count=self.buffer_size, offset=offset)
+            return t, img.reshape(self.shape)
+        if hasattr(memoryview, 'cast'):
+            return t, memoryview(self.mm)[
+                offset:offset + self.buffer_size].cast('B', self.shape)
+        # python 2 memoryviews cannot be reshaped, return the flat image
+        return t, self.mm[offset:offset + self.buffer_size]
+
+    def nearest(self, t):
+        '''
+        Returns the number of the image whose time is closest to `t`.
+        '''
+        times = self.times
+        if not times:
+            raise BarstException(msg='The recording is empty')
+        i = bisect_left(times, t)
+        if i == len(times):
+            return i - 1
+        if i and t - times[i - 1] <= times[i] - t:
+            return i - 1
+        return i
+
+    def at_time(self, t):
+        '''
+        Returns the (`time`, `image`) of the image whose time is closest to
+        `t`.
+        '''
+        return self[self.nearest(t)]
+
+    def close(self):
+        '''
+        Closes the files. All the images previously returned must have been
+        deleted.
+        '''
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.data.close()
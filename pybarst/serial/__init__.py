@@ -32,6 +32,7 @@ close this client while leaving the channel on the server, or
 the channel from the server as well as for all the clients.
 '''
 
-__all__ = ('SerialChannel', )
+__all__ = ('SerialChannel', 'SerialTransaction', 'SerialIO')
 
-from pybarst.serial._serial import SerialChannel
+from pybarst.serial._serial import SerialChannel, SerialTransaction
+from pybarst.serial.stream import SerialIO
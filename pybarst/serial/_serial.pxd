@@ -2,11 +2,59 @@
 include "../barst_defines.pxi"
 include "../inline_funcs.pxi"
 
-from pybarst.core.server cimport BarstChannel, BarstServer
+from pybarst.core.server cimport (BarstChannel, BarstServer, PreparedWrite,
+                                  PendingWrite)
+
+
+cdef class SerialTransaction(object):
+    cdef public object channel
+    '''
+    The :class:`SerialChannel` that sent the transaction. Read only.
+    '''
+    cdef public PendingWrite write
+    '''
+    The :class:`~pybarst.core.server.PendingWrite` of the write request.
+    Read only.
+    '''
+    cdef public PendingWrite read
+    '''
+    The :class:`~pybarst.core.server.PendingWrite` of the read request.
+    Read only.
+    '''
+
+    cpdef object result(SerialTransaction self)
 
 
 cdef class SerialChannel(BarstChannel):
     cdef SChanInitSerial serial_init
+    cdef SBaseOut *read_buff
+    '''
+    The buffer into which the responses to read requests are read. It's
+    allocated on the first read and reused by later reads.
+    '''
+    cdef DWORD read_buff_size
+    cdef SBaseIn *write_buff
+    '''
+    The buffer into which :meth:`write` encodes its messages. It's allocated
+    on the first write, sized for :attr:`max_write`, and reused by later
+    writes.
+    '''
+    cdef DWORD write_buff_size
+    cdef char *rx_buff
+    '''
+    Holds the bytes read by :meth:`read_frame` and :meth:`readline` beyond
+    the frame returned, for the next call. The bytes waiting are between
+    `rx_start` and `rx_end`.
+    '''
+    cdef DWORD rx_buff_size
+    cdef DWORD rx_start
+    cdef DWORD rx_end
+    cdef double rx_time
+    cdef double avg_frame
+    '''
+    A running average of the length of the delimited frames, used to size
+    the read requests.
+    '''
 
     cdef public object port_name
     '''
@@ -44,5 +92,40 @@ cdef class SerialChannel(BarstChannel):
     '''
 
     cpdef object write(SerialChannel self, object value, timeout=*)
+    cpdef object write_all(SerialChannel self, object value, timeout=*)
+    cpdef PreparedWrite prepare(SerialChannel self, object value, timeout=*)
     cpdef object read(SerialChannel self, DWORD read_len, timeout=*,
                       object stop_char=*)
+    cpdef object readinto(SerialChannel self, object buffer, timeout=*,
+                          object stop_char=*)
+    cpdef PreparedWrite prepare_read(SerialChannel self, DWORD read_len,
+                                     timeout=*, object stop_char=*)
+    cpdef object transact(SerialChannel self, object command,
+                          object read_len, timeout=*, object stop_char=*,
+                          int wait=*)
+    cpdef object makefile(SerialChannel self, mode=*, int buffering=*,
+                          encoding=*, errors=*, newline=*, timeout=*,
+                          read_ahead=*)
+
+    cpdef object read_frame(SerialChannel self, object delimiter=*,
+                            DWORD size=*, object length_format=*,
+                            int length_includes_header=*, timeout=*)
+    cpdef object readline(SerialChannel self, object delimiter=*, timeout=*)
+    cpdef object clear_remainder(SerialChannel self)
+
+    cdef int _read(SerialChannel self, DWORD read_len, DWORD timeout,
+                   object stop_char, double *t, DWORD *n) except -1
+    cdef DWORD _rx_fill(SerialChannel self, DWORD read_len, DWORD timeout,
+                        object stop_char) except? 0xFFFFFFFF
+    cdef bytes _rx_take(SerialChannel self, DWORD n, DWORD skip)
+    cdef int _encode_write(SerialChannel self, SBaseIn *pbase_write,
+                           const char *data, DWORD size,
+                           DWORD timeout) except -1
+    cdef object _write(SerialChannel self, const char *data, DWORD size,
+                       DWORD timeout)
+    cdef int _encode_read(SerialChannel self, SBaseIn *pbase_out,
+                          DWORD read_len, DWORD timeout,
+                          object stop_char) except -1
+
+    cdef object _parse_write_response(SerialChannel self, int res,
+                                      DWORD read_size)
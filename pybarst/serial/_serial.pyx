@@ -1,23 +1,65 @@
 
-__all__ = ('SerialChannel', )
+__all__ = ('SerialChannel', 'SerialTransaction')
 
 cdef extern from "stdlib.h" nogil:
     void *malloc(size_t)
+    void *realloc(void *, size_t)
     void free(void *)
-cdef extern from "string.h":
+cdef extern from "string.h" nogil:
     void *memcpy(void *, const void *, size_t)
+    void *memmove(void *, const void *, size_t)
+    void *memchr(const void *, int, size_t)
+    int memcmp(const void *, const void *, size_t)
     void *memset (void *, int, size_t)
 
 
 from cpython.array cimport array, clone
+from cpython.buffer cimport (PyObject_GetBuffer, PyBuffer_Release,
+                             PyBUF_SIMPLE, PyBUF_WRITABLE)
 from pybarst.core.exception import BarstException
 from pybarst.core import join as barst_join
 import sys
+import struct
 
 PY3 = sys.version_info > (3, )
 cdef dict _parity = {'even': 2, 'odd': 1, 'mark': 3, 'none': 0, 'space': 4}
 
 
+cdef class SerialTransaction(object):
+    '''
+    A handle to a write and read pair sent with
+    :meth:`SerialChannel.transact`, whose responses may not have been read
+    yet.
+
+    This class is not instantiated by the user.
+    '''
+
+    def __cinit__(SerialTransaction self, **kwargs):
+        self.channel = None
+        self.write = None
+        self.read = None
+
+    property done:
+        '''
+        Whether the responses to the write and the read have been read.
+        '''
+        def __get__(SerialTransaction self):
+            return self.write.done and self.read.done
+
+    cpdef object result(SerialTransaction self):
+        '''
+        Waits until the responses to the write and the read have been read,
+        and returns the result of the read. If the write failed, its error
+        is raised instead.
+
+        :returns:
+            The 2-tuple of (`time`, `data`) returned by
+            :meth:`SerialChannel.read`.
+        '''
+        self.write.result()
+        return self.read.result()
+
+
 cdef class SerialChannel(BarstChannel):
     '''
     A serial port interface channel.
@@ -84,6 +126,24 @@ max_write=32, max_read=32)
         self.parity = parity
         self.byte_size = byte_size
         memset(&self.serial_init, 0, sizeof(SChanInitSerial))
+        self.response_size = (sizeof(SBaseOut) + sizeof(SBase) +
+                              sizeof(SSerialData))
+        self.read_buff = NULL
+        self.read_buff_size = 0
+        self.write_buff = NULL
+        self.write_buff_size = 0
+        self.rx_buff = NULL
+        self.rx_buff_size = self.rx_start = self.rx_end = 0
+        self.rx_time = 0.
+        self.avg_frame = 0.
+
+    def __dealloc__(SerialChannel self):
+        free(self.read_buff)
+        self.read_buff = NULL
+        free(self.write_buff)
+        self.write_buff = NULL
+        free(self.rx_buff)
+        self.rx_buff = NULL
 
     cpdef object open_channel(SerialChannel self):
         '''
@@ -248,6 +308,12 @@ max_write=32, max_read=32)
         else:
             self.pipe = self.open_pipe('rw')
 
+        # responses to prepared reads are read into response_buff as well
+        free(self.response_buff)
+        self.response_buff = NULL
+        self.response_size = (sizeof(SBaseOut) + sizeof(SBase) +
+                              sizeof(SSerialData) + sizeof(char) *
+                              self.max_read)
         BarstChannel.open_channel(self)
 
     cpdef object write(SerialChannel self, object value, timeout=0):
@@ -265,9 +331,14 @@ max_write=32, max_read=32)
 
         :Parameters:
 
-            `value`: str
-                The byte string to write to the port. The length of the bytes
-                instance cannot exceed :attr:`max_write`.
+            `value`: str, or a buffer
+                The bytes to write to the port. It can be a byte string, a
+                unicode string, which is utf8 encoded, or any object that
+                supports the buffer protocol, e.g. a `bytearray`,
+                `memoryview`, or a contiguous numpy array, whose data is
+                copied directly into the message sent to the server. The
+                length of the data cannot exceed :attr:`max_write`, see
+                :meth:`write_all` for longer data.
             `timeout`: unsigned int
                 The amount of time, in ms, the server should wait to finish the
                 write request before returning with a timeout error. If zero,
@@ -286,28 +357,129 @@ timeout=10000)
             (0.0525455800455579, 21)
             >>> print serial.write(value='apples.', timeout=10000)
             (0.06754473171193724, 7)
+            >>> print serial.write(value=bytearray(b'apples.'), timeout=10000)
+            (0.07754473171193724, 7)
         '''
-        cdef DWORD write_size = (sizeof(SBaseIn) + sizeof(SBase) +
-                                 sizeof(SSerialData) + len(value))
-        cdef DWORD read_size = (sizeof(SBaseOut) + sizeof(SBase) +
-                                sizeof(SSerialData))
-        cdef SSerialData ser_data
-        cdef double t
-        cdef bytes bvalue = tencode(value)
-        cdef int amount_wrote
-        cdef SBaseIn *pbase_write= <SBaseIn *>malloc(write_size)
-        cdef SBaseOut *pbase_read= <SBaseOut *>malloc(read_size)
-        if pbase_write == NULL or pbase_read == NULL:
-            free(pbase_write)
-            free(pbase_read)
-            raise BarstException(NO_SYS_RESOURCE)
+        cdef Py_buffer buf
+        if isinstance(value, unicode):
+            value = tencode(value)
+        PyObject_GetBuffer(value, &buf, PyBUF_SIMPLE)
+        try:
+            if <size_t>buf.len > self.max_write:
+                raise BarstException(msg='The length of the string to write, '
+                '{} is longer than the maximum write size indicated, {}'.
+                format(buf.len, self.max_write))
+            return self._write(<const char *>buf.buf, buf.len, timeout)
+        finally:
+            PyBuffer_Release(&buf)
+
+    cpdef object write_all(SerialChannel self, object value, timeout=0):
+        '''
+        Writes `value`, which can be longer than :attr:`max_write`, to the
+        serial port, in :attr:`max_write` sized writes.
+
+        Like :meth:`write`, the data is copied directly from `value` into the
+        message sent to the server, so large binary data, e.g. a firmware
+        image, is not copied into intermediate strings.
+
+        :Parameters:
+
+            `value`: str, or a buffer
+                The bytes to write, see :meth:`write`.
+            `timeout`: unsigned int
+                The timeout of each of the writes, see :meth:`write`.
+                Defaults to `0`.
 
-        if <DWORD>len(bvalue) > self.max_write:
-            raise BarstException(msg='The length of the string to write, {} '
-            'is longer than the maximum write size indicated, {}'.
-            format(len(bvalue), self.max_write))
+        :returns:
+            2-tuple of (`time`, `length`). `time` is the time that the last
+            write finished, and `length` is the total number of bytes written.
+            If a write times out before all its bytes were written, no more
+            data is written and `length` is less than the length of `value`.
+
+        For example::
+
+            >>> with open('firmware.bin', 'rb') as fh:
+            ...     image = fh.read()
+            >>> print len(image), serial.max_write
+            4096 32
+            >>> print serial.write_all(value=image, timeout=10000)
+            (1.2455476435422837, 4096)
+        '''
+        cdef Py_buffer buf
+        cdef Py_ssize_t pos = 0
+        cdef DWORD size, n
+        cdef double t = 0.
+        if isinstance(value, unicode):
+            value = tencode(value)
+        if not self.max_write:
+            raise BarstException(msg='Cannot write with a max_write of zero')
+        PyObject_GetBuffer(value, &buf, PyBUF_SIMPLE)
+        try:
+            while pos < buf.len:
+                size = <DWORD>min(<Py_ssize_t>self.max_write, buf.len - pos)
+                t, n = self._write(<const char *>buf.buf + pos, size, timeout)
+                pos += n
+                if n < size:
+                    break
+        finally:
+            PyBuffer_Release(&buf)
+        return t, pos
+
+    cpdef PreparedWrite prepare(SerialChannel self, object value, timeout=0):
+        '''
+        Encodes the message that :meth:`write` would send to the server for
+        these parameters, so that it can be sent repeatedly and with minimal
+        overhead with :meth:`~pybarst.core.server.BarstChannel.send` or
+        :meth:`~pybarst.core.server.BarstChannel.send_async`.
 
-        ser_data.dwSize = len(bvalue)
+        The parameters are the same as for :meth:`write`. The returned message
+        can only be sent by this instance, and becomes invalid once the
+        channel is closed. Sending it returns the same 2-tuple that
+        :meth:`write` returns.
+
+        :returns:
+            A :class:`~pybarst.core.server.PreparedWrite` instance.
+
+        For example::
+
+            >>> msg = serial.prepare(value='cheesecake and fries.', \
+timeout=10000)
+            >>> print serial.send(msg)
+            (0.0525455800455579, 21)
+        '''
+        cdef Py_buffer buf
+        cdef PreparedWrite prepared
+        if isinstance(value, unicode):
+            value = tencode(value)
+        PyObject_GetBuffer(value, &buf, PyBUF_SIMPLE)
+        try:
+            if <size_t>buf.len > self.max_write:
+                raise BarstException(msg='The length of the string to write, '
+                '{} is longer than the maximum write size indicated, {}'.
+                format(buf.len, self.max_write))
+
+            prepared = PreparedWrite()
+            self._encode_write(<SBaseIn *>prepared.alloc(
+                sizeof(SBaseIn) + sizeof(SBase) + sizeof(SSerialData) +
+                buf.len), <const char *>buf.buf, buf.len, timeout)
+        finally:
+            PyBuffer_Release(&buf)
+        prepared.channel = self
+        prepared.chan = self.chan
+        return prepared
+
+    cdef int _encode_write(SerialChannel self, SBaseIn *pbase_write,
+                           const char *data, DWORD size,
+                           DWORD timeout) except -1:
+        '''
+        Encodes a write request of `size` bytes of `data` into `pbase_write`,
+        which must be large enough for the headers and the data.
+        '''
+        cdef SSerialData ser_data
+        cdef DWORD write_size = (sizeof(SBaseIn) + sizeof(SBase) +
+                                 sizeof(SSerialData) + size)
+
+        ser_data.dwSize = size
         ser_data.dwTimeout = timeout
         ser_data.cStop = 0
         ser_data.bStop = 0
@@ -321,11 +493,62 @@ timeout=10000)
                    sizeof(SBaseIn))).eType = eSerialWriteData
         memcpy(<char *>pbase_write + sizeof(SBaseIn) + sizeof(SBase),
                &ser_data, sizeof(SSerialData))
-        memcpy(<char *>pbase_write + sizeof(SBaseIn) + sizeof(SBase) +
-               sizeof(SSerialData), <char *>bvalue, len(bvalue))
+        with nogil:
+            memcpy(<char *>pbase_write + sizeof(SBaseIn) + sizeof(SBase) +
+                   sizeof(SSerialData), data, size)
+        return 0
+
+    cdef object _write(SerialChannel self, const char *data, DWORD size,
+                       DWORD timeout):
+        '''
+        Writes `size` bytes of `data`, which cannot be more than
+        :attr:`max_write`, using the reusable :attr:`write_buff`, and returns
+        the 2-tuple returned by :meth:`write`.
+        '''
+        cdef DWORD read_size = self.response_size
+        cdef DWORD buff_size = (sizeof(SBaseIn) + sizeof(SBase) +
+                                sizeof(SSerialData) + self.max_write)
+        cdef int res
+
+        if self.write_buff_size < buff_size:
+            free(self.write_buff)
+            self.write_buff_size = 0
+            self.write_buff = <SBaseIn *>malloc(buff_size)
+            if self.write_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.write_buff_size = buff_size
+        if self.response_buff == NULL:
+            self.response_buff = malloc(self.response_size)
+            if self.response_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+
+        self._encode_write(self.write_buff, data, size, timeout)
+        self._drain_pending()
+        res = self.write_read(self.pipe, self.write_buff.dwSize,
+                              self.write_buff, &read_size, self.response_buff)
+        return self._parse_write_response(res, read_size)
+
+    cdef object _parse_write_response(SerialChannel self, int res,
+                                      DWORD read_size):
+        '''
+        Parses the server's response to a write, or to a read prepared with
+        :meth:`prepare_read`, and returns the 2-tuple returned by
+        :meth:`write`, or :meth:`read`, respectively.
+        '''
+        cdef SBaseOut *pbase_read = <SBaseOut *>self.response_buff
+        cdef DWORD header = (sizeof(SBaseOut) + sizeof(SBase) +
+                             sizeof(SSerialData))
+        cdef DWORD n
+        if (not res and read_size >= header and
+            (<SBase *>(<char *>pbase_read + sizeof(SBaseOut))).eType ==
+            eSerialReadData):
+            n = (<SSerialData *>(<char *>pbase_read + sizeof(SBaseOut) +
+                                 sizeof(SBase))).dwSize
+            if (pbase_read.sBaseIn.eType != eResponseExD or
+                n > self.max_read or read_size != header + sizeof(char) * n):
+                raise BarstException(UNEXPECTED_READ)
+            return pbase_read.dDouble, (<char *>pbase_read + header)[:n]
 
-        res = self.write_read(self.pipe, write_size, pbase_write, &read_size,
-                              pbase_read)
         if not res:
             if ((read_size != sizeof(SBaseOut) and
                  read_size != sizeof(SBaseIn) and
@@ -342,17 +565,10 @@ timeout=10000)
             else:
                 res = pbase_read.sBaseIn.nError
         if res:
-            free(pbase_write)
-            free(pbase_read)
             raise BarstException(res)
 
-        t = pbase_read.dDouble
-        amount_wrote = (<SSerialData *>(<char *>pbase_read + sizeof(SBaseOut)
-                                        + sizeof(SBase))).dwSize
-        free(pbase_write)
-        free(pbase_read)
-
-        return t, amount_wrote
+        return pbase_read.dDouble, (<SSerialData *>(
+            <char *>pbase_read + sizeof(SBaseOut) + sizeof(SBase))).dwSize
 
     cpdef object read(SerialChannel self, DWORD read_len, timeout=0,
                       object stop_char=''):
@@ -456,46 +672,99 @@ text written
             server already read less than or `read_len` characters, it returns
             them all.
         '''
-        cdef int res = 0, r
-        cdef SSerialData ser_data
+        cdef double t
+        cdef DWORD n
+        self._read(read_len, timeout, stop_char, &t, &n)
+        return t, (<char *>self.read_buff + sizeof(SBaseOut) + sizeof(SBase)
+                   + sizeof(SSerialData))[:n]
+
+    cpdef object readinto(SerialChannel self, object buffer, timeout=0,
+                          object stop_char=''):
+        '''
+        Similar to :meth:`read`, except that the data read is copied directly
+        into `buffer` instead of being returned as a new bytes instance.
+
+        :Parameters:
+
+            `buffer`: writable buffer
+                A writable contiguous buffer, e.g. a `bytearray`, into which
+                the data is read. Up to `len(buffer)` bytes are requested,
+                but no more than :attr:`max_read`.
+            `timeout`, `stop_char`:
+                See :meth:`read`.
+
+        :returns:
+            2-tuple of (`time`, `length`). `time` is the time that the data was
+            finished reading in channel time,
+            :meth:`~pybarst.core.BarstServer.clock`.
+            `length` is the number of bytes read into `buffer`.
+
+        For example, with a loopback cable connected to com3::
+
+            >>> buffer = bytearray(32)
+            >>> print serial.write(value='apples.', timeout=10000)
+            (0.06754473171193724, 7)
+            >>> print serial.readinto(buffer, timeout=10000, stop_char='.')
+            (0.07514634606696861, 7)
+            >>> print buffer[:7]
+            apples.
+        '''
+        cdef Py_buffer buf
+        cdef double t
+        cdef DWORD n
+        PyObject_GetBuffer(buffer, &buf, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            self._read(min(<DWORD>buf.len, self.max_read), timeout,
+                       stop_char, &t, &n)
+            memcpy(buf.buf, <char *>self.read_buff + sizeof(SBaseOut) +
+                   sizeof(SBase) + sizeof(SSerialData), n)
+        finally:
+            PyBuffer_Release(&buf)
+        return t, n
+
+    cdef int _read(SerialChannel self, DWORD read_len, DWORD timeout,
+                   object stop_char, double *t, DWORD *n) except -1:
+        '''
+        Sends a read request and reads the response into :attr:`read_buff`.
+        The data read starts after the headers and is `n` bytes long.
+        '''
+        cdef int res = 0
         cdef DWORD read_size = (sizeof(SBaseOut) + sizeof(SBase) +
                                 sizeof(SSerialData) + sizeof(char) * read_len)
         cdef DWORD write_size = (sizeof(SBaseIn) + sizeof(SBase) +
                                  sizeof(SSerialData))
-        cdef SBaseIn *pbase_out = <SBaseIn *>malloc(write_size)
-        cdef SBaseOut *pbase_in = <SBaseOut *>malloc(read_size)
-        cdef bytes read_val
-        cdef double t
-        if pbase_out == NULL or pbase_in == NULL:
-            free(pbase_out)
-            free(pbase_in)
-            raise BarstException(NO_SYS_RESOURCE)
+        cdef SBaseIn *pbase_out
+        cdef SBaseOut *pbase_in
 
         if read_len > self.max_read:
             raise BarstException(msg='The length of the string to read, {} '
             'is longer than the maximum read size indicated, {}'.
             format(read_len, self.max_read))
+        if self.read_buff_size < read_size:
+            free(self.read_buff)
+            self.read_buff_size = 0
+            self.read_buff = <SBaseOut *>malloc(
+                sizeof(SBaseOut) + sizeof(SBase) + sizeof(SSerialData) +
+                sizeof(char) * max(self.max_read, read_len))
+            if self.read_buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.read_buff_size = (sizeof(SBaseOut) + sizeof(SBase) +
+                                   sizeof(SSerialData) + sizeof(char) *
+                                   max(self.max_read, read_len))
+        pbase_in = self.read_buff
+        pbase_out = <SBaseIn *>malloc(write_size)
+        if pbase_out == NULL:
+            raise BarstException(NO_SYS_RESOURCE)
 
-        ser_data.dwSize = read_len
-        ser_data.dwTimeout = timeout
-        ser_data.cStop = 0
-        ser_data.bStop = 0
-        if stop_char:
-            ser_data.cStop = ord(stop_char)
-            ser_data.bStop = 1
-        pbase_out.dwSize = write_size
-        pbase_out.eType = eTrigger
-        pbase_out.nChan = self.chan
-        pbase_out.nError = 0
-        (<SBase *>(<char *>pbase_out +
-                   sizeof(SBaseIn))).dwSize = write_size - sizeof(SBaseIn)
-        (<SBase *>(<char* >pbase_out +
-                   sizeof(SBaseIn))).eType = eSerialReadData
-        memcpy(<char *>pbase_out + sizeof(SBaseIn) + sizeof(SBase), &ser_data,
-               sizeof(SSerialData))
-
+        try:
+            self._encode_read(pbase_out, read_len, timeout, stop_char)
+            self._drain_pending()
+        except:
+            free(pbase_out)
+            raise
         res = self.write_read(self.pipe, write_size, pbase_out, &read_size,
                               pbase_in)
+        free(pbase_out)
         if not res:
             if ((read_size != sizeof(SBaseOut) and
                  read_size != sizeof(SBaseIn) and
@@ -510,7 +779,7 @@ text written
                   ((<SBase *>(<char *>pbase_in + sizeof(SBaseOut))).eType !=
                    eSerialReadData) or
                   (<SSerialData *>(<char *>pbase_in + sizeof(SBaseOut) +
-                                   sizeof(SBase))).dwSize > ser_data.dwSize or
+                                   sizeof(SBase))).dwSize > read_len or
                   (read_size != sizeof(SBaseOut) + sizeof(SBase) +
                    sizeof(SSerialData) + sizeof(char) *
                    (<SSerialData *>(<char *>pbase_in + sizeof(SBaseOut) +
@@ -519,20 +788,407 @@ text written
             elif read_size == sizeof(SBaseIn) or read_size == sizeof(SBaseOut):
                 res = pbase_in.sBaseIn.nError
         if res:
-            free(pbase_out)
-            free(pbase_in)
             raise BarstException(res)
 
-        res = pbase_in.sBaseIn.nError
-        t = pbase_in.dDouble
-        ser_data = (<SSerialData *>(<char *>pbase_in +
-                                    sizeof(SBaseOut) + sizeof(SBase)))[0]
-        read_val = (<char *>pbase_in + sizeof(SBaseOut) + sizeof(SBase)
-        + sizeof(SSerialData))[:ser_data.dwSize]
-        free(pbase_out)
-        free(pbase_in)
+        t[0] = pbase_in.dDouble
+        n[0] = (<SSerialData *>(<char *>pbase_in + sizeof(SBaseOut) +
+                                sizeof(SBase))).dwSize
+        return 0
 
-        return t, read_val
+    cdef int _encode_read(SerialChannel self, SBaseIn *pbase_out,
+                          DWORD read_len, DWORD timeout,
+                          object stop_char) except -1:
+        '''
+        Encodes a read request for `read_len` bytes into `pbase_out`, which
+        must be large enough for the headers and a :class:`SSerialData`.
+        '''
+        cdef SSerialData ser_data
+        cdef DWORD write_size = (sizeof(SBaseIn) + sizeof(SBase) +
+                                 sizeof(SSerialData))
+
+        ser_data.dwSize = read_len
+        ser_data.dwTimeout = timeout
+        ser_data.cStop = 0
+        ser_data.bStop = 0
+        if stop_char:
+            ser_data.cStop = ord(stop_char)
+            ser_data.bStop = 1
+        pbase_out.dwSize = write_size
+        pbase_out.eType = eTrigger
+        pbase_out.nChan = self.chan
+        pbase_out.nError = 0
+        (<SBase *>(<char *>pbase_out +
+                   sizeof(SBaseIn))).dwSize = write_size - sizeof(SBaseIn)
+        (<SBase *>(<char* >pbase_out +
+                   sizeof(SBaseIn))).eType = eSerialReadData
+        memcpy(<char *>pbase_out + sizeof(SBaseIn) + sizeof(SBase), &ser_data,
+               sizeof(SSerialData))
+        return 0
+
+    cpdef PreparedWrite prepare_read(SerialChannel self, DWORD read_len,
+                                     timeout=0, object stop_char=''):
+        '''
+        Encodes the read request that :meth:`read` would send to the server
+        for these parameters, so that it can be sent repeatedly with
+        :meth:`~pybarst.core.server.BarstChannel.send` or
+        :meth:`~pybarst.core.server.BarstChannel.send_async`, e.g. right
+        after a write, without waiting for the write's response first.
+
+        The parameters are the same as for :meth:`read`. Sending the returned
+        message returns the same 2-tuple that :meth:`read` returns. Like
+        :meth:`prepare`, the message becomes invalid once the channel is
+        closed.
+
+        :returns:
+            A :class:`~pybarst.core.server.PreparedWrite` instance.
+
+        For example, with a loopback cable connected to com3::
+
+            >>> cmd = serial.prepare(value='apples.', timeout=10000)
+            >>> reply = serial.prepare_read(read_len=7, timeout=10000)
+            >>> pending = [serial.send_async(cmd), serial.send_async(reply)]
+            >>> print [p.result() for p in pending]
+            [(0.06754473171193724, 7), (0.07514634606696861, 'apples.')]
+        '''
+        cdef PreparedWrite prepared
+
+        if read_len > self.max_read:
+            raise BarstException(msg='The length of the string to read, {} '
+            'is longer than the maximum read size indicated, {}'.
+            format(read_len, self.max_read))
+
+        prepared = PreparedWrite()
+        self._encode_read(<SBaseIn *>prepared.alloc(
+            sizeof(SBaseIn) + sizeof(SBase) + sizeof(SSerialData)),
+            read_len, timeout, stop_char)
+        prepared.channel = self
+        prepared.chan = self.chan
+        return prepared
+
+    cpdef object transact(SerialChannel self, object command,
+                          object read_len, timeout=0, object stop_char='',
+                          int wait=True):
+        '''
+        Writes a command to the serial port and reads the device's response,
+        like :meth:`write` followed by :meth:`read`, except that the read
+        request is sent right after the write request, without waiting for
+        the server's response to the write in between.
+
+        With `wait` False, the method returns without waiting for any
+        response, so many transactions, e.g. with different devices on
+        different channels, can be in flight at once. The server performs
+        the requests of the channel in the order they were sent, and their
+        responses are read in the same order. The number of transactions in
+        flight is limited by
+        :attr:`~pybarst.core.server.BarstChannel.max_pending`, each
+        transaction counting twice.
+
+        :Parameters:
+
+            `command`: str or :class:`~pybarst.core.server.PreparedWrite`
+                The bytes to write, see :meth:`write`, or a message returned
+                by :meth:`prepare`, to avoid encoding the same command for
+                every transaction.
+            `read_len`: int or :class:`~pybarst.core.server.PreparedWrite`
+                The number of bytes to read, see :meth:`read`, or a message
+                returned by :meth:`prepare_read`.
+            `timeout`: unsigned int
+                The timeout, in ms, the server uses for the write and the
+                read, see :meth:`read`. It's ignored for prepared messages.
+                Defaults to `0`.
+            `stop_char`: single character string
+                The character on which to finish the read, see :meth:`read`.
+                It's ignored for a prepared `read_len`. Defaults to `''`.
+            `wait`: bool
+                Whether to wait for the response. Defaults to True.
+
+        :returns:
+            If `wait` is True, the 2-tuple of (`time`, `data`) returned by
+            :meth:`read`, otherwise a :class:`SerialTransaction`, whose
+            :meth:`SerialTransaction.result` returns that 2-tuple.
+
+        For example, polling a device on com3 that answers each command with
+        a line::
+
+            >>> print serial.transact('?T\\r', 16, timeout=500, \
+stop_char='\\n')
+            (1.3524498444040303, '23.51\\r\\n')
+            >>> poll = serial.prepare(value='?T\\r', timeout=500)
+            >>> reply = serial.prepare_read(16, timeout=500, stop_char='\\n')
+            >>> pending = [serial.transact(poll, reply, wait=False) \
+for _ in range(4)]
+            >>> print [p.result()[1] for p in pending]
+            ['23.51\\r\\n', '23.51\\r\\n', '23.52\\r\\n', '23.52\\r\\n']
+        '''
+        cdef SerialTransaction transaction
+        if not isinstance(command, PreparedWrite):
+            command = self.prepare(command, timeout)
+        if not isinstance(read_len, PreparedWrite):
+            read_len = self.prepare_read(read_len, timeout, stop_char)
+
+        transaction = SerialTransaction()
+        transaction.channel = self
+        transaction.write = self.send_async(command)
+        transaction.read = self.send_async(read_len)
+        if wait:
+            return transaction.result()
+        return transaction
+
+    cpdef object read_frame(SerialChannel self, object delimiter=None,
+                            DWORD size=0, object length_format=None,
+                            int length_includes_header=False, timeout=0):
+        '''
+        Reads a single frame from the port, using one of three framing
+        schemes: frames that end with a `delimiter`, frames of a fixed
+        `size`, or frames preceded by a header holding their length, given by
+        `length_format`. Exactly one of these must be specified.
+
+        Bytes read beyond the end of the frame are kept by the client for the
+        next call to :meth:`read_frame`, :meth:`readline`, or
+        :meth:`iter_frames`. They are not returned by :meth:`read` or
+        :meth:`readinto`, so these methods should not be mixed without
+        calling :meth:`clear_remainder`.
+
+        With a `delimiter`, the server is asked to stop reading at its last
+        byte, see `stop_char` in :meth:`read`, and the size of each request is
+        adapted to the length of the previous frames, so that typically a
+        single request is needed for each frame. For the other schemes, the
+        exact number of bytes missing from the frame is requested.
+
+        :Parameters:
+
+            `delimiter`: bytes
+                The, possibly multi-byte, delimiter that ends each frame.
+                Defaults to None.
+            `size`: unsigned int
+                The size of each frame in bytes. Defaults to 0.
+            `length_format`: str
+                The `struct` format of the header, e.g. `'<H'` or `'>I'`,
+                holding the length of the frame that follows it. Defaults to
+                None.
+            `length_includes_header`: bool
+                Whether the length in the header includes the header itself.
+                Defaults to False.
+            `timeout`: unsigned int
+                The timeout, in ms, of each read request, see :meth:`read`.
+                Defaults to 0.
+
+        :returns:
+            2-tuple of (`time`, `frame`). `time` is the time that the last
+            data of the frame was read in channel time,
+            :meth:`~pybarst.core.BarstServer.clock`. `frame` is the bytes of
+            the frame, without the delimiter or header. If a read request timed
+            out before the frame was complete, None is returned instead,
+            and the bytes of the incomplete frame are kept for the next call.
+
+        For example, with a loopback cable connected to com3::
+
+            >>> serial.write(value='apples\\r\\noranges\\r\\n')
+            (0.0524498444040303, 17)
+            >>> print serial.read_frame(delimiter='\\r\\n', timeout=100)
+            (0.0564584762837945, 'apples')
+            >>> print serial.read_frame(delimiter='\\r\\n', timeout=100)
+            (0.0564584762837945, 'oranges')
+            >>> print serial.read_frame(delimiter='\\r\\n', timeout=100)
+            None
+        '''
+        cdef bytes delim = None
+        cdef DWORD avail, req, dlen = 0, hsize = 0, total
+        cdef char *start
+        cdef char *found
+        cdef DWORD searched = 0
+        cdef double avg
+
+        if (delimiter is not None) + (size != 0) + (
+                length_format is not None) != 1:
+            raise BarstException(msg='Exactly one of delimiter, size, or '
+                                 'length_format must be specified')
+        if delimiter is not None:
+            delim = tencode(delimiter)
+            dlen = len(delim)
+            if not dlen:
+                raise BarstException(msg='The delimiter cannot be empty')
+        elif length_format is not None:
+            hsize = struct.calcsize(length_format)
+
+        while True:
+            avail = self.rx_end - self.rx_start
+            start = self.rx_buff + self.rx_start
+            if delim is not None:
+                # only search the bytes not searched before
+                found = NULL
+                while avail >= dlen and searched <= avail - dlen:
+                    found = <char *>memchr(start + searched, delim[0],
+                                           avail - dlen - searched + 1)
+                    if found == NULL:
+                        searched = avail - dlen + 1
+                        break
+                    if not memcmp(found, <char *>delim, dlen):
+                        break
+                    searched = found - start + 1
+                    found = NULL
+                if found != NULL:
+                    total = found - start
+                    if self.avg_frame:
+                        self.avg_frame = (0.75 * self.avg_frame +
+                                          0.25 * (total + dlen))
+                    else:
+                        self.avg_frame = total + dlen
+                    return self.rx_time, self._rx_take(total, dlen)
+
+                avg = self.avg_frame
+                req = self.max_read
+                if avg:
+                    req = min(self.max_read, max(<DWORD>(2 * avg), dlen))
+                if not self._rx_fill(req, timeout, delim[dlen - 1:]):
+                    return None
+            elif size:
+                if avail >= size:
+                    return self.rx_time, self._rx_take(size, 0)
+                if not self._rx_fill(min(size - avail, self.max_read),
+                                     timeout, ''):
+                    return None
+            else:
+                if avail >= hsize:
+                    total = struct.unpack(length_format, start[:hsize])[0]
+                    if length_includes_header:
+                        if total < hsize:
+                            raise BarstException(msg='Invalid frame length, '
+                                                 '{}'.format(total))
+                        total -= hsize
+                    if avail - hsize >= total:
+                        return self.rx_time, self._rx_take(total + hsize,
+                                                           0)[hsize:]
+                    req = total + hsize - avail
+                else:
+                    req = hsize - avail
+                if not self._rx_fill(min(req, self.max_read), timeout, ''):
+                    return None
+
+    cpdef object readline(SerialChannel self, object delimiter=b'\n',
+                          timeout=0):
+        '''
+        Reads a line from the port. Similar to :meth:`read_frame` with a
+        `delimiter`, except that the line returned includes the delimiter.
+
+        :Parameters:
+
+            `delimiter`: bytes
+                The, possibly multi-byte, line ending. Defaults to `'\\n'`.
+            `timeout`: unsigned int
+                See :meth:`read_frame`. Defaults to 0.
+
+        :returns:
+            2-tuple of (`time`, `line`), or None if a read request timed out
+            before the line was complete. See :meth:`read_frame`.
+        '''
+        res = self.read_frame(delimiter, 0, None, False, timeout)
+        if res is None:
+            return None
+        return res[0], res[1] + tencode(delimiter)
+
+    def iter_frames(SerialChannel self, delimiter=None, DWORD size=0,
+                    length_format=None, length_includes_header=False,
+                    timeout=0):
+        '''
+        A generator that yields the frames read with :meth:`read_frame`,
+        until a read request times out.
+
+        The parameters are the same as for :meth:`read_frame`.
+
+        For example::
+
+            >>> for t, line in serial.iter_frames(delimiter='\\r\\n', \
+timeout=500):
+            ...     print t, line
+        '''
+        while True:
+            res = self.read_frame(delimiter, size, length_format,
+                                  length_includes_header, timeout)
+            if res is None:
+                return
+            yield res
+
+    cpdef object clear_remainder(SerialChannel self):
+        '''
+        Discards the bytes kept by :meth:`read_frame` and returns them.
+        '''
+        return self._rx_take(self.rx_end - self.rx_start, 0)
+
+    cdef DWORD _rx_fill(SerialChannel self, DWORD read_len, DWORD timeout,
+                        object stop_char) except? 0xFFFFFFFF:
+        '''
+        Reads up to `read_len` bytes from the port and appends them to
+        `rx_buff`. Returns the number of bytes read.
+        '''
+        cdef DWORD n, avail = self.rx_end - self.rx_start
+        cdef char *buff
+        cdef double t
+        if self.rx_start:
+            memmove(self.rx_buff, self.rx_buff + self.rx_start, avail)
+            self.rx_start = 0
+            self.rx_end = avail
+        if self.rx_buff_size < avail + read_len:
+            buff = <char *>realloc(self.rx_buff, 2 * (avail + read_len))
+            if buff == NULL:
+                raise BarstException(NO_SYS_RESOURCE)
+            self.rx_buff = buff
+            self.rx_buff_size = 2 * (avail + read_len)
+
+        self._read(read_len, timeout, stop_char, &t, &n)
+        memcpy(self.rx_buff + self.rx_end, <char *>self.read_buff +
+               sizeof(SBaseOut) + sizeof(SBase) + sizeof(SSerialData), n)
+        self.rx_end += n
+        self.rx_time = t
+        return n
+
+    cdef bytes _rx_take(SerialChannel self, DWORD n, DWORD skip):
+        '''
+        Removes `n` + `skip` bytes from `rx_buff` and returns the first `n`.
+        '''
+        cdef bytes res = (self.rx_buff + self.rx_start)[:n] if n else b''
+        self.rx_start += n + skip
+        if self.rx_start == self.rx_end:
+            self.rx_start = self.rx_end = 0
+        return res
+
+    cpdef object makefile(SerialChannel self, mode='rb', int buffering=-1,
+                          encoding=None, errors=None, newline=None,
+                          timeout=0, read_ahead=0):
+        '''
+        Returns a file object that reads and writes through this channel,
+        similar to `socket.makefile`.
+
+        The file object is built on a :class:`~pybarst.serial.SerialIO` raw
+        stream, wrapped in `io.BufferedReader`, `io.BufferedWriter`, or
+        `io.BufferedRWPair`, and for text modes, in `io.TextIOWrapper`.
+        Closing the file object doesn't close the channel.
+
+        :Parameters:
+
+            `mode`: str
+                The mode of the file, containing `'r'` and/or `'w'`, and
+                optionally `'b'`. Defaults to `'rb'`.
+            `buffering`: int
+                The buffer size of the buffered object. If zero, the raw
+                stream is returned, which requires a binary mode. If negative,
+                the default `io.DEFAULT_BUFFER_SIZE` is used. Defaults to -1.
+            `encoding`, `errors`, `newline`:
+                Passed to `io.TextIOWrapper` in text mode.
+            `timeout`, `read_ahead`:
+                Passed to :class:`~pybarst.serial.SerialIO`.
+
+        For example, with a loopback cable connected to com3::
+
+            >>> f = serial.makefile('rw', timeout=100)
+            >>> f.write(u'apples.\\n' * 10)
+            >>> f.flush()
+            >>> print repr(f.readline())
+            u'apples.\\n'
+        '''
+        from pybarst.serial.stream import makefile
+        return makefile(self, mode, buffering, encoding, errors, newline,
+                        timeout, read_ahead)
 
     cpdef object set_state(SerialChannel self, int state, flush=False):
         '''
@@ -0,0 +1,74 @@
+
+include "../barst_defines.pxi"
+include "../inline_funcs.pxi"
+
+from pybarst.serial._serial cimport SerialChannel
+
+
+cdef class SerialPort(object):
+    cdef HANDLE pipe
+    cdef OVERLAPPED overlapped
+    cdef SBaseIn *request
+    cdef SBaseOut *response
+    cdef DWORD response_size
+    cdef int active
+    '''
+    Whether a read request is outstanding on :attr:`pipe`.
+    '''
+
+    cdef public SerialChannel channel
+    '''
+    The :class:`~pybarst.serial.SerialChannel` read by this port. Read only.
+    '''
+    cdef public object callback
+    '''
+    The callback called with each read, or None. Read only.
+    '''
+    cdef public object queue
+    '''
+    If :attr:`callback` is None, a `Queue` into which each read is put as a
+    (`time`, `data`) 2-tuple, otherwise None. Read only.
+    '''
+    cdef public DWORD read_len
+    '''
+    The maximum number of bytes requested by each read. Read only.
+    '''
+    cdef public DWORD timeout
+    '''
+    The timeout, in ms, of each read request. Read only.
+    '''
+    cdef public object stop_char
+    '''
+    The character on which the server finishes each read. Read only.
+    '''
+    cdef public unsigned long long reads
+    '''
+    The number of reads that returned data. Read only.
+    '''
+    cdef public object error
+    '''
+    The exception that stopped the reads of this port, or None. Read only.
+    '''
+
+    cdef int _open(SerialPort self) except -1
+    cdef int _issue(SerialPort self) except -1
+    cdef object _complete(SerialPort self)
+    cdef int _close(SerialPort self) except -1
+
+
+cdef class SerialHub(object):
+    cdef HANDLE wake_event
+    cdef list new_ports
+    cdef list removed_ports
+    cdef object lock
+    cdef object thread
+    cdef int running
+
+    cdef public list ports
+    '''
+    The list of :class:`SerialPort` instances of the hub. Read only.
+    '''
+    cdef public object error
+    '''
+    The exception that ended the I/O thread, or None. Read only.
+    '''
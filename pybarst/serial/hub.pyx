@@ -0,0 +1,402 @@
+'''
+Serial hub
+===========
+
+Reads many serial ports from a single thread.
+
+Each :meth:`~pybarst.serial.SerialChannel.read` blocks the calling thread
+until the server responds, so reading many ports at once with it requires a
+thread per port. A :class:`SerialHub` instead opens its own overlapped
+connection to each channel and keeps one read request outstanding on each of
+them. A single I/O thread waits on all of them at once, without the GIL, and
+dispatches the data of each completed read to the port's callback or queue,
+before requesting the next read.
+
+Because the hub opens a new client connection to each channel, the channel
+can still be written to, e.g. with
+:meth:`~pybarst.serial.SerialChannel.write`. However, reads by other clients
+of the same channel compete with the hub's reads for the port's data.
+
+For example, with devices that send lines on com3 and com4::
+
+    >>> from pybarst.serial.hub import SerialHub
+    >>> hub = SerialHub()
+    >>> def on_line(port, t, data):
+    ...     print port.channel.port_name, t, data
+    >>> for name in ('COM3', 'COM4'):
+    ...     serial = SerialChannel(server=server, port_name=name, \
+max_write=32, max_read=32)
+    ...     serial.open_channel()
+    ...     hub.add_port(serial, callback=on_line, stop_char='\\n')
+    >>> hub.start()
+    COM3 1.3524498444040303 23.51
+    COM4 1.3631544584525103 18.02
+    >>> hub.stop()
+'''
+
+__all__ = ('SerialHub', 'SerialPort')
+
+cdef extern from "stdlib.h" nogil:
+    void *malloc(size_t)
+    void free(void *)
+cdef extern from "string.h" nogil:
+    void *memset (void *, int, size_t)
+
+import threading
+from pybarst.core.exception import BarstException
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+cdef class SerialPort(object):
+    '''
+    A serial channel read by a :class:`SerialHub`.
+
+    This class is not instantiated by the user, it's returned by
+    :meth:`SerialHub.add_port`.
+    '''
+
+    def __cinit__(SerialPort self, **kwargs):
+        self.pipe = NULL
+        memset(&self.overlapped, 0, sizeof(OVERLAPPED))
+        self.request = NULL
+        self.response = NULL
+        self.response_size = 0
+        self.active = 0
+        self.channel = None
+        self.callback = None
+        self.queue = None
+        self.read_len = 0
+        self.timeout = 0
+        self.stop_char = ''
+        self.reads = 0
+        self.error = None
+
+    def __dealloc__(SerialPort self):
+        self._close()
+
+    cdef int _open(SerialPort self) except -1:
+        '''
+        Opens an overlapped connection to the channel and encodes the read
+        request.
+        '''
+        self.error = None
+        self.response_size = (sizeof(SBaseOut) + sizeof(SBase) +
+                              sizeof(SSerialData) + self.read_len)
+        self.request = <SBaseIn *>malloc(sizeof(SBaseIn) + sizeof(SBase) +
+                                         sizeof(SSerialData))
+        self.response = <SBaseOut *>malloc(self.response_size)
+        if self.request == NULL or self.response == NULL:
+            raise BarstException(NO_SYS_RESOURCE)
+        self.channel._encode_read(self.request, self.read_len, self.timeout,
+                                  self.stop_char)
+
+        memset(&self.overlapped, 0, sizeof(OVERLAPPED))
+        self.overlapped.hEvent = CreateEventA(NULL, 1, 0, NULL)
+        if self.overlapped.hEvent == NULL:
+            raise BarstException(WIN_ERROR(GetLastError()))
+        self.pipe = self.channel.open_pipe('rw', FILE_FLAG_OVERLAPPED)
+        return 0
+
+    cdef int _issue(SerialPort self) except -1:
+        '''
+        Sends the read request and starts reading its response without
+        waiting for it.
+        '''
+        cdef DWORD n, err
+        cdef int res = 0
+        with nogil:
+            ResetEvent(self.overlapped.hEvent)
+            if not WriteFile(self.pipe, self.request, self.request.dwSize, &n,
+                             &self.overlapped):
+                err = GetLastError()
+                if err != ERROR_IO_PENDING:
+                    res = WIN_ERROR(err)
+                elif not GetOverlappedResult(self.pipe, &self.overlapped, &n,
+                                             1):
+                    res = WIN_ERROR(GetLastError())
+
+            if not res:
+                ResetEvent(self.overlapped.hEvent)
+                if not ReadFile(self.pipe, self.response, self.response_size,
+                                &n, &self.overlapped):
+                    err = GetLastError()
+                    if err != ERROR_IO_PENDING:
+                        res = WIN_ERROR(err)
+        if res:
+            raise BarstException(res)
+        self.active = 1
+        return 0
+
+    cdef object _complete(SerialPort self):
+        '''
+        Parses the response of a completed read and dispatches its data.
+        '''
+        cdef DWORD read_size = 0, n = 0
+        cdef int res = 0
+        cdef SBaseOut *pbase_in = self.response
+        cdef DWORD header = (sizeof(SBaseOut) + sizeof(SBase) +
+                             sizeof(SSerialData))
+
+        self.active = 0
+        if not GetOverlappedResult(self.pipe, &self.overlapped, &read_size,
+                                   0):
+            raise BarstException(WIN_ERROR(GetLastError()))
+
+        if read_size == sizeof(SBaseIn) or read_size == sizeof(SBaseOut):
+            res = pbase_in.sBaseIn.nError
+            if not res:
+                res = UNEXPECTED_READ
+        elif (read_size < header or pbase_in.sBaseIn.eType != eResponseExD or
+              (<SBase *>(<char *>pbase_in + sizeof(SBaseOut))).eType !=
+              eSerialReadData):
+            res = UNEXPECTED_READ
+        else:
+            n = (<SSerialData *>(<char *>pbase_in + sizeof(SBaseOut) +
+                                 sizeof(SBase))).dwSize
+            if n > self.read_len or read_size != header + n:
+                res = UNEXPECTED_READ
+        if res:
+            raise BarstException(res)
+        if not n:
+            return
+
+        self.reads += 1
+        data = (<char *>pbase_in + header)[:n]
+        if self.callback is not None:
+            self.callback(self, pbase_in.dDouble, data)
+        else:
+            self.queue.put((pbase_in.dDouble, data))
+
+    cdef int _close(SerialPort self) except -1:
+        '''
+        Cancels the outstanding read and closes the connection.
+        '''
+        cdef DWORD n
+        if self.active:
+            CancelIo(self.pipe)
+            GetOverlappedResult(self.pipe, &self.overlapped, &n, 1)
+            self.active = 0
+        if self.pipe != NULL:
+            CloseHandle(self.pipe)
+            self.pipe = NULL
+        if self.overlapped.hEvent != NULL:
+            CloseHandle(self.overlapped.hEvent)
+            self.overlapped.hEvent = NULL
+        free(self.request)
+        self.request = NULL
+        free(self.response)
+        self.response = NULL
+        return 0
+
+
+cdef class SerialHub(object):
+    '''
+    Reads many :class:`~pybarst.serial.SerialChannel` channels from a single
+    I/O thread.
+
+    Ports are added with :meth:`add_port`, before or after :meth:`start` is
+    called. Once started, each port always has one read request outstanding,
+    which the server completes once it read `read_len` bytes, the port's
+    `stop_char`, or when its `timeout` elapsed. Reads that return no data,
+    e.g. when timing out, are not dispatched.
+
+    If reading from a port fails, or its callback raises an exception, the
+    port stops reading and the exception is stored in its
+    :attr:`SerialPort.error`, while the other ports keep reading.
+
+    At most `MAXIMUM_WAIT_OBJECTS - 1`, i.e. 63, ports can be added to a hub.
+    '''
+
+    def __cinit__(SerialHub self, **kwargs):
+        self.ports = []
+        self.new_ports = []
+        self.removed_ports = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = 0
+        self.error = None
+        self.wake_event = CreateEventA(NULL, 1, 0, NULL)
+        if self.wake_event == NULL:
+            raise BarstException(WIN_ERROR(GetLastError()))
+
+    def __dealloc__(SerialHub self):
+        if self.wake_event != NULL:
+            CloseHandle(self.wake_event)
+            self.wake_event = NULL
+
+    def add_port(SerialHub self, SerialChannel channel, callback=None,
+                 DWORD read_len=0, DWORD timeout=0, stop_char=''):
+        '''
+        Adds a channel to be read by the hub.
+
+        :Parameters:
+
+            `channel`: :class:`~pybarst.serial.SerialChannel`
+                The opened channel to read.
+            `callback`: callable
+                If not None, it's called from the I/O thread with each read
+                as `callback(port, time, data)`, where `port` is the
+                :class:`SerialPort`, and `time` and `data` are as returned by
+                :meth:`~pybarst.serial.SerialChannel.read`. It should return
+                quickly because the other ports are not serviced while it
+                runs. If None, the reads are put into the port's
+                :attr:`SerialPort.queue` instead. Defaults to None.
+            `read_len`: unsigned int
+                The number of bytes requested by each read. If zero,
+                :attr:`~pybarst.serial.SerialChannel.max_read` is used.
+                Defaults to 0.
+            `timeout`, `stop_char`:
+                The `timeout` and `stop_char` of each read, see
+                :meth:`~pybarst.serial.SerialChannel.read`.
+
+        :returns:
+            The :class:`SerialPort` of the channel.
+        '''
+        cdef SerialPort port
+        if not channel.connected:
+            raise BarstException(msg='The channel must be opened before it '
+                                 'can be added to the hub')
+        if not read_len:
+            read_len = channel.max_read
+        if read_len > channel.max_read:
+            raise BarstException(msg='The length of the string to read, {} '
+            'is longer than the maximum read size indicated, {}'.
+            format(read_len, channel.max_read))
+        if len(self.ports) >= MAXIMUM_WAIT_OBJECTS - 1:
+            raise BarstException(msg='A hub cannot read more than {} '
+                                 'ports'.format(MAXIMUM_WAIT_OBJECTS - 1))
+
+        port = SerialPort()
+        port.channel = channel
+        port.callback = callback
+        if callback is None:
+            port.queue = Queue()
+        port.read_len = read_len
+        port.timeout = timeout
+        port.stop_char = stop_char
+        with self.lock:
+            self.ports.append(port)
+            self.new_ports.append(port)
+            SetEvent(self.wake_event)
+        return port
+
+    def remove_port(SerialHub self, SerialPort port):
+        '''
+        Stops reading and removes a port previously added with
+        :meth:`add_port`. If the hub is running, the port is removed by the
+        I/O thread shortly after.
+        '''
+        with self.lock:
+            self.ports.remove(port)
+            if port in self.new_ports:
+                self.new_ports.remove(port)
+            else:
+                self.removed_ports.append(port)
+                SetEvent(self.wake_event)
+
+    def start(SerialHub self):
+        '''
+        Starts the I/O thread that reads the ports.
+        '''
+        if self.thread is not None:
+            raise BarstException(msg='The hub is already running')
+        self.error = None
+        self.running = 1
+        self.thread = threading.Thread(target=self._run, name='SerialHub')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(SerialHub self):
+        '''
+        Stops the I/O thread, canceling the outstanding reads, and waits for
+        it to exit. The hub can be started again afterwards.
+        '''
+        if self.thread is None:
+            return
+        with self.lock:
+            self.running = 0
+            SetEvent(self.wake_event)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _run(SerialHub self):
+        cdef list active = []
+        cdef list added, removed
+        cdef SerialPort port
+        cdef HANDLE *handles
+        cdef DWORD count, res
+        cdef int running
+
+        handles = <HANDLE *>malloc(MAXIMUM_WAIT_OBJECTS * sizeof(HANDLE))
+        if handles == NULL:
+            self.error = BarstException(NO_SYS_RESOURCE)
+            return
+        try:
+            while True:
+                with self.lock:
+                    running = self.running
+                    added = self.new_ports
+                    removed = self.removed_ports
+                    self.new_ports = []
+                    self.removed_ports = []
+                    ResetEvent(self.wake_event)
+
+                for port in removed:
+                    if port in active:
+                        active.remove(port)
+                    port._close()
+                if not running:
+                    break
+                for port in added:
+                    try:
+                        port._open()
+                        port._issue()
+                    except Exception as e:
+                        port.error = e
+                        port._close()
+                    else:
+                        active.append(port)
+
+                handles[0] = self.wake_event
+                count = 1
+                for port in active:
+                    handles[count] = port.overlapped.hEvent
+                    count += 1
+                with nogil:
+                    res = WaitForMultipleObjects(count, handles, 0, INFINITE)
+                if res == WAIT_FAILED:
+                    raise BarstException(WIN_ERROR(GetLastError()))
+
+                # service every port whose read completed, not just the first
+                # one signaled, so busy ports can't starve the others
+                for port in list(active):
+                    if (WaitForSingleObject(port.overlapped.hEvent, 0) !=
+                        WAIT_OBJECT_0):
+                        continue
+                    try:
+                        port._complete()
+                        port._issue()
+                    except Exception as e:
+                        port.error = e
+                        active.remove(port)
+                        port._close()
+        except Exception as e:
+            self.error = e
+        finally:
+            free(handles)
+            for port in active:
+                port._close()
+            with self.lock:
+                for port in self.ports:
+                    port._close()
+                for port in self.removed_ports:
+                    port._close()
+                self.new_ports = list(self.ports)
+                self.removed_ports = []
+                self.running = 0
@@ -0,0 +1,129 @@
+'''
+Serial streams
+===============
+
+File-like access to a :class:`~pybarst.serial.SerialChannel`.
+
+:class:`SerialIO` is an `io.RawIOBase` raw stream that reads and writes
+through a serial channel. It can be wrapped with the standard `io` buffered
+and text classes, which is what
+:meth:`~pybarst.serial.SerialChannel.makefile` does.
+'''
+
+__all__ = ('SerialIO', 'makefile')
+
+import io
+
+
+class SerialIO(io.RawIOBase):
+    '''
+    A raw stream that reads and writes through a
+    :class:`~pybarst.serial.SerialChannel`.
+
+    Reads use :meth:`~pybarst.serial.SerialChannel.readinto`, so the data is
+    copied directly into the caller's buffer. Each read requests up to
+    `read_ahead` bytes from the server, which returns once that many bytes
+    were read or `timeout` elapsed. Writes use
+    :meth:`~pybarst.serial.SerialChannel.write_all`, so writes larger than
+    :attr:`~pybarst.serial.SerialChannel.max_write` are split into
+    :attr:`~pybarst.serial.SerialChannel.max_write` sized writes.
+
+    A read that times out without reading anything returns zero bytes, which
+    the `io` classes treat as the end of the stream, similarly to pyserial.
+
+    :Parameters:
+
+        `channel`: :class:`~pybarst.serial.SerialChannel`
+            The opened channel through which to read and write.
+        `timeout`: unsigned int
+            The timeout, in ms, of each read and write request. If zero, reads
+            wait until `read_ahead` bytes were read. See
+            :meth:`~pybarst.serial.SerialChannel.read`. Defaults to 0.
+        `read_ahead`: unsigned int
+            The maximum number of bytes requested in a single read request.
+            If zero, :attr:`~pybarst.serial.SerialChannel.max_read` is used.
+            With a zero `timeout`, this should be small enough not to wait for
+            data that never arrives. Defaults to 0.
+        `mode`: str
+            Whether the stream is readable, `'r'`, writable, `'w'`, or both.
+            Defaults to `'rw'`.
+
+    For example, with a loopback cable connected to com3::
+
+        >>> raw = SerialIO(serial, timeout=100)
+        >>> reader = io.BufferedReader(raw)
+        >>> raw.write(b'apples with oranges.')
+        20
+        >>> print reader.read(6)
+        apples
+    '''
+
+    def __init__(self, channel, timeout=0, read_ahead=0, mode='rw'):
+        super(SerialIO, self).__init__()
+        self.channel = channel
+        self.timeout = timeout
+        self.read_ahead = read_ahead
+        self._readable = 'r' in mode
+        self._writable = 'w' in mode
+
+    def readable(self):
+        return self._readable
+
+    def writable(self):
+        return self._writable
+
+    def seekable(self):
+        return False
+
+    def readinto(self, b):
+        self._checkClosed()
+        if not self._readable:
+            raise io.UnsupportedOperation('not readable')
+        view = memoryview(b)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        n = len(view)
+        if self.read_ahead:
+            n = min(n, self.read_ahead)
+        if not n:
+            return 0
+        return self.channel.readinto(view[:n], self.timeout)[1]
+
+    def write(self, b):
+        self._checkClosed()
+        if not self._writable:
+            raise io.UnsupportedOperation('not writable')
+        return self.channel.write_all(b, self.timeout)[1]
+
+
+def makefile(channel, mode='rb', buffering=-1, encoding=None, errors=None,
+             newline=None, timeout=0, read_ahead=0):
+    '''
+    Returns a file object for the channel. See
+    :meth:`~pybarst.serial.SerialChannel.makefile`.
+    '''
+    if not set(mode) <= set('rwb') or not set(mode) & set('rw'):
+        raise ValueError('invalid mode {}'.format(mode))
+    reading = 'r' in mode
+    writing = 'w' in mode
+    binary = 'b' in mode
+    raw = SerialIO(channel, timeout=timeout, read_ahead=read_ahead,
+                   mode=('r' if reading else '') + ('w' if writing else ''))
+    if buffering < 0:
+        buffering = io.DEFAULT_BUFFER_SIZE
+    if not buffering:
+        if not binary:
+            raise ValueError('unbuffered streams must be binary')
+        return raw
+
+    if reading and writing:
+        buffer = io.BufferedRWPair(raw, raw, buffering)
+    elif reading:
+        buffer = io.BufferedReader(raw, buffering)
+    else:
+        buffer = io.BufferedWriter(raw, buffering)
+    if binary:
+        return buffer
+    text = io.TextIOWrapper(buffer, encoding, errors, newline)
+    text.mode = mode
+    return text
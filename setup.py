@@ -16,27 +16,37 @@ if 'BARST_INCLUDE' in os.environ:
 
 sources = ['core/server.pyx',
            'core/exception.pyx',
+           'core/edges.pyx',
+           'core/reactor.pyx',
            'ftdi/_ftdi.pyx',
            'ftdi/switch.pyx',
            'ftdi/adc.pyx',
            'rtv/_rtv.pyx',
+           'rtv/convert.pyx',
            'serial/_serial.pyx',
+           'serial/hub.pyx',
            'mcdaq/_mcdaq.pyx'
            ]
 
 dependencies = {
     'core/server.pyx': ['core/exception.pyx', 'core/server.pxd'],
+    'core/edges.pyx': ['core/exception.pyx', 'core/edges.pxd'],
+    'core/reactor.pyx': ['core/server.pyx', 'core/exception.pyx',
+                         'core/reactor.pxd'],
     'ftdi/_ftdi.pyx': ['core/server.pyx', 'core/exception.pyx',
                       'ftdi/_ftdi.pxd'],
     'ftdi/switch.pyx': ['ftdi/_ftdi.pyx', 'core/exception.pyx',
-                        'ftdi/switch.pxd'],
+                        'core/edges.pyx', 'ftdi/switch.pxd'],
     'ftdi/adc.pyx': ['ftdi/_ftdi.pyx', 'core/exception.pyx',
                         'ftdi/adc.pxd'],
     'rtv/_rtv.pyx': ['core/server.pyx', 'core/exception.pyx', 'rtv/_rtv.pxd'],
+    'rtv/convert.pyx': ['core/exception.pyx'],
     'serial/_serial.pyx': ['core/server.pyx', 'core/exception.pyx',
                            'serial/_serial.pxd'],
+    'serial/hub.pyx': ['serial/_serial.pyx', 'core/exception.pyx',
+                       'serial/hub.pxd'],
     'mcdaq/_mcdaq.pyx': ['core/server.pyx', 'core/exception.pyx',
-                           'mcdaq/_mcdaq.pxd']}
+                         'core/edges.pyx', 'mcdaq/_mcdaq.pxd']}
 
 
 def get_modulename_from_file(filename):
@@ -0,0 +1,135 @@
+'''
+Tests :func:`pybarst.core.bringup.bring_up` with stub servers and channels,
+so no Barst server or hardware is needed.
+'''
+import pybarst.ftdi
+from pybarst.core.server import BarstServer
+from pybarst.core.bringup import bring_up
+from pybarst.core.exception import BarstException
+from pybarst.ftdi import FTDIChannel
+from pybarst.rtv import RTVChannel
+from pybarst.serial import SerialChannel
+import logging
+import threading
+logging.root.setLevel(logging.DEBUG)
+
+lock = threading.Lock()
+calls = []
+
+
+def log(*args):
+    with lock:
+        calls.append(args)
+
+
+class StubServer(BarstServer):
+
+    def open_server(self):
+        log('open_server', self.pipe_name)
+        self.connected = True
+
+    def get_manager(self, manager):
+        log('get_manager', manager)
+        return {'chan': 0, 'chan_id': manager, 'version': 0}
+
+
+class StubRTV(RTVChannel):
+
+    def open_channel(self):
+        log('open_channel', self)
+
+    def set_state(self, state, flush=False):
+        log('set_state', self, state)
+
+
+class StubSerial(SerialChannel):
+
+    fail = False
+
+    def open_channel(self):
+        log('open_channel', self)
+
+    def set_state(self, state, flush=False):
+        log('set_state', self, state)
+        if self.fail:
+            raise BarstException(msg='activation failed')
+
+
+class StubDevice(object):
+
+    def open_channel(self):
+        log('open_channel', self)
+
+    def set_state(self, state, flush=False):
+        log('set_state', self, state)
+
+
+def stub_open_channels(channels, alloc=False, threads=None):
+    # a channel that doesn't exist on the server is only created with alloc
+    if not alloc:
+        raise BarstException(msg='The FTDI channel does not exist')
+    log('open_channels', alloc)
+    return [[StubDevice(), StubDevice()] for chan in channels]
+
+pybarst.ftdi.open_channels = stub_open_channels
+
+
+def make_channels():
+    server = StubServer(pipe_name=r'\\.\pipe\TestPipe')
+    server2 = StubServer(pipe_name=r'\\.\pipe\TestPipe2')
+    ftdi = FTDIChannel(channels=[], server=server, desc='Birch Board rev1 A')
+    rtv = StubRTV(chan=0, server=server)
+    serial = StubSerial(server=server2, port_name='COM3', max_write=32,
+                        max_read=32)
+    return ftdi, rtv, serial
+
+# everything opens and is activated
+ftdi, rtv, serial = make_channels()
+(devs, rtv_ready, serial_ready), report = bring_up([ftdi, rtv, serial])
+assert len(devs) == 2
+assert rtv_ready is rtv and serial_ready is serial
+assert len([c for c in calls if c[0] == 'open_server']) == 2
+assert ('get_manager', 'ftdi') in calls and ('get_manager', 'rtv') in calls
+for item in devs + [rtv, serial]:
+    assert ('open_channel', item) in calls
+    assert ('set_state', item, True) in calls
+    # an item is only activated after it was opened
+    assert (calls.index(('open_channel', item)) <
+            calls.index(('set_state', item, True)))
+steps = set(step['step'] for step in report)
+assert steps == set(['open_server', 'get_manager', 'open_channel',
+                     'set_state', 'total'])
+assert report[-1]['step'] == 'total'
+print(report)
+
+# without alloc, the missing FTDI channel fails and nothing is activated
+calls[:] = []
+ftdi, rtv, serial = make_channels()
+try:
+    bring_up([ftdi, rtv, serial], alloc=False)
+except BarstException, e:
+    print(e)
+else:
+    assert False
+assert not [c for c in calls if c[0] == 'set_state']
+
+# a failed activation is raised, after everything was opened
+calls[:] = []
+ftdi, rtv, serial = make_channels()
+serial.fail = True
+try:
+    bring_up([ftdi, rtv, serial])
+except BarstException, e:
+    print(e)
+else:
+    assert False
+assert ('set_state', serial, True) in calls
+assert len([c for c in calls if c[0] == 'open_channel']) == 4
+
+# nothing is activated when activate is False
+calls[:] = []
+ftdi, rtv, serial = make_channels()
+bring_up([ftdi, rtv, serial], activate=False)
+assert not [c for c in calls if c[0] == 'set_state']
+
+print('All tests PASSED!')
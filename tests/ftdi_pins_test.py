@@ -1,7 +1,8 @@
 import pybarst
 from pybarst.core.server import BarstServer
-from pybarst.ftdi import FTDIChannel
+from pybarst.ftdi import FTDIChannel, open_channels
 from pybarst.ftdi.switch import PinSettings, FTDIPinIn, FTDIPinOut
+from pybarst.core.edges import EdgeDetector
 import logging
 logging.root.setLevel(logging.DEBUG)
 import time as pytime
@@ -80,6 +81,28 @@ assert len(channels2) == 6
 for i in range(len(bases)):
     assert isinstance(channels2[i], bases[i])
 
+# the device is listed as active in the server's inventory
+inventory = server.get_ftdi_inventory()
+dev = server.find_ftdi_device(desc='Birch Board rev1 A')
+assert dev is inventory['description'][b'Birch Board rev1 A']
+assert dev['active'] and dev['chan'] == ftdi.chan
+assert inventory['location'][dev['dev_loc']] is dev
+assert server.get_ftdi_inventory() is inventory
+server.invalidate_ftdi_inventory()
+assert server.get_ftdi_inventory() is not inventory
+
+# discover the same channel with two more clients at once
+ftdi3 = FTDIChannel(channels=[], server=server, desc='Birch Board rev1 A')
+ftdi4 = FTDIChannel(channels=[], server=server, desc='Birch Board rev1 A')
+channels3, channels4 = open_channels([ftdi3, ftdi4])
+for devs in (channels3, channels4):
+    assert len(devs) == 6
+    for i in range(len(bases)):
+        assert isinstance(devs[i], bases[i])
+        assert devs[i].settings.bitmask == channels2[i].settings.bitmask
+ftdi3.close_channel_client()
+ftdi4.close_channel_client()
+
 
 '----------------------- Open all devices --------------------------'
 print('try a read/write, it should fail because device is not open yet')
@@ -153,6 +176,19 @@ client2_out.write(buff_mask=0xFF, buffer=[0xFF])
 t2, val2 = client2_in.read()
 assert bi_mask == val2[0] & bi_mask
 
+# only the pins that changed are returned as events
+detector = EdgeDetector(8)
+assert client1_in.read_events(detector, max_samples=2) == []
+client1_out.write(buff_mask=0xFF, buffer=[0x00])
+events = client1_in.read_events(detector)
+print(events)
+assert set([e[1] for e in events]) == set(
+    [i for i in range(8) if bi_mask & (1 << i)])
+assert all([e[2] == 0 for e in events])
+assert detector.suppressed >= 2
+client1_out.write(buff_mask=0xFF, buffer=[0xFF])
+assert all([e[2] == 1 for e in client1_in.read_events(detector)])
+
 
 '------------------ test 4 byte read/write devices --------------------'
 bi_mask = bi_mask << 3
@@ -182,6 +218,49 @@ assert val[0] & bi_mask == bi_mask
 assert len(val) == 4
 assert len(set(val)) == 1
 
+# compile a waveform for pins 4 and 5 and write it
+prog = client1_out.compile_waveform({4: [(0, 3), (1, 2)], 5: [(1, 6)]},
+                                    units='ticks')
+assert prog.mask == 0b00110000
+assert prog.duration == 4
+assert prog.writes == [[(3, 0b00100000, 0b00110000),
+                        (1, 0b00110000, 0b00110000)]]
+# the same waveforms are cached
+assert prog is client1_out.compile_waveform({5: [(1, 6)],
+                                             4: [(0, 3), (1, 2)]}, 'ticks')
+# drive the pins low first so that only the program can set them high
+client1_out.write(buff_mask=0xFF, buffer=[0x00])
+t, val = client1_in.read()
+assert val[0] & bi_mask == 0x00
+ts = client1_out.write_program(prog)
+assert len(ts) == 1
+t, val = client1_in.read()
+assert val[0] & prog.mask == prog.mask
+# prepared messages are sent as is
+high = client1_out.prepare(buff_mask=0xFF, buffer=[0xFF])
+low = client1_out.prepare(data=[(1, 0x00, 0xFF)])
+t = client1_out.send(low)
+t2, val = client1_in.read()
+assert val[0] & bi_mask == 0x00
+t3 = client1_out.send(high)
+assert t3 > t2 > t
+t, val = client1_in.read()
+assert val[0] & bi_mask == bi_mask
+print('a message prepared by one client cannot be sent by another')
+try:
+    client2_out.send(high)
+except Exception, e:
+    print(e)
+else:
+    assert False
+print('pin 3 is not controlled by the device, should raise error')
+try:
+    client1_out.compile_waveform({3: [(1, 0.001)]})
+except Exception, e:
+    print(e)
+else:
+    assert False
+
 
 '------------------ test continuous read device --------------------'
 bi_mask = (bi_mask << 3) & 0xFF  # make sure it's only 8 bit
@@ -2,7 +2,8 @@ import pybarst
 from pybarst.core.server import BarstServer
 from pybarst.ftdi import FTDIChannel
 from pybarst.ftdi.switch import (SerializerSettings, FTDISerializerIn,
-                                 FTDISerializerOut)
+                                 FTDISerializerOut, CoalescedSerializerOut)
+import threading
 import logging
 logging.root.setLevel(logging.DEBUG)
 import time as pytime
@@ -120,10 +121,64 @@ assert len(val) == 16
 assert len(val) == len(val2)
 assert t2 > t
 
+# the packed and change reads must agree with the list read
+t3, packed = client1_in.read_packed()
+assert len(packed) == 2
+assert t3 > t
+t4, packed_int = client1_in.read_packed(as_int=True)
+assert t4 > t3
+t5, set_high, set_low = client1_in.read_changes()
+assert t5 > t4
+for i in set_high:
+    assert not (packed_int >> i) & 1
+for i in set_low:
+    assert (packed_int >> i) & 1
+t6, val = client1_in.read()
+t7, set_high, set_low = client1_in.read_changes()
+for i in set_high:
+    assert not val[i]
+for i in set_low:
+    assert val[i]
+
 # write some
 t = client1_out.write(set_high=[3], set_low=[5, 1])
 t2 = client2_out.write(set_high=[3], set_low=[2, 1])
 assert t2 > t
+msg = client1_out.prepare(set_high=[3], set_low=[5, 1])
+t3 = client1_out.send(msg)
+t4 = client1_out.send(msg)
+assert t4 > t3 > t2
+
+# writes from many threads are merged into a single write
+coalesced = CoalescedSerializerOut(client1_out, window=0.2)
+times = []
+go = threading.Event()
+
+
+def write_lines(i):
+    # start all the writes together
+    go.wait()
+    times.append(coalesced.write(set_high=[i], set_low=[7 - i]))
+
+threads = [threading.Thread(target=write_lines, args=(i, ))
+           for i in range(3)]
+for thread in threads:
+    thread.start()
+go.set()
+for thread in threads:
+    thread.join()
+assert len(times) == 3
+assert len(set(times)) == 1
+# lines already in this state are not sent again
+assert coalesced.write(set_high=[0]) == times[0]
+coalesced.invalidate()
+assert coalesced.write(set_high=[0]) > times[0]
+try:
+    coalesced.write(set_high=[8])
+except Exception, e:
+    print(e)
+else:
+    assert False
 
 print("Writing to pin outside 0-7 is invalid since we set it to only one "
       "board")
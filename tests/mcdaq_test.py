@@ -1,6 +1,10 @@
 import pybarst
 from pybarst.core.server import BarstServer
-from pybarst.mcdaq import MCDAQChannel
+from pybarst.mcdaq import MCDAQChannel, MCDAQSequence, unpack_lines, \
+    line_transitions
+from pybarst.core.edges import EdgeDetector
+from pybarst.core.reactor import Reactor
+from array import array
 import logging
 logging.root.setLevel(logging.DEBUG)
 import time as pytime
@@ -66,6 +70,17 @@ t = daq.write(mask=0x00FF, value=0x000F)
 t2 = daq.write(mask=0x00FF, value=0x0000)
 assert t2 > t
 
+# pipelined writes are acknowledged in order
+high = daq.prepare(mask=0x00FF, value=0x000F)
+low = daq.prepare(mask=0x00FF, value=0x0000)
+pending = [daq.send_async(msg) for msg in [high, low] * 10]
+# a synchronous write reads the pending responses first
+t3 = daq.write(mask=0x00FF, value=0x0000)
+assert all([p.done for p in pending])
+times = [p.result() for p in pending]
+assert times == sorted(times)
+assert t2 < times[0] and times[-1] < t3
+
 
 daq2.close_channel_client()
 daq.close_channel_server()
@@ -148,6 +163,71 @@ assert t4 - t3 > 5.5
 # stop the read
 daq.cancel_read(flush=True)
 
+# read the accumulated samples at once
+times = array('d', [0.] * 4096)
+values = array('H', [0] * 4096)
+n = daq.read_many(times, values)
+assert n >= 1
+pytime.sleep(.5)
+n = daq.read_many(times, values)
+print('Read {} samples at once'.format(n))
+assert n > 1
+assert list(times[:n]) == sorted(times[:n])
+lines = unpack_lines(values, n)
+assert len(memoryview(lines).tobytes()) == n * 16
+assert len(line_transitions(times, values, n)) == 16
+daq.cancel_read(flush=True)
+
+try:
+    # this should raise an exception b/c the arrays have the wrong type
+    daq.read_many(values, times)
+except Exception, e:
+    print(e)
+else:
+    assert False
+
+# only changes are returned, the unchanged samples are counted
+detector = EdgeDetector(16)
+events = daq.read_events(detector, max_samples=100)
+print(events, detector.samples, detector.suppressed)
+assert detector.samples >= 100 or events
+assert detector.suppressed <= detector.samples
+daq.cancel_read(flush=True)
+
+# play a timed sequence of writes from the sequence thread
+steps = [(0, 0x00FF, 0x000F), (0.005, 0x00FF, 0x0000),
+         (0.005, 0x00FF, 0x000F), (0.02, 0x00FF, 0x0000)]
+times = daq.play_sequence(steps)
+assert len(times) == len(steps)
+offsets = MCDAQSequence(daq, steps).offsets
+for i in range(1, len(steps)):
+    print(times[i] - times[0], offsets[i])
+    assert abs(times[i] - times[0] - offsets[i]) < 0.002
+sequence = daq.play_sequence(steps, wait=False)
+sequence.stop()
+assert sequence.done
+
+try:
+    # this should raise an exception b/c the sequence is empty
+    MCDAQSequence(daq, [])
+except Exception, e:
+    print(e)
+else:
+    assert False
+
+# read the continuous samples from a reactor's thread
+reactor = Reactor()
+key = reactor.register(daq)
+reactor.start()
+t, val = key.queue.get(timeout=5)
+pytime.sleep(.5)
+reactor.stop()
+print(key.reads, key.error)
+assert key.reads > 1
+assert key.error is None
+reactor.unregister(key)
+daq.cancel_read(flush=True)
+
 
 daq2.close_channel_client()
 daq.close_channel_server()
@@ -1,6 +1,10 @@
 import pybarst
 from pybarst.core.server import BarstServer
 from pybarst.rtv import RTVChannel
+from pybarst.rtv.convert import convert, converted_size, frame_difference
+from pybarst.rtv.capture import RTVCapture, RTVCaptureGroup, RTVChangeGate
+from pybarst.rtv.record import RTVRecorder, RTVRecording
+from pybarst.core import shared
 import logging
 logging.root.setLevel(logging.DEBUG)
 import time as pytime
@@ -127,8 +131,246 @@ assert len(data) == rtv.buffer_size
 assert len(data) == rtv.height * rtv.width * rtv.bpp
 assert rtv.bpp == 3
 
+rtv.close_channel_server()
+
+
+# read directly into the frames of a frame pool
+rtv.frame_pool_size = 2
+rtv.lossless = False
+rtv.open_channel()
+rtv.set_state(state=True)
+frame = rtv.read_frame()
+frame2 = rtv.read_frame()
+print(frame.time, frame.size)
+assert frame2.time > frame.time
+assert frame.size == rtv.buffer_size
+data = memoryview(frame)
+assert data.shape == (rtv.height, rtv.width, rtv.bpp)
+try:
+    # this should raise an exception b/c the pool is exhausted
+    rtv.read_frame()
+except Exception, e:
+    print(e)
+else:
+    assert False
+try:
+    # this should raise an exception b/c the buffer is still in use
+    frame.release()
+except Exception, e:
+    print(e)
+else:
+    assert False
+del data
+frame.release()
+frame2.release()
+frame = rtv.read_frame()
+frame.release()
+rtv.set_state(state=False, flush=True)
 
 rtv.close_channel_server()
+
+
+# capture in rgb16 and convert the frames
+rtv.frame_fmt = 'rgb16'
+rtv.open_channel()
+assert rtv.bpp == 2
+rtv.set_state(state=True)
+frame = rtv.read_frame()
+out = bytearray(converted_size('rgb24', rtv.width, rtv.height))
+assert convert(frame, rtv.frame_fmt, rtv.width, rtv.height, 'rgb24',
+               out) is out
+assert len(out) == rtv.width * rtv.height * 3
+gray = convert(frame, rtv.frame_fmt, rtv.width, rtv.height, 'gray',
+               threads=1)
+assert len(gray) == rtv.width * rtv.height
+planar = convert(frame, rtv.frame_fmt, rtv.width, rtv.height, 'planar')
+assert planar[:rtv.width * rtv.height] == out[0::3]
+try:
+    # this should raise an exception b/c the output is too small
+    convert(frame, rtv.frame_fmt, rtv.width, rtv.height, 'rgb24', gray)
+except Exception, e:
+    print(e)
+else:
+    assert False
+frame.release()
+rtv.set_state(state=False, flush=True)
+
+rtv.close_channel_server()
+
+
+# capture in a background thread
+rtv.frame_fmt = 'rgb24'
+rtv.frame_pool_size = 0
+rtv.lossless = True
+rtv.open_channel()
+capture = RTVCapture(rtv, policy='decimate', fps=10)
+capture.start()
+times = []
+for t, data in capture:
+    assert len(data) == rtv.buffer_size
+    times.append(t)
+    if len(times) == 5:
+        break
+capture.stop()
+print(capture.received, capture.dropped, capture.decimated)
+assert capture.received >= 5
+assert capture.decimated
+for i in range(1, len(times)):
+    assert times[i] - times[i - 1] >= 0.1
+
+# only the most recent image is kept, reading into a frame pool
+rtv.close_channel_server()
+rtv.frame_pool_size = 4
+rtv.open_channel()
+capture = RTVCapture(rtv, policy='keep_latest')
+capture.start()
+pytime.sleep(1)
+t, frame = capture.latest()
+frame.release()
+t2, frame = capture.get()
+assert t2 > t
+frame.release()
+capture.stop()
+assert capture.dropped
+assert capture.error is None
+rtv.close_channel_server()
+
+# record the images and read them back
+rtv.open_channel()
+recorder = RTVRecorder(rtv, 'rtv_test.raw', max_frames=10)
+recorder.start()
+pytime.sleep(1)
+recorder.stop()
+print(recorder.frames_written, recorder.skipped, recorder.dropped)
+assert recorder.frames_written == 10
+assert recorder.skipped
+recording = RTVRecording('rtv_test.raw')
+assert len(recording) == 10
+assert recording.frame_fmt == rtv.frame_fmt
+t, img = recording[3]
+assert len(memoryview(img).tobytes()) == rtv.buffer_size
+assert recording.nearest(t) == 3
+assert recording.nearest(t + 100) == 9
+del img
+recording.close()
+rtv.close_channel_server()
+
+# capture from two ports at once, there should be a port 1 available
+rtv2 = RTVChannel(server=server, chan=1, video_fmt='full_NTSC',
+                  frame_fmt='rgb24', lossless=True, frame_pool_size=4)
+rtv.open_channel()
+rtv2.open_channel()
+group = RTVCaptureGroup([rtv, rtv2])
+group.start()
+for i in range(5):
+    frame_set = group.get()
+    print(frame_set.time, frame_set.skew)
+    assert len(frame_set.frames) == 2
+    assert max(frame_set.skew) == 0
+    assert min(frame_set.skew) >= -group.tolerance
+    frame_set.release()
+group.stop()
+print(group.sets, group.missing)
+assert group.sets == 5
+rtv2.close_channel_server()
+rtv.close_channel_server()
+
+# only store images that changed, a static scene should mostly be skipped
+rtv.open_channel()
+gate = RTVChangeGate(threshold=255, refresh=0.5)
+capture = RTVCapture(rtv, gate=gate)
+capture.start()
+pytime.sleep(2)
+capture.stop()
+print(gate.passed, gate.skipped, capture.gated, gate.difference)
+# with the highest threshold, only the refreshes pass
+assert 3 <= gate.passed <= 5
+assert gate.skipped == capture.gated
+t, data = capture.get()
+assert frame_difference(data, data, rtv.frame_fmt, rtv.width,
+                        rtv.height) == 0
+rtv.close_channel_server()
+
+# read only regions of the images
+rtv.open_channel()
+rtv.set_state(state=True)
+t, (center, half) = rtv.read_rois([(160, 120, 320, 240), (0, 0, 640, 480, 2)])
+assert len(center) == 320 * 240 * rtv.bpp
+assert len(half) == 320 * 240 * rtv.bpp
+out = [bytearray(3 * 3 * rtv.bpp)]
+t2, res = rtv.read_rois([(0, 0, 5, 5, 2)], out)
+assert t2 > t
+assert res[0] is out[0]
+try:
+    # this should raise an exception b/c the region is outside the image
+    rtv.read_rois([(600, 0, 50, 10)])
+except Exception, e:
+    print(e)
+else:
+    assert False
+rtv.set_state(state=False, flush=True)
+rtv.close_channel_server()
+
+# share the images through shared memory, which requires python 3.8+
+if shared.shared_memory is not None:
+    rtv.open_channel()
+    publisher = shared.SharedPublisher(rtv, num_slots=8)
+    subscriber = shared.SharedSubscriber(publisher.name)
+    assert subscriber.info['width'] == rtv.width
+    publisher.start()
+    record = subscriber.read(timeout=5)
+    assert record is not None
+    assert len(record.data) == rtv.buffer_size
+    assert record.valid
+    del record
+    # fall behind, the overwritten images are counted as lost
+    pytime.sleep(1)
+    record = subscriber.read()
+    print(record.seq, subscriber.lost)
+    assert subscriber.lost
+    del record
+    publisher.stop()
+    assert publisher.error is None
+    subscriber.close()
+    publisher.close()
+    rtv.close_channel_server()
+
+    # the MC DAQ and ADC record layouts round trip through decode
+    import struct
+    from array import array
+    from collections import namedtuple
+    publisher = shared.SharedPublisher(slot_size=10 * 16,
+                                       info={'kind': 'mcdaq'})
+    subscriber = shared.SharedSubscriber(publisher.name)
+    publisher._publish_sample(1.5, 7)
+    publisher.publish(2., struct.pack('<2d2H', 2., 3., 8, 9))
+    times, values = subscriber.read(timeout=1).decode()
+    assert list(times) == [1.5] and list(values) == [7]
+    del times, values
+    times, values = subscriber.read(timeout=1).decode()
+    assert list(times) == [2., 3.] and list(values) == [8, 9]
+    del times, values
+    subscriber.close()
+    publisher.close()
+
+    ADCData = namedtuple('ADCData', [
+        'count', 'chan1_ts_idx', 'chan2_ts_idx', 'ts', 'rate', 'fullness',
+        'chan1_oor', 'chan2_oor', 'noref', 'bad_count', 'overflow_count',
+        'chan1_data', 'chan2_data'])
+    publisher = shared.SharedPublisher(
+        slot_size=shared.adc_header.size + 16 * 4, info={'kind': 'adc'})
+    subscriber = shared.SharedSubscriber(publisher.name)
+    publisher._publish_adc(ADCData(
+        3, 0, 1, 1.25, 1000., .5, 0, 1, 0, 40000, 65535,
+        array('d', [1., 2.]), array('d', [3.])))
+    data = subscriber.read(timeout=1).decode()
+    assert data[:11] == (3, 0, 1, 1.25, 1000., .5, 0, 1, 0, 40000, 65535)
+    assert list(data.chan1_data) == [1., 2.]
+    assert list(data.chan2_data) == [3.]
+    del data
+    subscriber.close()
+    publisher.close()
+
 server.close_manager('rtv')
 
 print('All tests PASSED!')
@@ -1,7 +1,9 @@
 import pybarst
 from pybarst.core.server import BarstServer
 from pybarst.serial import SerialChannel
+from pybarst.serial.hub import SerialHub
 import logging
+import struct
 logging.root.setLevel(logging.DEBUG)
 
 server = BarstServer(barst_path=r'C:\Program Files\Barst\Barst.exe',
@@ -88,6 +90,85 @@ time, val2 = serial.read(read_len=32, timeout=10000)
 print(time, val2)
 assert len(val) + len(val2) == len(text)
 
+# pipelined writes return the same results as write
+msg = serial.prepare(value='apples.', timeout=10000)
+pending = [serial.send_async(msg) for i in range(3)]
+time, val = serial.read(read_len=21, timeout=10000)
+print(time, val)
+assert val == 'apples.' * 3
+for p in pending:
+    assert p.done
+    assert p.result()[1] == len('apples.')
+
+# read directly into a buffer
+buffer = bytearray(32)
+serial.write(value='apples.', timeout=10000)
+time, n = serial.readinto(buffer, timeout=10000, stop_char='.')
+assert n == len('apples.')
+assert buffer[:n] == b'apples.'
+
+# write from buffers, and write more than max_write
+serial.write(value=bytearray(b'apples.'), timeout=10000)
+serial.write(value=memoryview(b'oranges.')[:3], timeout=10000)
+time, val = serial.read(read_len=10, timeout=10000)
+assert val == b'apples.ora'
+text = b'apples with oranges.' * 3
+time, n = serial.write_all(value=text, timeout=10000)
+assert n == len(text)
+assert serial.read(read_len=32, timeout=10000)[1] == text[:32]
+assert serial.read(read_len=len(text) - 32, timeout=10000)[1] == text[32:]
+
+# use it as a file, writes larger than max_write are split
+f = serial.makefile('rw', timeout=100)
+text = u'apples with oranges.\n' * 5
+f.write(text)
+f.flush()
+for i in range(5):
+    assert f.readline() == u'apples with oranges.\n'
+f.close()
+assert serial.connected
+
+# framed reads keep the bytes after the frame for the next read
+serial.write(value='apples\r\noranges\r\nx', timeout=10000)
+t, line = serial.readline(delimiter='\r\n', timeout=100)
+assert line == b'apples\r\n'
+t, frame = serial.read_frame(delimiter='\r\n', timeout=100)
+assert frame == b'oranges'
+assert serial.read_frame(delimiter='\r\n', timeout=100) is None
+assert serial.clear_remainder() == b'x'
+
+serial.write(value='abcdefgh', timeout=10000)
+frames = [f for t, f in serial.iter_frames(size=4, timeout=100)]
+assert frames == [b'abcd', b'efgh']
+
+serial.write(value=struct.pack('<H', 5) + b'hello' + struct.pack('<H', 0),
+             timeout=10000)
+assert serial.read_frame(length_format='<H', timeout=100)[1] == b'hello'
+assert serial.read_frame(length_format='<H', timeout=100)[1] == b''
+
+# transactions write and read back to back, with a loopback the response is
+# the command itself
+time, val = serial.transact('apples.', 7, timeout=10000)
+assert val == b'apples.'
+cmd = serial.prepare(value='oranges.', timeout=10000)
+reply = serial.prepare_read(32, timeout=10000, stop_char='.')
+pending = [serial.transact(cmd, reply, wait=False) for i in range(4)]
+assert not pending[-1].done
+for p in pending:
+    assert p.result()[1] == b'oranges.'
+    assert p.done
+# read the port from the hub's I/O thread
+hub = SerialHub()
+port = hub.add_port(serial, timeout=100, stop_char='.')
+hub.start()
+serial.write(value='apples.oranges.', timeout=10000)
+assert port.queue.get(timeout=5)[1] == b'apples.'
+assert port.queue.get(timeout=5)[1] == b'oranges.'
+hub.stop()
+assert port.reads == 2
+assert port.error is None
+hub.remove_port(port)
+
 
 serial.close_channel_server()
 server.close_manager('serial')